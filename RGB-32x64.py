@@ -122,264 +122,154 @@
 # This is fixed in this version.
 
 # Display a runtext with double-buffering.
+import atexit
 import datetime
 import time
-import thread
 import threading
 import calendar
 import decimal
 import os.path
 import json
-import requests
-import htmlentitydefs
 import gc
 import sys
 import socket
 import struct
-import string
 import random
+import signal
 
-from HTMLParser import HTMLParser
-from xml.dom import minidom
 from socket import AF_INET, SOCK_DGRAM
 from samplebase import SampleBase
-from rgbmatrix import graphics
-from smbus import SMBus
-
-# sensor data variables
-lastPressure = 0
-barometer    = [0.0, 0.0, 0.0]
-
-# create an SMBUS (I2C) object, use bus 1, bus 0 is reserved
-Bme = SMBus(1)
-  
-lastDow       = 0
-
-# dirtyFlag is used to indicate when a new bottomList needs to be built
-dirtyFlag     = True
-
-# dirtyLock is used to prevent multiple threads from accessing various lists
-# at the same time. simple thread protectiom mechanism
-dirtyLock     = threading.Lock()
-
-topIndex      = 0
-bottomIndex   = 0
-
+from timing import FrameScheduler, Scroller, monotonic
+from fetcher import FetchEngine
+from providers import Registry
+from calendarindex import CalendarIndex
+from bme280 import BME280
+from sensorlog import SensorLog, tendencyText
+from colors import randomColor
+from playlist import Feeds
+from snapshot import Snapshot
+from options import readOptions, OptionsWatcher, changedSections, defaults
+from metrics import Metrics, addProcessMetrics, FRAME_BUCKETS
+from render import LineRenderer, StripCache
+from startup import Phases, syncTime
+
+# how long each step of the startup took, see startup.py. requests, the
+# parsers, the profiler and the content process are imported when they are
+# first needed, after the first frame is on the panel
+startup = Phases()
+
+# the rgbmatrix and smbus libraries are only available on the Raspberry Pi. off
+# the Pi the sign runs with --led-backend emulator and without the BME280
+try:
+  from rgbmatrix import graphics
+except ImportError:
+  import emugraphics as graphics
+
+try:
+  from smbus import SMBus
+except ImportError:
+  SMBus = None
+
+# sensor data variables. samples are kept in logs, see sensorlog.py, that
+# survive a reboot. the pressure trends come from the last 3 hours of samples
+sensorLog    = None
+weatherLog   = None
+sensorPublished = None
+
+# BME280 driver, see bme280.py. None when the sensor is not found
+bme = None
 jokesIndex    = 0
+headlinesIndex = 0
+
+# frame times, fetch times and process statistics, see metrics.py. served in
+# the Prometheus text format on metricsPort and written to metricsFile
+metrics = Metrics()
+addProcessMetrics(metrics)
+metrics.histogram('sign_frame_seconds', 'Time to draw one frame, before waiting for the deadline.', FRAME_BUCKETS)
+metrics.counter('sign_frames_total', 'Frames drawn.')
+metrics.counter('sign_frames_missed_total', 'Frames skipped because drawing was late.')
+startup.addMetrics(metrics)
+
+# each feature publishes its messages to the feeds, see playlist.py. the
+# bottom line scrolls through a snapshot of all of them that is replaced as a
+# whole, so the render loop never waits for a lock held by a fetch
+feeds = Feeds(('daily', 'quote', 'sensor', 'joke', 'weather', 'news'), lambda lists: composeBottomList(lists), metrics,
+              lambda lists: composeTopList(lists))
+
+# the messages of the feeds are saved every few minutes and when the sign
+# stops, and restored before anything is fetched, see snapshot.py
+snapshot = Snapshot('cache/snapshot.json')
+
+# options, read from options.ini, see options.py. when the file changes new
+# options are read and replace these as a whole, they are never changed
+options = defaults()
+optionsWatcher = None
+
+# seconds between environment messages, the BME280 is sampled more often, see
+# the bmeinterval option
+bmePublish = 300
+
+
+# fetches are run by the fetch engine, see fetcher.py. this is the number of
+# fetches that may run at the same time
+fetchWorkers = 2
+fetchEngine = None
+
+# the refresh of each feature is a provider, see providers.py. the registry
+# decides when each one runs
+providers = None
+
+# True with --render-process. the fetches then run in a content process of
+# their own, see contentprocess.py, and the render process only draws
+renderProcess = False
+
+# with --render-process and --profile the content process profiles the fetch
+# workers itself, for as long as the render loop is profiled. made before the
+# fork and started in the content process, see startContent
+contentProfiler = None
+
+# holidays and birthdays, compiled from the xml files once a year, see
+# calendarindex.py. xml files must be in same directory as executable
+calendarIndex = CalendarIndex(('holidays.xml', 'birthdays.xml'), 'cache/calendar.json')
+
+# all Internet requests share one keep-alive connection pool, see
+# httpclient.py, and feed pages are cached on disk, see httpcache.py. both are
+# made by loadContent. the connect and read timeouts are options, a server
+# that does not answer must not hold a fetch worker forever
+httpClient = None
+httpCache = None
 
-topList     = []
-bottomList  = []
-
-# using separate lists makes it easier to update sensor & weather messages
-# without having to re-build other lists
-sensorList  = []
-dailyList   = []
-weatherList = []
-quoteList   = []
-jokeList    = []
-newsList    = []
-
-##### options, these are read in from the options.ini file on startup #####
-militaryTime = False
-
-#..BME280 sensor enables
-temperature  = True
-humidity     = True
-pressure     = True
-
-weatherEnabled = False
-weatherKey     = ''
-weatherZip     = ''
-
-quoteEnabled = False
-quoteUrl     = ''
-
-jokesEnabled = False
-jokesUrls    = []
-jokesDelay   = 3600
-
-newsEnabled  = False
-newsUrls     = []
-
+#==============================================================================
+# copy the counters of the HTTP client and cache into the metrics
+def collectHttp(metrics):
+  if httpClient == None:
+    return
+  made, sent = httpClient.connections()
+  metrics.set('sign_http_connections_total', made)
+  metrics.set('sign_http_requests_sent_total', sent)
+  for name, source in [('default', httpClient.default)] + httpClient.sources.items():
+    metrics.set('sign_http_bytes_total', source.bytes, source = name)
+    metrics.set('sign_http_failures_total', source.failures, source = name)
+
+metrics.counter('sign_http_connections_total', 'Connections opened by the shared HTTP client.')
+metrics.counter('sign_http_requests_sent_total', 'Requests sent by the shared HTTP client; minus connections is reuse.')
+metrics.counter('sign_http_bytes_total', 'Response bytes received by source.')
+metrics.counter('sign_http_failures_total', 'Connection errors and timeouts by source.')
+metrics.addCollector(collectHttp)
 
 # bottom row of font. leave two below for decenders
 Row1 = 11
 Row2 = 28
 
-#===== BME280 Calibration Data Storage =====
-digT1 = 0     # temperature compensation data
-digT2 = 0
-digT3 = 0
-
-digP1 = 0    # humidity compensation data
-digP2 = 0
-digP3 = 0
-digP4 = 0
-digP5 = 0
-digP6 = 0
-digP7 = 0
-digP8 = 0
-digP9 = 0
-
-digH1 = 0    # pressure compensation data
-digH2 = 0
-digH3 = 0
-digH4 = 0
-digH5 = 0
-digH6 = 0
-
-#===== BME280 Register names, do not modify =====
-BME280_DIG_T1_LSB_REG =	0x88
-BME280_DIG_T1_MSB_REG =	0x89
-BME280_DIG_T2_LSB_REG =	0x8A
-BME280_DIG_T2_MSB_REG =	0x8B
-BME280_DIG_T3_LSB_REG =	0x8C
-BME280_DIG_T3_MSB_REG =	0x8D
-BME280_DIG_P1_LSB_REG =	0x8E
-BME280_DIG_P1_MSB_REG =	0x8F
-BME280_DIG_P2_LSB_REG =	0x90
-BME280_DIG_P2_MSB_REG =	0x91
-BME280_DIG_P3_LSB_REG =	0x92
-BME280_DIG_P3_MSB_REG =	0x93
-BME280_DIG_P4_LSB_REG =	0x94
-BME280_DIG_P4_MSB_REG =	0x95
-BME280_DIG_P5_LSB_REG =	0x96
-BME280_DIG_P5_MSB_REG =	0x97
-BME280_DIG_P6_LSB_REG =	0x98
-BME280_DIG_P6_MSB_REG =	0x99
-BME280_DIG_P7_LSB_REG =	0x9A
-BME280_DIG_P7_MSB_REG =	0x9B
-BME280_DIG_P8_LSB_REG =	0x9C
-BME280_DIG_P8_MSB_REG =	0x9D
-BME280_DIG_P9_LSB_REG =	0x9E
-BME280_DIG_P9_MSB_REG =	0x9F
-BME280_DIG_H1_REG           =	0xA1
-BME280_CHIP_ID_REG          =	0xD0 # Chip ID
-BME280_RST_REG              =	0xE0 # Softreset Reg
-BME280_DIG_H2_LSB_REG       =	0xE1
-BME280_DIG_H2_MSB_REG       =	0xE2
-BME280_DIG_H3_REG           =	0xE3
-BME280_DIG_H4_MSB_REG       =	0xE4
-BME280_DIG_H4_LSB_REG       =	0xE5
-BME280_DIG_H5_MSB_REG       =	0xE6
-BME280_DIG_H6_REG           =	0xE7
-BME280_CTRL_HUMIDITY_REG    =	0xF2 # Ctrl Humidity Reg
-BME280_STAT_REG             =	0xF3 # Status Reg
-BME280_CTRL_MEAS_REG        =	0xF4 # Ctrl Measure Reg
-BME280_CONFIG_REG           =	0xF5 # Configuration Reg
-BME280_PRESSURE_MSB_REG     =	0xF7 # Pressure MSB
-BME280_PRESSURE_LSB_REG     =	0xF8 # Pressure LSB
-BME280_PRESSURE_XLSB_REG    = 0xF9 # Pressure XLSB
-BME280_TEMPERATURE_MSB_REG  = 0xFA # Temperature MSB
-BME280_TEMPERATURE_LSB_REG  = 0xFB # Temperature LSB
-BME280_TEMPERATURE_XLSB_REG =	0xFC # Temperature XLSB
-BME280_HUMIDITY_MSB_REG     =	0xFD # Humidity MSB
-BME280_HUMIDITY_LSB_REG     =	0xFE # Humidity LSB
+# change the 7x13.bdf filename to use a different font.
+fontFile = "fonts/7x13.bdf"
 
 BMEADRS =	0x76        # I2C address of the BME280
-BME280_CHIP_ID = 0x60 # chip ID of the BME280
-
-UNSIGNED = 0
-SIGNED = 1
-
-
-#==============================================================================
-# return True if the string afer '=' starts with 't' or 'T' otherwise return
-# false
-def truefalse(str):
-  s = 't'         # default to true
-  if len(str) > 0:
-    s = str[0].lower()
-    
-  return 't' == s
-    
-#==============================================================================
-# Read the options file into memory. Options 
-# read options.ini into global vars
-def readOptions(filename):
-  global military
-
-  global temperature
-  global humidity
-  global pressure
-
-  global weatherEnabled
-  global weatherKey
-  global weatherZip
-  
-  global quoteEnabled
-  global quoteUrl
-  
-  global jokesEnabled
-  global jokesUrls
-  global jokesDelay
-
-  global newsEnabled
-  global newsUrls
-    
-  if os.path.isfile(filename):
-    try:
-      with open(filename, 'r') as f:
-        print "Reading options file"
-        for line in f:
-          if len(line) > 2:
-            # split on the first '=' only
-            s = line[:len(line) - 1].split('=', 1)
-            value = s[1][:len(s[1])]
-            
-            if s[0] == 'military':
-              military = truefalse(value)
-            elif s[0] == 'temperature':
-              temperature = truefalse(value)
-            elif s[0] == 'humidity':
-              humidity = truefalse(value)
-            elif s[0] == 'pressure':
-              pressure = truefalse(value)
-            elif s[0] == 'weather':
-              weatherEnabled = truefalse(value)
-            elif s[0] == 'weatherkey':
-              weatherKey = value
-            elif s[0] == 'weatherzip':
-              weatherZip = value
-            elif s[0] == 'quote':
-              quoteEnabled = truefalse(value)
-            elif s[0] == 'quoteurl':
-              # we may have a list of urls to get jokes from
-              quoteUrl = value
-            elif s[0] == 'jokes':
-              jokesEnabled = truefalse(value)
-            elif s[0] == 'jokesurl':
-              # there are multiple joke URLs. each for a differnt type of joke
-              jokesUrls.append(value)
-            elif s[0] == 'jokedelay':
-              jokesDelay = int(value)
-            elif s[0] == 'news':
-              newsEnabled = truefalse(value)
-            elif s[0] == 'newsurl':
-              # there may be multiple news feeds used
-              # there maybe multiple '=' in the url
-              newsUrls.append(value)
-    except IOError:
-      print "Failure reading options file"
-    except IndexError:
-      print "Error in options.ini: " + line
-  else:
-    print "Unable to find options.ini file"
-                        
-#==============================================================================
-# Create a random color
-def randomColor():
-  min = 64      # higher numbers yield brighter colors, max is 255
-  max = 255     # low numbers yield dimmer colors.
-  
-  r = random.randint(min, max)
-  g = random.randint(min, max)
-  b = random.randint(min, max)
-  return graphics.Color(r, g, b)
 
 #==============================================================================
-# get the current Internet time from an NTP server
-def getNTPTime(host = "pool.ntp.org"):
+# get the current Internet time from an NTP server. raises socket.timeout when
+# there is no answer within timeout seconds
+def getNTPTime(host = "pool.ntp.org", timeout = 5.0):
   port = 123
   buf = 1024
   address = (host, port)
@@ -390,8 +280,12 @@ def getNTPTime(host = "pool.ntp.org"):
   
   # connect to server
   client = socket.socket(AF_INET, SOCK_DGRAM)
-  client.sendto(msg, address)
-  msg, address = client.recvfrom(buf)
+  client.settimeout(timeout)
+  try:
+    client.sendto(msg, address)
+    msg, address = client.recvfrom(buf)
+  finally:
+    client.close()
   
   t = struct.unpack("!12I", msg)[10]
   t -= TIME1970
@@ -399,34 +293,55 @@ def getNTPTime(host = "pool.ntp.org"):
   
 #==============================================================================
 # create a date message
-# this is run while the dirtyLock has been acquired, so safe to change dailyList
-# xml files must be in same directory as executable
 
 def dateMessage():
-  global lastDow
-     
   dow = datetime.datetime.today()
   dayname = calendar.day_name[dow.weekday()]
-  text = dayname + ", " + datetime.datetime.now().strftime("%b %d %Y")
-
-  # check for change of dow, signals new day
-  if lastDow != dow.weekday():
-    print 'New Day' + str(dow.weekday()) + ', ' + str(lastDow)
-    del dailyList[:]
-    loadFromXml("holidays.xml",  str(datetime.datetime.now().month), str(datetime.datetime.now().day), dayname)
-    loadFromXml("birthdays.xml", str(datetime.datetime.now().month), str(datetime.datetime.now().day), dayname)
-  
-  lastDow = dow.weekday()
-  return text
+  return dayname + ", " + datetime.datetime.now().strftime("%b %d %Y")
+
+#==============================================================================
+# replace the daily messages with the holidays and birthdays of today. the messages
+# come from a yearly index of the xml files, so this is a dictionary lookup.
+# runs as a provider, again just after each midnight
+def updateDailyList():
+  list = [[randomColor(), txt] for txt in calendarIndex.lookup()]
+  print 'New Day: {} daily messages'.format(len(list))
+  feeds.publish('daily', list)
+
+#==============================================================================
+# seconds until just after midnight, the interval of the daily messages
+def untilMidnight():
+  now = datetime.datetime.now()
+  midnight = datetime.datetime.combine(now.date() + datetime.timedelta(1), datetime.time(0, 0, 1))
+  return (midnight - now).total_seconds()
+
+#==============================================================================
+# the oldest messages of each feed that are still worth showing after a
+# restart, in seconds. holidays and birthdays are only good for the day
+def snapshotAges():
+  now = datetime.datetime.now()
+  today = (now - datetime.datetime.combine(now.date(), datetime.time(0, 0))).total_seconds()
+  return {'daily': today, 'quote': 86400, 'sensor': 3600, 'joke': 7 * 86400, 'weather': 3 * 3600, 'news': 86400}
+
+def saveSnapshot():
+  snapshot.save(feeds)
+
+# called by the content process every half second, and when it stops
+def tickContent():
+  global contentProfiler
+  if contentProfiler != None and contentProfiler.frame():
+    contentProfiler = None
+
+def stopContent():
+  if contentProfiler != None:
+    contentProfiler.stop()
+  saveSnapshot()
 
 #==============================================================================
 # create time msg
-# this is run while the dirtyLock has been acquired
 
 def timeMessage():
-  global military
-  
-  if military == False:
+  if options.military == False:
     h = datetime.datetime.now().hour
     if h > 12:
       h -= 12
@@ -440,935 +355,342 @@ def timeMessage():
 
   return text
              
-#==============================================================================
-# Class to strip HTML tags from strings.
-
-class HTMLTextExtractor(HTMLParser):
-  def __init__(self):
-    HTMLParser.__init__(self)
-    self.result = [ ]
-
-  def handle_data(self, d):
-    self.result.append(d)
-
-  def handle_charref(self, number):
-    codepoint = int(number[1:], 16) if number[0] in (u'x', u'X') else int(number)
-    self.result.append(unichr(codepoint))
-
-  def handle_entityref(self, name):
-    codepoint = htmlentitydefs.name2codepoint[name]
-    self.result.append(unichr(codepoint))
-
-  def get_text(self):
-     return u''.join(self.result)
-
-#==============================================================================
-# Remove HTML tags from a string.
-def html_to_text(html):
-  s = HTMLTextExtractor()
-  s.feed(html)
-  return s.get_text()
-    
 #==============================================================================
 # Get a joke from the Internet. Parse out the joke and author. There may be
 # multiple joke URLs. Use a different URL each time this is invoked.
 def getAJoke():
-  global jokeList
-  global jokeUrls
-  global dirtyFlag
   global jokesIndex
-  global jokesDelay
-  
-  list   = []  
-  while True:
-    # try to get a new joke
-    try:
-      r = requests.get(jokesUrls[jokesIndex])
-    except:
-      print 'Jokes, invalid URL: {}'.format(jokesUrls[jokesIndex])
-    finally:
-      if 200 == r.status_code:
-        # parse the joke from the HTML pages. the parsed text is combined into
-        # one long string and then broken down into displayable pieces.
-  
-        flag   = 0
-        joke   = ''
-        author = ''
-  
-        color = randomColor()             
-        # split the HTML into lines
-        lines = r.text.splitlines()
-       
-        for line in lines:
-          if 0 == flag:
-            if '<P>' == line:
-              flag = 1
-
-          elif 1 == flag:
-            if '<CENTER>' == line:
-              flag = 2
-
- # this caused an issue when non-joke text was processed. contained non-ascii 
- # characters             
-            else:
-              # strip HTML. convert to ASCII and remove all leading and trailing
-              # whitespace
-              line1 = html_to_text(line).strip().encode('ascii')
-              if len(line1) > 0:
-                # remove spaces and dashes
-                line1 = line1.strip('- ')
-                joke += ' ' + line1
-                if joke.endswith('?') or joke.endswith('.'):
-                  list.append([color, joke])
-                  joke = ''
-        # for
-        
-        # we found a joke.
-        if len(joke) > 0:
-          list.append([color, joke])
-
-        if len(list) > 0:
-          dirtyLock.acquire()
-          del jokeList[:]
-          dirtyFlag = True
-          jokeList += list
-          dirtyLock.release()
-          del list[:]
-        else:
-          print 'No joke from: ' + jokesUrls[jokesIndex]
-          
-        # we may have several joke URLs. step through them one at a time.
-        jokesIndex += 1
-        if jokesIndex == len(jokesUrls):
-          jokesIndex = 0
   
-      else:
-        print 'Get a Joke Failed to connect'
+  # new options may have fewer URLs
+  urls = options.jokesUrls
+  if len(urls) == 0:
+    return False
+  jokesIndex %= len(urls)
+  url = urls[jokesIndex]
+  # try to get a new joke
+  try:
+    status, list = httpCache.fetch(url, parseJoke, source='jokes')
+  except requests.exceptions.RequestException:
+    print 'Jokes, invalid URL: {}'.format(url)
+    return False
 
+  if list != None:
+    if len(list) > 0:
+      feeds.publish('joke', list)
+    else:
+      print 'No joke from: ' + url
+      
+    # we may have several joke URLs. step through them one at a time.
+    jokesIndex += 1
+    if jokesIndex == len(urls):
+      jokesIndex = 0
+
+  else:
+    print 'Get a Joke Failed to connect'
+    return False
       
-    # sleep for some number of seconds
-    time.sleep(jokesDelay)
-  # while    
-        
 #==============================================================================
-# Get the Quote-of-the-day. Parse out the quote and author. Add it to the 
-# quoteList.
+# Get the Quote-of-the-day. Parse out the quote and author. Publish it to the
+# quote feed.
 def getQuoteOfTheDay():
-  global quoteList
-  global dirtyFlag
-  
-  quote = []
   ql = []
-  delay = 3600        # update once an hour
-  while True:
-    try:
-      print 'QOD Thread'
-      r = requests.get(quoteUrl, auth=('user', 'pass'))
-      if 200 == r.status_code:
-#        print '===== QOD ====='
-#        print r.text
-#        print '====='
-        # split into individual lines
-        list = r.text.splitlines()
-              
-        for l in list:
-#          print l
-          # only interested in lines that start with 'br.writeln'
-          if l.startswith('br.writeln'):
-            # strip off the first 12 characters
-            s = l[12:]
-            # nothing of interest starts with '<b'
-            if not s.startswith('<b'):
-              # parse the quote. quote ends with '<br>'
-              if s.endswith('<br>");'):
-                quote.append(s[:s.find('<br>')])
-              
-              # parse the author.
-              pos = s.find('</a>')
-              if pos > 0:
-                quote.append(s[s.find('>') + 1:pos])
+  ok = True
+  try:
+    print 'QOD Thread'
+    status, ql = httpCache.fetch(options.quoteUrl, parseQuote, auth=('user', 'pass'), source='quote')
+    if ql == None:
+      print 'Quote of the Day returned an error: ' + str(status)
+      ql = []
   
-        if len(quote) > 0:
-          color = randomColor()
-          if len(quote[0]) > 0:
-            ql.append([color, cleanupUnicode(quote[0])])
+  except:
+    print "Quote of the day failed to connect"
+    ok = False
     
-            # add the author
-            if len(quote[1]) > 0:
-              ql.append([color, cleanupUnicode(quote[1])])
-          else:
-            # no quote given
-            print 'No quote found'
-        else:
-          # no quote given
-          print 'No quote found'
-            
-      else:
-        print 'Quote of the Day returned an error: ' + str(r.status_code)
-  
-    except:
-      print "Quote of the day failed to connect"
+    # use default quote
+    color = randomColor()
+    ql = []
+    ql.append([color, 'Progress is impossible without change, and those who cannot change their minds cannot change anything'])
+    ql.append([color, 'George Bernard Shaw'])
+  # try/except
       
-      # use default quote
-      color = randomColor()
-      ql.append([color, 'Progress is impossible without change, and those who cannot change their minds cannot change anything'])
-      ql.append([color, 'George Bernard Shaw'])
-    # try/except
-        
-    dirtyLock.acquire()
-    del quoteList[:]
-    dirtyFlag = True
-    print 'Quote of the Day'
-    quoteList += ql
-    dirtyLock.release()
-    del ql[:]
-    del quote[:]
-    
-    # sleep for some number of seconds
-    time.sleep(delay)
-  # while
+  print 'Quote of the Day'
+  feeds.publish('quote', ql)
+  return ok
 
 #==============================================================================
-# parse a line of weather information into a list of weather values.
-def parseWeather(line, id):
-  global barometer
-  
-  weather = ''
-  temperature = 0.0
-  pressure = 0.0
-  humidity = 0.0
-  windspeed = 0.0
-  winddir = 0
-  windgust = 0.0
-  snow = ''
-  rain = ''
-  icon = ''
-  
-  wd = []
-  wl = line.split(',')
-  for l in wl:
-#    print(l)
-    pos = l.find('description":"')
-    if pos > 0 and len(weather) == 0:
-      weather = l[l.find(':') + 2:len(l) - 1]
-
-    pos = l.find('temp":')
-    if pos > 0:
-      temperature = float(l[pos + 6:])
-      
-    pos = l.find('pressure":')
-    if pos > 0:
-      pressure = float(l[l.find(':') + 1:])
-          
-    pos = l.find('humidity":')
-    if pos > 0:
-      humidity = float(l[l.find(':') + 1:])
-          
-    pos = l.find('speed":')
-    if pos > 0:
-      windspeed = float(l[l.rfind(':') + 1:])
-      
-    pos = l.find('deg":')
-    if pos > 0:
-      l = l.strip('}')
-      winddir = float(l[l.find(':') + 1:]) % 360.0
-      
-    pos = l.find('gust":')
-    if pos > 0:
-      windgust = float(l[l.find(':') + 1:len(l) - 1])
-  
-    pos = l.find('rain":{')
-    if pos > 0:
-     rain = l[l.find(':') + 2:len(l) - 1]
-      
-    pos = l.find('snow":{')
-    if pos > 0:
-      snow = l[l.find(':') + 2:len(l) - 1]
-      
-    pos = l.find('icon":"')
-    if pos > 0:
-     icon = l[l.find(':') + 2: len(l) - 3]
-      
-  # convert wind direction in degrees to text direction
-  if winddir < 22.5:
-      wdt = "North"
-  elif winddir < 67.5:
-      wdt = "Northeast"
-  elif winddir < 112.5:
-      wdt = "East"
-  elif winddir < 157.5:
-      wdt = "Southeast"
-  elif winddir < 202.5:
-      wdt = "South"
-  elif winddir < 247.5:
-      wdt = "Southwest"
-  elif winddir < 292.5:
-      wdt = "West"
-  elif winddir < 337.5:
-      wdt = "Northwest"
-  else:
-      wdt = "North"
-  
-  # ===== get outside temperature =====
-  # typical temperature: {'temp_max': 295.15, 'temp_kf': None, 'temp': 292.89, 'temp_min': 290.15}
-  # temperature is in Kelvin,
-  # Kelvin to Celsius, subtract 273.15
-  # Celsius to Fahrenheit, Tf = Tc * 9/5 + 32
-  ftc = temperature - 273.15
-  tf = int((ftc * 9.0 / 5.0) + 32.5)
-
-  # ===== combine status, temperature and humidity into a weather message =====
-  # "123456789-123456789-123456789-123456789-12345"
-  # "Weather: scattered clouds, 32.1F with 40% RH"
-  # "Forecast: scattered clouds, 32.1F with 40% RH"
-  # "Tomorrow: scattered clouds, 32.1F with 40% RH"
-  if id == 0:
-    msg = 'Weather: {}, {:.1f}F with {}% RH'.format(weather, tf, humidity)
-  elif id == 1:
-    msg = 'Forecast: {}, {:.1f}F with {}% RH'.format(weather, tf, humidity)
-  else:
-    msg = 'Tomorrow: {}, {:.1f}F with {}% RH'.format(weather, tf, humidity)
-
-  # ===== convert barometeric pressure into a weather message =====
-  # "123456789-123456789-123456789-123456789-12345"
-  # "Barometer: 996.3 millibars and rising"
-  # "Barometer: 996.3 millibars and falling"
-  msg += ', Barometer: {:.1f} millibars'.format(pressure)
-  if barometer[id] > pressure:
-    msg += " and falling"
-  elif barometer[id] < pressure:
-    msg += " and rising"
-
-  barometer[id] = pressure
-
-  # ===== combine wind direction and wind speed into a weather message =====
-  # "123456789-123456789-123456789-123456789-12345"
-  # "Wind from the Northeast at 25mph"
-  msg += ', Wind from the {} at {:.1f}mph'.format(wdt, windspeed)
-  
-  if windgust > 0:
-    msg += ', Gusting to {}mph'.format(windgust)
-    
-  # ===== convert rain/snow acculation into a weather message =====
-  # "123456789-123456789-123456789-123456789-12345"
-  # "Rain amount for last 3 Hours: 12.5 inches"
-
-  if len(rain) > 0:
-    amt = float(rain[rain.find('":') + 2:])
-    msg += ', Rain accumulation for last 3 Hours: {:.1f} inches'.format(amt)
+# pressure change in millibars per 3 hours. for the current weather (id 0) the
+# reading is added to the weatherLog and the change comes from the readings
+# of the last 3 hours. for a forecast it is the change from the current
+# pressure to the forecast. None when it is not known yet
+def pressureChange(pressure, when, id):
+  if weatherLog == None or when == None:
+    return None
 
-  if len(snow) > 0:
-    amt = float(snow[snow.find('":') + 2:])
-    msg += ', Snow accumulation for last 3 Hours: {:.1f} inches'.format(amt)
+  if id == 0:
+    newest = weatherLog.newest()
+    # the same observation may be returned more than once
+    if newest == None or when > newest:
+      weatherLog.add((pressure,), when)
+    return weatherLog.tendency('pressure')
+
+  current = weatherLog.latest('pressure')
+  ahead = when - time.time()
+  if current == None or ahead < 3600:
+    return None
+  return (pressure - current) * 3 * 3600 / ahead
 
-  wd.append([randomColor(), msg])
-  return wd    
-    
 #==============================================================================
 # I am getting reports for three Macedons !!! Keep only the first
-# Get the current weather from OpenWeatherMap.org
+# Get the current weather from OpenWeatherMap.org. The forecast is fetched at
+# the same time by another fetch worker.
 def getWeather():
-  global weather
-  global weatherKey
-  global weatherZip
-  global weatherList
-  global barometer
-  global dirtyFlag
-    
-  delay = 900       # update every 15 minutes
-  
-  print 'Get Weather'
+  print 'Updating weather information'
+
+  # get the forecast while we get the current weather. with only one fetch
+  # worker the forecast is fetched after the current weather
+  forecast = None
+  if fetchEngine != None and fetchEngine.maxConcurrent > 1:
+    forecast = fetchEngine.submit(getForecast)
   
-  while True:
-    print 'Updating weather information'
-    
-    try:
-      url = 'http://api.openweathermap.org/data/2.5/weather?zip={}&APPID={}'.format(weatherZip, weatherKey)
-      r = requests.get(url)
-    except:
-      # this occurs when we cannot connect to the OpenWeatherMap service    
-      print 'Unable to connect to OpenWeatherMap.org, Key or Zipcode may be invalid'
-
-    # parse the weather data
-    if 200 == r.status_code:
-      print 'Parsing Weather info'
-      
-      wl = r.text.split(',')
+  try:
+    url = '{}/weather?zip={}&APPID={}'.format(options.weatherUrl, options.weatherZip, options.weatherKey)
+    # decode and parse the weather information
+    status, list = httpCache.fetch(url, lambda page: parseWeather(json.loads(page), 0, pressureChange), source='weather')
+  except (requests.exceptions.RequestException, ValueError):
+    # this occurs when we cannot connect to the OpenWeatherMap service    
+    print 'Unable to connect to OpenWeatherMap.org, Key or Zipcode may be invalid'
+    return False
+
+  if forecast != None:
+    # same as the longest the forecast fetch can take with its retries
+    if not forecast.done.wait(120):
+      print 'Forecast did not arrive in time'
+    forecast = forecast.result
+  else:
+    forecast = getForecast()
+
+  # parse the weather data
+  if list != None:
+    # add forecasts to the list
+    list = list + (forecast or [])
+    feeds.publish('weather', list)
+  else:
+    print 'Bad error code: {}'.format(status)
+    return False
         
-      # parse the weather information
-      list = parseWeather(r.text, 0)
-      
-      # add forecasts to the list
-      list += getForecast()
-
-      dirtyLock.acquire()
-      del weatherList[:]
-      dirtyFlag = True
-      weatherList += list
-      dirtyLock.release()
-      del list[:]
-      
-    else:
-      print 'Bad error code: {}'.format(r.status_code)
-                
-    # sleep for some number of seconds
-    time.sleep(delay)
-  # while
-          
 #==============================================================================
 # Get weather forecast for the next 5 days from OpenWeatherMap.org. We only use
-# the next day forecast. There are forecasts for every 3 hours for each day.
-# Find the forcast that is 24 hours from current time, parse and add it to the
-# bottom list.
+# the 3 hour and the next day forecasts.
 def getForecast():
-  global weatherKey
-  global weatherZip
-    
-  list = []
-  delay = 900       # update every 15 minutes
-  
   print "Updating forecast information"
   
   try:
-    url = 'http://api.openweathermap.org/data/2.5/forecast?zip={}&APPID={}'.format(weatherZip, weatherKey)
-    r = requests.get(url)
-  except:
+    url = '{}/forecast?zip={}&APPID={}'.format(options.weatherUrl, options.weatherZip, options.weatherKey)
+    status, wd = httpCache.fetch(url, lambda page: parseForecast(page, pressureChange), source='weather')
+  except (requests.exceptions.RequestException, ValueError):
     # this occurs when we cannot connect to the OpenWeatherMap service    
     print "Unable to connect to OpenWeatherMap.org, Key or Zipcode may be invalid"
+    return None
 
   # parse the forcast data
-  if 200 == r.status_code:
-    # parse the forecast information
-    wlist = r.text.split('{"dt":')
-    # first entry is garbage, get rid of it
-    del wlist[0]
-   
-    # wlist has forty entries. each starts with a unix timestamp.
-    # entry 0 is our 3 hour forecast
-    wd = parseWeather(wlist[0], 1)
-    # entry 7 is our 24 hour forecast
-    wd += parseWeather(wlist[7], 2)
-
+  if wd != None:
     return wd
   else:
-    print 'Forecast error code: {}'.format(r.status_code)
+    print 'Forecast error code: {}'.format(status)
                   
-#==============================================================================
-# find and cleanup any Unicode
-def cleanupUnicode(str):
-  str = string.replace(str, '\u0026', '&')
-  str = string.replace(str, '&#x27;', '\'')
-  str = string.replace(str, '&#x39;', '9')
-  str = string.replace(str, '&#39;', '`')
-  return str    
-
 #==============================================================================
 # Get a headlines from the Internet. Parse out each headline. There may be
 # multiple headline URLs. Use a different URL each time this is invoked. Parsing
 # is unique to each url.
 def getHeadlines():
-  global newsUrls
-  global newsList
-  global dirtyFlag
-
-  headlines = []
-  delay = 1800        # 30 minutes
-  headlinesIndex = 0
+  global headlinesIndex
+
+  # new options may have fewer URLs
+  urls = options.newsUrls
+  if len(urls) == 0:
+    return False
+  url = urls[headlinesIndex % len(urls)]
+  headlinesIndex += 1
+  if headlinesIndex >= len(urls):
+    headlinesIndex = 0
+
+  # parsing is unique to each url, see parsers.py
+  parse = headlineParser(url)
+  if parse == None:
+    # unknow URL
+    print 'Unknown URL: {},  unable to parse'.format(url)
+    return False
   
-  while True:
-    url = newsUrls[headlinesIndex]
-    headlinesIndex += 1
-    if headlinesIndex >= len(newsUrls):
-      headlinesIndex = 0
-  
-    # try to get some headlines
-    try:
-      print 'Parsing from: {}'.format(url)
-      r = requests.get(url)
-    except:
-      print 'Failed to connect to URL: {}'.format(url)
-      
-    finally:
-      if 200 == r.status_code:
-        # a valid page was returned, parse out the headlines
-        if url.find('news.google.com') > 0:
-          # parse google headlines
-          headlines = parseGoogleYahoo(r.text, 'true","')
-        elif url.find('www.yahoo.com') > 0:
-          # parse yahoo headlines
-          headlines = parseGoogleYahoo(r.text, 'alt="')
-        elif url.find('hosted2.ap.org') > 0:
-          # parse AP headlines
-          headlines = parseAP(r.text)
-        else:
-          # unknow URL
-          print 'Unknown URL: {},  unable to parse'.format(url)
-          
-        if len(headlines) > 0:
-          # protect globals
-          dirtyLock.acquire()
-          del newsList[:]
-          dirtyFlag = True
-          newsList += headlines
-          dirtyLock.release()
-          del headlines[:]
-      else:
-        # bad URL
-        print 'Error code: {}'.format(r.status_code)
-
-    # sleep for some number of seconds
-    time.sleep(delay)
-  # while
+  # try to get some headlines
+  try:
+    print 'Parsing from: {}'.format(url)
+    status, headlines = httpCache.fetch(url, parse, source='news')
+  except requests.exceptions.RequestException:
+    print 'Failed to connect to URL: {}'.format(url)
+    return False
+    
+  if headlines != None:
+    # a valid page was returned
+    if len(headlines) > 0:
+      feeds.publish('news', headlines)
+  else:
+    # bad URL
+    print 'Error code: {}'.format(status)
+    return False
   
 #==============================================================================
-def parseGoogleYahoo(page, key):
-  list = []
-  print 'Parsing Headlines from Google or Yahoo'
-  pos = page.find(key)
-  while pos >= 0:
-    # found a headline
-    pos += len(key)
-    pos1 = page.find('"', pos)
-    if pos1 > pos:
-      # headline is from pos to pos1
-      try:
-        s = page[pos:pos1]
-        list.append([randomColor(), cleanupUnicode(s)])
-      except:
-        print 'Invalid ascii encoding'
-      
-    pos = page.find(key, pos1)
-  # while
+# Check for the BME280 and initialize it. returns True when the sensor is
+# present. the sensor sleeps between the measurements of getBME280
+def initBME280():
+  global bme
 
-  # add the headlines to the headlines list
-  print '===== Headlines ====='
-  print 'Found {} headlines'.format(len(list))
+  if SMBus == None:
+    print 'BME280 not available, smbus is not installed'
+    return False
 
-  for hl in list:
-    print hl[1]
-    
-  return list        
+  # verify BMW280 is present by reading chip ID
+  try:
+    # use bus 1, bus 0 is reserved
+    sensor = BME280(SMBus(1), BMEADRS, options.bmeOversampling, options.bmeOversampling, options.bmeOversampling, options.bmeFilter)
+    if not sensor.probe():
+      print 'BME280 not found, check wiring'
+      return False
+
+    # read the compensation data
+    sensor.begin()
+  except (IOError, OSError):
+    print 'BME280 not found, check wiring'
+    return False
+  except ValueError as e:
+    print e
+    return False
+
+  bme = sensor
+  return True
 
-    
 #==============================================================================
-def parseAP(page):
-  list = []
-  key = 'rel="bookmark">'  
-  print 'Parsing Headlines from AP'
-  
-  pos = page.find(key)
-  while pos >= 0:
-    # found a headline
-    pos1 = page.find('</a>', pos)
-    if pos1 > pos:
-      # headline is from pos to pos1
-      list.append([randomColor(), page[pos + len(key):pos1].encode('ascii')])
-      
-    pos = page.find(key, pos1)
-  # while
-        
-  # add the headlines to the headlines list
-  print '===== Headlines ====='
-  print 'Found {} headlines'.format(len(list))
+# open the sample logs. they are memory-mapped files in the cache directory
+def initLogs():
+  global weatherLog
 
-  for hl in list:
-    print hl[1]
+  # the weather is updated about every fifteen minutes
+  weatherLog = SensorLog(('pressure',), 256, filename = 'cache/weather.log')
 
-  return list        
-  
-#==============================================================================
-# convert hex-ascii pairs to integers. the order of the bytes is reversed,
-# lsb first, msb second.
-def convert(lsb, msb, signed):
-  msb <<= 8
-  x = msb | (lsb & 0x000000FF)
-  if signed == SIGNED and x >= 32767:
-    x -= 65536
-  return x
-        
-#==============================================================================
-# Read the configuration data from the BME280. Configuration data is used to
-# convert the raw sensor data to compensated values. This is done once.
-# The data is read as a collection of bytes. Bytes are combined into signed or
-# unsigned values and stored in Lists.
-def getBME280Config():
-  global digT1
-  global digT2
-  global digT3
-  global digP1
-  global digP2
-  global digP3
-  global digP4
-  global digP5
-  global digP6
-  global digP7
-  global digP8
-  global digP9
-  global digH1
-  global digH2
-  global digH3
-  global digH4
-  global digH5
-  global digH6
-  global Bme
-
-  raw = bytearray()  
-  raw = Bme.read_i2c_block_data(BMEADRS, BME280_DIG_T1_LSB_REG, 6)
-  
-  digT1 = convert(raw[0], raw[1], UNSIGNED)
-  digT2 = convert(raw[2], raw[3], SIGNED)
-  digT3 = convert(raw[4], raw[5], SIGNED)
- 
-#  print 'Temp:' 
-#  print raw
-#  print str(raw[0]) + ', ' + str(raw[1]) + ' -> ' + str(digT1)
-#  print str(raw[2]) + ', ' + str(raw[3]) + ' -> ' + str(digT2)
-#  print str(raw[4]) + ', ' + str(raw[5]) + ' -> ' + str(digT3)
-  
-  raw = Bme.read_i2c_block_data(BMEADRS, BME280_DIG_P1_LSB_REG, 18)
-  digP1 = convert(raw[0], raw[1], UNSIGNED)
-  digP2 = convert(raw[2], raw[3], SIGNED)
-  digP3 = convert(raw[4], raw[5], SIGNED)
-  digP4 = convert(raw[6], raw[7], SIGNED)
-  digP5 = convert(raw[8], raw[9], SIGNED)
-  digP6 = convert(raw[10], raw[11], SIGNED)
-  digP7 = convert(raw[12], raw[13], SIGNED)
-  digP8 = convert(raw[14], raw[15], SIGNED)
-  digP9 = convert(raw[16], raw[17], SIGNED)
-
-#  print 'Pressure:'
-#  print raw
-#  print str(raw[0]) + ', ' + str(raw[1]) + ' -> ' + str(digP1)
-  
-#  print 'Humidity:'
-  digH1 = Bme.read_byte_data(BMEADRS, BME280_DIG_H1_REG) & 0x000000FF
+# open the sensor log, one sample every bmeInterval seconds for a bit more
+# than 3 hours. when the interval changed, now or since the last run, the log
+# file is made again with the new size and keeps its samples, see sensorlog.py
+def openSensorLog():
+  global sensorLog
 
-#  print str(raw[0]) + ' -> ' + str(digH1)
-  
-  raw = Bme.read_i2c_block_data(BMEADRS, BME280_DIG_H2_LSB_REG, 7)
-  digH2 = convert(raw[0], raw[1], SIGNED)
-  digH3 = raw[2] & 0x000000FF
-  
-  digH4 = raw[3] << 4
-  digH4 = digH4 | (raw[4] & 0x0F)
-  
-  digH5 = raw[5] << 4
-  digH5 = digH5 | raw[4] >> 4
-  
-  digH6 = raw[6]
+  capacity = max(64, int(4 * 3600 / options.bmeInterval))
+  if sensorLog != None and sensorLog.capacity == capacity:
+    return
 
-#  print raw
-#  print str(raw[0]) + ', ' + str(raw[1]) + ' -> ' + str(digH2)
-#  print str(raw[2]) + ' -> ' + str(digH3)
-#  print str(raw[3]) + ', ' + str(raw[4]) + ' -> ' + str(digH4)
-#  print str(raw[4]) + ', ' + str(raw[5]) + ' -> ' + str(digH5)
-#  print str(raw[6]) + ' -> ' + str(digH6)
+  if sensorLog != None:
+    # the new log maps the same file with another size
+    sensorLog.close()
+  sensorLog = SensorLog(('temperature', 'humidity', 'pressure'), capacity, filename = 'cache/sensor.log')
 
 #==============================================================================
+# take one measurement from the BME280 and add it to the sensorLog. every
+# bmePublish seconds publish it to the sensor feed
 def getBME280():
-  global sensorList
-  global lastPressure
-  global humidity
-  global temperature
-  global pressure
-  global digT1
-  global digT2
-  global digT3
-  global digP1
-  global digP2
-  global digP3
-  global digP4
-  global digP5
-  global digP6
-  global digP7
-  global digP8
-  global digP9
-  global digH1
-  global digH2
-  global digH3
-  global digH4
-  global digH5
-  global digH6
-  global Bme
-  
-#  global Temperature
-#  global Humidity
-  global lastPressure
-  
-
-  # verify BMW280 is present by reading chip ID
-  try:
-    reply = Bme.read_byte_data(BMEADRS, BME280_CHIP_ID_REG)
-#    print 'BME280: 0x' + hex(reply)
-  except:
-    print 'BME280 not found, check wiring'
-    return
-      
-  # initialize BME280
-  Bme.write_byte_data(BMEADRS, BME280_CTRL_MEAS_REG, 0x00)
-  Bme.write_byte_data(BMEADRS, BME280_CONFIG_REG, 0xA0)
-  Bme.write_byte_data(BMEADRS, BME280_CTRL_HUMIDITY_REG, 0x01)
-  Bme.write_byte_data(BMEADRS, BME280_CTRL_MEAS_REG, 0x27)
+  global sensorPublished
   
-  # read the compensation data, combine bytes and store it
-  getBME280Config()
-    
   list = []
-  raw = bytearray()  
   
-  # ten minutes between readings
-  delay = 600
-  while True:
-    # read raw data from the sensor array
-    raw = Bme.read_i2c_block_data(BMEADRS, BME280_PRESSURE_MSB_REG, 8)
-
-    # convert raw data bytes to 32 bit variables 
-    p =  raw[0]
-    p = p << 8 | raw[1]
-    p = p << 4 | raw[2] >> 4
-  
-    t =  raw[3]
-    t = t << 8 | raw[4]
-    t = t << 4 | raw[5] >> 4
-    
-    h = raw[6]
-    h = h << 8 | raw[7]
-    
-#    print str(raw[0]) + ', ' + str(raw[1]), ', ' + str(raw[2]) + ' -> ', str(p)
-#    print str(raw[3]) + ', ' + str(raw[4]), ', ' + str(raw[5]) + ' -> ', str(t)
-#    print str(raw[6]) + ', ' + str(raw[7]), ' -> ', str(h)
-
-    # compensate and convert temperature to C
-    # my python coding of the formulas from the user guide
-    v1 = (t / 16384.0 - digT1 / 1024.0) * digT2
-    v2 = (t / 131072.0 - digT1 / 8192.0) * (t / 131072.0 - digT1 / 8192.0) * digT3
+  # one forced mode measurement, compensated by the driver
+  try:
+    tc, fp, fh = bme.measure()
+  except IOError as e:
+    print 'BME280 read failed: {}'.format(e)
+    return False
+
+  # pressure is in hPa or millibars
+  if fp != None:
+    fp /= 100.0
+  sensorLog.add((tc, fh, fp))
+
+  # samples are taken every few seconds, the message changes less often
+  now = monotonic()
+  if sensorPublished != None and now - sensorPublished < bmePublish:
+    return True
+  sensorPublished = now
+
+  msg = 'Environment:'
+
+  # convert temperature to degrees Farhenheit
+  if (options.temperature):
+    tf = round((tc * 9 / 5) + 32.05, 1)
+    # convert to text
+    # temerature is reading 5F too high so we compensate
+    tmsg = ' {0:0.1f}F'.format(tf - 5.0)
+
+    # for Celcius temperature replace the two lines above with
+    # tmsg = ' {0:0.1f}C'.format(tc)
+
+    msg += tmsg
+
+  # humidity as a percentage
+  if (options.humidity and fh != None):
+    hmsg = ' {0:0.1f}% RH'.format(fh)
+    if (len(msg) > 13):
+      msg += ','
+
+    msg += hmsg
+
+  if (options.pressure and fp != None):
+    # 1 KPa = 0.29531 inHg (inches of mercury)
+    # fair weather -> 1022mb or greater
+    # foul weathre -> 988mb or less
   
-    tfine = int(v1 + v2)
-    
-    # convert temperature to degrees Farhenheit
-    if (temperature):
-      tc = round((v1 + v2) / 5120.0, 1)
-      tf = round((tc * 9 / 5) + 32.05, 1)
-      # convert to text
-      # temerature is reading 5F too high so we compensate
-      tmsg = ' {0:0.1f}F'.format(tf - 5.0)
-
-      # for Celcius temperature replace the three lines above with
-      # tc = round((v1 + v2) / 5120.0, 1)
-      # tmsg = ' {0:0.1f}C'.format(tc)
-
+    # the trend is the least squares slope of the last 3 hours of readings
+    pmsg = ' {0:0.1f} millibars'.format(fp)
+    trend = tendencyText(sensorLog.tendency('pressure'))
+    if len(trend) > 0:
+      pmsg += ' and ' + trend
       
-    # compensate and convert humidity to a percentage
-    if (humidity):
-      # my python coding of the formulas from the user guide
-      fh = tfine - 76800.0
-      if fh > 0.0:
-        fh = (h - (digH4 * 64.0 + digH5 / 16384.0 * fh)) * (digH2 / 65536.0 * (1.0 + digH6 / 67108864.0 * fh * (1.0 + digH3 / 67108864.0 * fh)))
-    
-        fh *= (1.0 - digH1 * fh / 524288.0)
-    
-        if fh > 100.0:
-          fh = 100.0
-        elif fh < 0.0:
-          fh = 0.0
-      else:
-        fh = 0.0
+    if (len(msg) > 13):
+      msg += ','
         
-      hmsg = ' {0:0.1f}% RH'.format(fh)
-
-    # compensate and convert pressure to inches of Hg
-    if (pressure):
-      # my python coding of the formulas from the user guide
-      # 1KPa = 0.29531inHg
-      v1 = (tfine / 2.0) - 64000.0
-      v2 = (((v1 / 4.0) * (v1 / 4.0)) / 2048) * digP6
-      v2 += ((v1 * digP5) * 2.0)
-      v2 = (v2 / 4.0) + (digP4 * 65536.0)
-      v1 = (((digP3 * (((v1 / 4.0) * (v1 / 4.0)) / 8192)) / 8) + ((digP2 * v1) / 2.0)) / 262144
-      v1 = ((32768 + v1) * digP1) / 32768
-  
-      # check for possible divison by zero
-      if v1 != 0:
-        fp = ((1048576 - p) - (v2 / 4096)) * 3125
-        if fp < 0x80000000:
-          fp = (fp * 2.0) / v1
-        else:
-          fp = (fp / v1) * 2
-    
-        v1 = (digP9 * (((fp / 8.0) * (fp / 8.0)) / 8192.0)) / 4096
-        v2 = ((fp / 4.0) * digP8) / 8192.0
-        fp += ((v1 + v2 + digP7) / 16.0)
+    msg += pmsg
     
-      else:
-        # something went wrong with the pressure calculation or we just got
-        # spaced !!!
-        fp = 0.0
+  if (len(msg) > 12):
+    list.append([randomColor(), msg])
 
-      # 1 KPa = 0.29531 inHg (inches of mercury)
-      # fair weather -> 1022mb or greater
-      # foul weathre -> 988mb or less
-    
-      # pressure is in hPa or millibars
-      fp /= 100.0
-  
-      # convert to hectoPascals (hPa) or millibars
-      pmsg = ' {0:0.1f} millibars'.format(fp)
-      if (int(lastPressure) < int(fp)):
-        pmsg += ' and rising'
-      elif (int(lastPressure) > int(fp)):
-        pmsg += ' and falling'
-        
-      # save current pressure reading
-      lastPressure = fp;
-      
-      msg = 'Environment:'
-      if (temperature):
-        msg += tmsg
-
-      if (humidity):
-        if (len(msg) > 13):
-          msg += ','
-
-        msg += hmsg
-
-      if (pressure):
-        if (len(msg) > 13):
-          msg += ','
-          
-        msg += pmsg
-      
-      list.append([randomColor(), msg])
+  if len(list) > 0:
+    feeds.publish('sensor', list)
 
-    if len(list) > 0:
-      # protect globals
-      dirtyLock.acquire()
-      del sensorList[:]
-      dirtyFlag = True
-      sensorList += list
-      dirtyLock.release()
-      del list[:]
-
-    # sleep for some number of seconds
-    time.sleep(delay)
-  # while
-    
 #==============================================================================
-# make a new topList.
-def newTopList(): 
-  global dirtyLock
-  global topList
-  
-  # all entries have been sent, re-build the topList
-  # protect the global resources
-  dirtyLock.acquire()
-  del topList[:]
+# make a new topList. called by the render loop when the top line gets to the
+# end of its list. with topline=clock the time is not scrolled, it is shown by
+# the clock, and the holidays and birthdays of the playlist are
+def newTopList(playlist):
+  if options.topLine == 'clock':
+    return ((randomColor(), dateMessage()),) + playlist.top
 
   # add time and date messages to the topList
-  topList.append([randomColor(), timeMessage()])
-  topList.append([randomColor(), dateMessage()])
-
-  dirtyLock.release()
-       
+  return ((randomColor(), timeMessage()), (randomColor(), dateMessage()))
 
 #==============================================================================
-# make a new bottomList from the feature lists. weather may be added multiple
-# times if headlines are enabled.
-def newBottomList(): 
-  global dirtyFlag
-  global dirtyLock
-  global newsEnabled
-  global sensorList
-  global weatherList
-  global bottomList
-  global jokeList
-  global newsList
-  
-  # all entries have been sent, re-build the bottomList
-  if dirtyFlag:
-    print "Making New Bottom List"
-
-    # protect the global resources
-    dirtyLock.acquire()
-    del bottomList[:]
-    dirtyFlag  = False
-    bottomList += dailyList + quoteList + sensorList + jokeList + weatherList + newsList
-    if newsEnabled and len(newsList) > 10:
-      bottomList += weatherList
-
-    dirtyLock.release()
-       
-#==============================================================================
-# Check for the holidays that do not occur on the same day every year
-# thisday -> day of the month as a string
-# day     -> which occurace of the weekday; First Monday, Third Sunday...
-# weekday -> dow as a string, same as flags from xml file
-def check4Holiday(thisDay, day, flags):
-  # assume no match occurs
-  result = False
-  dayasnumber = int(thisDay)
-  
-  if day == "First":
-    # First occurance
-    result = dayasnumber <= 7
-  elif day == "Second":
-    # Second occurance
-    result = dayasnumber > 7 and dayasnumber <= 14
-  elif day == "Third":
-    # Third occurance
-    result = dayasnumber > 14 and dayasnumber <= 21
-  elif day == "Fourth":
-    # Fourth occurance
-    result = dayasnumber > 21 and dayasnumber <= 28
-  elif day == "Last":
-    # Last occurance only happens in May, 31 days
-    result = dayasnumber > 24
-  elif day == "Easter":
-    # First Sunday after the 21st
-    result = dayasnumber >= 21 and dayasnumber < 28
-  elif day == "PalmSunday":
-    # Week before Easter
-    result = dayasnumber >= 14 and dayasnumber < 21
-  elif day == "GoodFriday":
-    # Friday before Easter
-    result = dayasnumber >= 19 and dayasnumber < 26
-
-  return result
+# make the bottom line messages from the messages of each feature. weather
+# may be added multiple times if headlines are enabled. called by the feeds
+# whenever a feature publishes new messages. with topline=clock the holidays
+# and birthdays are scrolled on the top line instead, see composeTopList
+def composeBottomList(lists):
+  daily = lists['daily']
+  if options.topLine == 'clock':
+    daily = ()
+  bottomList = daily + lists['quote'] + lists['sensor'] + lists['joke'] + lists['weather'] + lists['news']
+  if options.newsEnabled and len(lists['news']) > 10:
+    bottomList += lists['weather']
+  return bottomList
+
+def composeTopList(lists):
+  if options.topLine == 'clock':
+    return lists['daily']
+  return ()
 
-#==============================================================================
-# load the daily list with messages from the xml file. only messages with a
-# matching date are added
-def loadFromXml(filename, thisMonth, thisDay, weekday):
-  # open & read the xml file into a document
-  global dailyList
-
-  if os.path.isfile(filename):
-    try:
-      doc = minidom.parse(filename)
-      items = doc.getElementsByTagName("item")
-
-      # add all entries that have a matching month and day
-      for item in items:
-        month = item.getElementsByTagName("month")[0].firstChild.data
-        day   = item.getElementsByTagName("day")[0].firstChild.data
-        flags = item.getElementsByTagName("flags")[0].firstChild.data
-        linenum = str(item.getElementsByTagName("line")[0].firstChild.data)
-        bc =      str(item.getElementsByTagName("backgnd")[0].firstChild.data)
-        fc =      str(item.getElementsByTagName("foregnd")[0].firstChild.data)
-        txt =     str(item.getElementsByTagName("text")[0].firstChild.data)
-
-        # Holidays and Birthdays must match the current month and day
-        if month == thisMonth:
-          if day == thisDay or day == '0' or day == '00':
-            dailyList.append([randomColor(), txt])
-          # these are holidays that fall on a selected weekday, not a date
-          elif flags == weekday and check4Holiday(thisDay, day, flags):
-            dailyList.append([randomColor(), txt])
-
-    except xml.dom.DOMException:
-      print "DOM faliure reading from " + filename
-  else:
-    print 'File not found: ' + filename
-                  
 #==============================================================================
 # this class handles the driving of the RGB matrix. Each line ahs a list
 # of messages to scroll. Each list entry is a list that contains the color to use
@@ -1377,158 +699,472 @@ class RunText(SampleBase):
   def __init__(self, *args, **kwargs):
     super(RunText, self).__init__(*args, **kwargs)
     self.parser.add_argument("-c 2","-t", "--text", help="The text to scroll on the RGB LED panel", default="Big J Wins Again!")
+    self.parser.add_argument("--fps", action="store", help="Target frames per second. Default: 40", default=40, type=float)
+    self.parser.add_argument("--profile", action="store", help="Profile the render loop and the fetch workers for N frames, or N seconds with an s suffix; 500 or 30s. With --render-process the content process writes its own profile to <profile-dir>/content")
+    self.parser.add_argument("--profile-mode", action="store", help="cprofile writes pstats and sampled stacks, sample only samples stacks. Default: cprofile", default="cprofile", choices=['cprofile', 'sample'])
+    self.parser.add_argument("--profile-dir", action="store", help="Directory for the .pstats and .folded files. Default: profile", default="profile")
+    self.parser.add_argument("--render-process", action="store_true", help="Run the fetches in a process of their own, so parsing does not hold up the frames")
+    self.parser.add_argument("--startup-budget", action="store", help="Seconds from start to the first frame before a warning is printed. Default: 5", default=5.0, type=float)
+    # the matrix is made before run
+    self.started = startup.begin()
+
+  # the first frame is on the panel, start everything else. the fetches are
+  # set up in a background thread, or in a content process that sends the
+  # playlists and their strips, see contentprocess.py. returns the content
+  # process or None, and a function that returns the newest playlist
+  def startBackground(self, renderer):
+    elapsed = startup.firstFrame()
+    if elapsed > self.args.startup_budget:
+      print 'Startup: first frame after {:.1f}s, over the {:.1f}s budget'.format(elapsed, self.args.startup_budget)
+
+    global renderProcess, contentProfiler
+
+    # a kill or a service stop sends SIGTERM, which skips atexit unless it is
+    # turned into SystemExit. the messages are saved and the content process
+    # is stopped from atexit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    content = None
+    if self.args.render_process:
+      from contentprocess import ContentProcess
+
+      # set before the fork, so the content process knows it too
+      renderProcess = True
+      if self.args.profile:
+        from profiler import Profiler, parseLength
+
+        # the content process has no frames, a number of frames is the time
+        # they take at the target rate
+        frameCount, seconds = parseLength(self.args.profile)
+        if seconds == None:
+          seconds = frameCount / self.args.fps
+        contentProfiler = Profiler(None, seconds, self.args.profile_mode, os.path.join(self.args.profile_dir, 'content'))
+
+      stripCache = None
+      if renderer.strips:
+        stripCache = StripCache(renderer.strips.font)
+      content = ContentProcess(startContent, feeds, stripCache, stop = stopContent, tick = tickContent, metrics = metrics)
+      content.start()
+      # stop the content process with the sign, it must not go on fetching on
+      # its own
+      atexit.register(content.stop)
+      latest = lambda: content.latest(self.graphics.Color, renderer.strips)
+    else:
+      # the messages are saved when the sign stops, the content process saves
+      # them itself
+      atexit.register(saveSnapshot)
+      t = threading.Thread(target = startContent, name = 'content-setup')
+      t.daemon = True
+      t.start()
+      latest = lambda: feeds.playlist
+
+    # threads of the render process are started after the content process,
+    # none may be running when it forks
+    syncTime(getNTPTime)
+    if options.metricsPort > 0:
+      metrics.serve(options.metricsPort)
+    return content, latest
 
   def run(self):
-    global topList
-    global topIndex
-    global bottomList
-    global bottomIndex
-        
+    startup.end('matrix', self.started)
+
+    # fonts and drawing come from the selected display backend
+    graphics = self.graphics
+
+    began = startup.begin()
     offscreen_canvas = self.matrix.CreateFrameCanvas()
-    font = graphics.Font()
-    # change the 7x13.bdf filename to use a different font.
-    font.LoadFont("fonts/7x13.bdf")
+
+    # draws only the lines that changed, see render.py
+    renderer = LineRenderer(graphics, fontFile)
+    startup.end('font', began)
+
+    # nothing is fetched until the first frame is on the panel
+    content = None
+    latest = lambda: feeds.playlist
+    starting = True
 
     # default colors    
     topColor = graphics.Color(255, 255, 0)
     bottomColor = graphics.Color(0, 0, 255)
     
-    pos1 = offscreen_canvas.width
-    pos2 = offscreen_canvas.width
+    # scroll positions come from elapsed time, not from the frame count, so
+    # the frame rate can be lowered without changing the scroll speed
+    now = monotonic()
+    top = Scroller(options.topSpeed)
+    top.start(offscreen_canvas.width, now)
+    bottom = Scroller(options.bottomSpeed)
+    bottom.start(offscreen_canvas.width, now)
     
     my_text = self.args.text
 
+    # profile for a number of frames or seconds, see profiler.py. when the
+    # option is not given the loop only checks that profiler is None
+    profiler = None
+    if self.args.profile:
+      from profiler import Profiler, parseLength
+
+      frameCount, seconds = parseLength(self.args.profile)
+      profiler = Profiler(frameCount, seconds, self.args.profile_mode, self.args.profile_dir)
+      # with --render-process the fetch workers are in the content process,
+      # which profiles them itself
+      profiler.start(None if self.args.render_process else fetchEngine)
+      # still write the results when the sign is stopped early
+      atexit.register(profiler.stop)
+
+    frames = FrameScheduler(self.args.fps)
+    reportDelay = 600       # print frame statistics every ten minutes
+    reportTime = now + reportDelay
+    # with --render-process the content process reloads the options for the
+    # providers, the render process for itself
+    optionsDelay = 5
+    optionsTime = now + optionsDelay
+    # and writes the metrics file, with the metrics of both processes
+    metricsDelay = 60
+    metricsTime = now + metricsDelay
+
+    # the top line shows the time and date, the bottom line scrolls through
+    # a snapshot of the feeds. a newer snapshot is picked up at the end of
+    # the list, so the index always fits the list it indexes
+    bottomList = latest()
+    bottomIndex = 0
+    topList = newTopList(bottomList)
+    topIndex = 0
+
+    # with topline=clock the top line shows a clock that stands still. every
+    # datedelay seconds the date and the holidays scroll by once, then the
+    # clock comes back in a new color
+    clockShown = options.topLine == 'clock'
+    clockColor = randomColor()
+    clockMsg = timeMessage()
+    clockSecond = None
+    dateTime = now + options.dateDelay
+
     while True:
-      offscreen_canvas.Clear()
-      
-      if (len(topList) > 0):
-        topColor = topList[topIndex][0]
-        msg = topList[topIndex][1]
+      now = monotonic()
+      pos2 = bottom.position(now)
+
+      if clockShown:
+        if now >= dateTime or options.topLine != 'clock':
+          # time for the date, or the options turned the clock off
+          clockShown = False
+          topList = newTopList(latest())
+          topIndex = 0
+          top.setSpeed(options.topSpeed)
+          top.start(offscreen_canvas.width, now)
+        else:
+          # the text only changes once a second. in between the renderer
+          # gets the same strip and does not draw the line again
+          second = int(time.time())
+          if second != clockSecond:
+            clockSecond = second
+            clockMsg = timeMessage()
+
+      if clockShown:
+        topColor = clockColor
+        topMsg = clockMsg
+        # centered, not scrolling
+        pos1 = None
       else:
-        msg = 'Please Wait for Raspberry Pi to boot'
-        
-      # determine the pixel length of the message
-      msglen = graphics.DrawText(offscreen_canvas, font, pos1, Row1, topColor, msg)
-      pos1 -= 1
+        pos1 = top.position(now)
+        if (len(topList) > 0):
+          topColor = topList[topIndex][0]
+          topMsg = topList[topIndex][1]
+        else:
+          topMsg = 'Please Wait for Raspberry Pi to boot'
+
+      # scroll bottom line
+      if (len(bottomList) > 0):
+        bottomColor = bottomList[bottomIndex][0]
+        bottomMsg = bottomList[bottomIndex][1]
+      else:
+        bottomMsg = 'Please Wait while I gather information from the Internet'
+
+      # draw what changed, frame is None when the panel already shows it
+      frame = renderer.draw(offscreen_canvas, [(topColor, topMsg, pos1, Row1), (bottomColor, bottomMsg, pos2, Row2)])
+      toplen, bottomlen = renderer.widths
+
       # check for message scroll complete
-      if (pos1 + msglen < 0):
-        # scroll complete, change message & start scrolling
-        pos1 = offscreen_canvas.width
+      if (pos1 != None and pos1 + toplen < 0):
+        # scroll complete, change message & start scrolling. a new speed
+        # from the options starts with the next message
+        top.setSpeed(options.topSpeed)
+        top.start(offscreen_canvas.width, now)
         
         # iterate through topList one message at a time
         topIndex += 1
         if (len(topList) <= topIndex):
           # end of the list, start over
           topIndex = 0
-          # make new topList
-          newTopList()
+          if options.topLine == 'clock':
+            # back to the clock until the next date
+            clockShown = True
+            clockColor = randomColor()
+            clockSecond = None
+            dateTime = now + options.dateDelay
+          else:
+            # make new topList
+            topList = newTopList(latest())
 
-      # scroll bottom line
-      if (len(bottomList) > 0):
-        bottomColor = bottomList[bottomIndex][0]
-        msg = bottomList[bottomIndex][1]
-      else:
-        msg = 'Please Wait while I gather information from the Internet'
-        
-      # determine the pixel length of the message
-      msglen = graphics.DrawText(offscreen_canvas, font, pos2, Row2, bottomColor, msg)
-      pos2 -= 1
       # check for message scroll complete
-      if (pos2 + msglen < 0):
+      if (pos2 + bottomlen < 0):
         # scroll complete, change message & start scrolling
-        pos2 = offscreen_canvas.width
+        bottom.setSpeed(options.bottomSpeed)
+        bottom.start(offscreen_canvas.width, now)
         
         # iterate through bottomList one message at a time
         bottomIndex += 1
         if (len(bottomList) <= bottomIndex):
           # end of the list, start over
           bottomIndex = 0
-          # make new bottomList
-          newBottomList()
+          # pick up the newest bottomList
+          newest = latest()
+          if bottomList.version != newest.version:
+            print "Making New Bottom List"
+            bottomList = newest
           
 #        print bottomList[bottomIndex][1]
 
-#      time.sleep(0.05)
-      time.sleep(0.025)
-      offscreen_canvas = self.matrix.SwapOnVSync(offscreen_canvas)
+      # sleep until the next frame deadline
+      metrics.observe('sign_frame_seconds', monotonic() - now)
+      steps = frames.wait()
+      metrics.inc('sign_frames_total')
+      if steps > 1:
+        metrics.inc('sign_frames_missed_total', steps - 1)
+
+      if profiler != None and profiler.frame():
+        profiler = None
+      if frame != None:
+        offscreen_canvas = self.matrix.SwapOnVSync(offscreen_canvas)
+        renderer.swapped(frame)
+
+      if starting:
+        starting = False
+        content, latest = self.startBackground(renderer)
+
+      if monotonic() >= reportTime:
+        print frames.report()
+        if httpClient != None:
+          print httpClient.report()
+        if providers != None:
+          print providers.report()
+        if content != None and not content.alive():
+          print 'The content process has stopped'
+        frames.reset()
+        reportTime += reportDelay
+
+      if content != None and monotonic() >= optionsTime:
+        reloadOptions(content = False)
+        content.receiveMetrics(metrics)
+        optionsTime += optionsDelay
+
+      if content != None and monotonic() >= metricsTime:
+        if len(options.metricsFile) > 0:
+          metrics.dump(options.metricsFile)
+        metricsTime += metricsDelay
 
 #==============================================================================
-def setup(): 
+# make the HTTP client and cache. requests and the parsers are imported here,
+# so the first frame does not wait for them
+def loadContent():
+  global requests
+  global httpClient
+  global httpCache
+  global parseJoke, parseQuote, parseWeather, parseForecast, headlineParser
+
+  import requests
+  from httpclient import HttpClient
+  from httpcache import HttpCache
+  from parsers import parseJoke, parseQuote, parseWeather, parseForecast, headlineParser
+
+  httpClient = HttpClient()
+  httpClient.configure(connectTimeout = options.connectTimeout, readTimeout = options.readTimeout, retries = options.retries)
+  httpClient.configure('jokes', maxBytes = 512 * 1024)
+  httpClient.configure('quote', maxBytes = 256 * 1024)
+  httpClient.configure('weather', maxBytes = 256 * 1024)
+  httpClient.configure('news', maxBytes = 4 * 1024 * 1024)
+
+  # a page that did not change is not parsed again
+  httpCache = HttpCache('cache/http', makeColor = graphics.Color, get = httpClient.get, metrics = metrics)
+
+#==============================================================================
+# read the options and make the fetch engine. quick, the panel is not lit yet
+def prepare():
+  global fetchEngine
+  global options
+  global optionsWatcher
 
-  global quoteEnabled
-  global quoteUrl
-  global jokesEnabled
-  global jokesUrls
-  global jokesDelay
-  global weatherEnabled
-  global weatherKey
-  global weatherZip
-  global newsEnabled
-  global newsUrls
-  
-#  global log
-  
-  print "NTP: " + getNTPTime()
-  
   # initialize the randon number generator
   random.seed()
   
-  # dailyList does not use a thread for updating
-       
-  # read the options file     
-  readOptions('options.ini')
+  # read the options file, and watch it for changes
+  options = readOptions('options.ini')
+  optionsWatcher = OptionsWatcher('options.ini', options)
+
+  # all features are refreshed by one fetch engine instead of a thread each
+  fetchEngine = FetchEngine(fetchWorkers)
+
+#==============================================================================
+# the provider of each feature that is turned on in the options. each returns
+# the provider, None when the feature is off. called by setup, and again when
+# the options of the feature change
+
+# update the Quote-of-the-day once an hour
+def registerQuote():
+  if options.quoteEnabled and len(options.quoteUrl) > 0:
+    return providers.register('quote', getQuoteOfTheDay, 3600)
+
+# update jokes every 20 minutes, unless the options say otherwise
+def registerJokes():
+  if options.jokesEnabled and len(options.jokesUrls) > 0:
+    return providers.register('jokes', getAJoke, options.jokesDelay or 1200)
+
+# update the weather info every fifteen minutes, within the daily quota
+def registerWeather():
+  if options.weatherEnabled and len(options.weatherKey) > 0 and len(options.weatherZip) > 0:
+    print 'Scheduling Weather updates'
+    return providers.register('weather', getWeather, 900, quota = options.weatherQuota, cost = 2)
+  print 'Weather updates not enabled'
+
+# sample the BME280 sensor every few seconds. the sensor is set up again, the
+# oversampling and filter may have changed
+def registerSensor():
+  if initBME280():
+    openSensorLog()
+    return providers.register('sensor', getBME280, options.bmeInterval, jitter = 0)
+
+# update news headlines every thirty minutes
+def registerNews():
+  if options.newsEnabled and len(options.newsUrls) > 0:
+    return providers.register('news', getHeadlines, 1800)
+
+# write the metrics to a file every minute. the server is started by the
+# render loop. with --render-process the render loop writes the file too,
+# with the metrics of both processes
+def registerMetrics():
+  if len(options.metricsFile) > 0 and not renderProcess:
+    return providers.register('metrics', lambda: metrics.dump(options.metricsFile), 60, jitter = 0)
+
+# section of the options -> provider, feed and the function that registers it
+SECTION_PROVIDERS = {
+  'quote':   ('quote', 'quote', registerQuote),
+  'jokes':   ('jokes', 'joke', registerJokes),
+  'weather': ('weather', 'weather', registerWeather),
+  'sensor':  ('sensor', 'sensor', registerSensor),
+  'news':    ('news', 'news', registerNews),
+  'metrics': ('metrics', None, registerMetrics),
+}
+
+# sections of the options that the render process applies with
+# --render-process. the content process applies all of them to the feeds
+# and the providers
+RENDER_SECTIONS = ('clock', 'display', 'metrics')
+
+#==============================================================================
+# read options.ini again when it changed, see options.py. runs as a provider
+# every few seconds. the render loop reads the clock and display options as
+# it goes, so it keeps running. render is True where the frames are drawn,
+# content where the feeds and the providers are; both in one process, apart
+# with --render-process
+def reloadOptions(render = True, content = True):
+  global options
+
+  new = optionsWatcher.check()
+  if new == None:
+    return
+  old = options
+  options = new
+  applyOptions(old, new, render, content)
+
+# restart the providers of the sections that changed, the others keep running
+def applyOptions(old, new, render = True, content = True):
+  sections = [s for s in changedSections(old, new) if content or s in RENDER_SECTIONS]
+  if len(sections) == 0:
+    return
+  print 'Options changed: ' + ', '.join(sections)
+  for section in sections:
+    if section == 'display' and content:
+      # the holidays go to the top or the bottom line, see composeTopList
+      feeds.rebuild()
+    if section == 'http' and httpClient != None:
+      httpClient.configure(connectTimeout = new.connectTimeout, readTimeout = new.readTimeout, retries = new.retries)
+    if section == 'metrics' and render and new.metricsPort != old.metricsPort:
+      print 'The metrics port changes when the sign is restarted'
+
+    # the providers run where setup ran, in the content process with
+    # --render-process
+    if section in SECTION_PROVIDERS and content and providers != None:
+      name, feed, register = SECTION_PROVIDERS[section]
+      providers.remove(name)
+      if register() == None and feed != None:
+        # turned off, take its messages off the sign
+        feeds.publish(feed, [])
+
+#==============================================================================
+# set up the providers. runs after the first frame
+def setup(): 
+  global providers
   
-  # add time and date messages to the topList
-  newTopList()
-    
-  # create a thread to update the Quote-of-the-day once an hour
-  if quoteEnabled and len(quoteUrl) > 0:
-    try:
-      thread.start_new_thread(getQuoteOfTheDay, ())
-    except:
-      print 'Error: unable to create Quotes thread'
-
-  # create a thread to update jokes every 20 minutes
-  if jokesEnabled and len(jokesUrls) > 0:
-    if 0 == jokesDelay:
-      jokesDelay = 1200
-      
-    try:
-      thread.start_new_thread(getAJoke, ())
-    except:
-      print 'Error: unable to create Jokes thread'
-
-  # create a thread to update the weather info every ten minutes
-  if weatherEnabled and len(weatherKey) > 0 and len(weatherZip) > 0:
-    try:
-      print 'Creating Weather thread'
-      thread.start_new_thread(getWeather, ())
-    except:
-      print 'Error: unable to create Weather thread'
-  else:
-    print 'Weather thread failed'
-    
-  # create a thread to update the BME280 sensor data every ten minutes
-  try:
-    thread.start_new_thread(getBME280, ())
-  except:
-    print 'Error: unable to createBME280 thread'
+#  global log
+
+  began = startup.begin()
+  loadContent()
+  startup.end('content imports', began)
+  
+  # the provider registry decides when each refresh runs
+  began = startup.begin()
+  providers = Registry(fetchEngine, metrics = metrics)
+
+  # holidays and birthdays, again just after each midnight
+  providers.register('daily', updateDailyList, untilMidnight, jitter = 0)
 
-  # create a thread to update news headlines once an hour
-  if newsEnabled and len(newsUrls) > 0:
-    try:
-      thread.start_new_thread(getHeadlines, ())
-    except:
-      print 'Error: unable to create Headlines thread'
+  registerQuote()
+  registerJokes()
+  registerWeather()
+  registerSensor()
 
-  # add messages to the bottomList
-  newBottomList()
+  # sensor and weather history for the pressure trends
+  initLogs()
+
+  registerNews()
+  registerMetrics()
+
+  # save the messages every five minutes for a warm restart
+  providers.register('snapshot', saveSnapshot, 300, jitter = 0)
+
+  # look for changes of options.ini every few seconds
+  providers.register('options', lambda: reloadOptions(render = not renderProcess), 5, jitter = 0)
+  startup.end('providers', began)
 
 #==============================================================================
-# Main function
+# set up and start the fetches. runs in a background thread after the first
+# frame, or in the content process with --render-process
+def startContent():
+  # the render process adds the metrics of the content process to its own,
+  # the values copied by the fork would be counted twice
+  if renderProcess:
+    metrics.reset()
+  setup()
+
+  if contentProfiler != None:
+    contentProfiler.start(fetchEngine)
+
+  # first runs are a couple of seconds apart
+  providers.start()
+  fetchEngine.start()
+
+#==============================================================================
+# Main function. setup runs later, nothing slow happens on import
 
-setup()
 if __name__ == "__main__":
+  began = startup.begin()
+  prepare()
+  startup.end('options', began)
+
+  # show what the sign had before it stopped, until it is fetched again
+  began = startup.begin()
+  snapshot.load(feeds, graphics.Color, snapshotAges())
+  startup.end('snapshot', began)
+
   run_text = RunText()
   if (not run_text.process()):
-    run_text.print_help()
+    sys.exit(1)
@@ -0,0 +1,264 @@
+# BDF font loader with a compiled, memory-mapped glyph atlas.
+
+# The fonts directory has BDF files of 12k to 140k lines each. Parsing one of
+# them on a Raspberry Pi Zero takes seconds. The first time a font is loaded it
+# is parsed and compiled into a compact binary atlas that is saved next to the
+# BDF file (fonts/7x13.bdf -> fonts/7x13.atlas). After that the atlas is
+# mapped into memory with mmap, so loading a font costs a page-in instead of a
+# text parse. The atlas is rebuilt when the BDF file changes.
+
+# Atlas layout, all values little endian;
+#   header      see HEADER below
+#   glyph table one GLYPH entry per glyph, sorted by code point
+#   bitmaps     packed glyph rows, each row is (width + 7) / 8 bytes, msb is
+#               the left most pixel. same as the BITMAP section of a BDF file
+
+import mmap
+import os
+import struct
+
+ATLAS_MAGIC   = 'BDFA'
+ATLAS_VERSION = 1
+
+# magic, version, source mtime, source size, ascent, descent, glyph count,
+# offset of the glyph table, offset of the bitmaps
+HEADER = struct.Struct('<4sIqqhhIII')
+
+# code point, advance, bbx width, bbx height, bbx x offset, bbx y offset,
+# offset of the bitmap
+GLYPH = struct.Struct('<IhhhhhI')
+
+# rgbmatrix draws this glyph for characters that are not in the font
+REPLACEMENT_CHAR = 0xFFFD
+
+#==============================================================================
+# one glyph. x and y offset are of the lower left corner of the bitmap,
+# relative to the origin on the baseline. y is positive up.
+class Glyph(object):
+  __slots__ = ('codepoint', 'advance', 'width', 'height', 'xoff', 'yoff', 'bits')
+
+  def __init__(self, codepoint, advance, width, height, xoff, yoff, bits):
+    self.codepoint = codepoint
+    self.advance = advance
+    self.width = width
+    self.height = height
+    self.xoff = xoff
+    self.yoff = yoff
+    self.bits = bits
+
+  # bytes per bitmap row
+  def stride(self):
+    return (self.width + 7) >> 3
+
+#==============================================================================
+# parse a BDF file. returns (ascent, descent, glyphs), glyphs is a list of
+# Glyph sorted by code point. glyphs without an encoding are dropped.
+def parseBdf(filename):
+  ascent = None
+  descent = None
+  bbox = (0, 0, 0, 0)
+  glyphs = []
+
+  with open(filename, 'r') as f:
+    lines = iter(f)
+    for line in lines:
+      words = line.split()
+      if len(words) == 0:
+        continue
+
+      key = words[0]
+      if key == 'FONTBOUNDINGBOX':
+        bbox = tuple(int(w) for w in words[1:5])
+      elif key == 'FONT_ASCENT':
+        ascent = int(words[1])
+      elif key == 'FONT_DESCENT':
+        descent = int(words[1])
+      elif key == 'STARTCHAR':
+        codepoint = -1
+        advance = 0
+        w, h, xoff, yoff = bbox
+        for line in lines:
+          words = line.split()
+          if len(words) == 0:
+            continue
+
+          key = words[0]
+          if key == 'ENCODING':
+            codepoint = int(words[1])
+          elif key == 'DWIDTH':
+            advance = int(words[1])
+          elif key == 'BBX':
+            w, h, xoff, yoff = [int(x) for x in words[1:5]]
+          elif key == 'BITMAP':
+            stride = (w + 7) >> 3
+            rows = []
+            for line in lines:
+              line = line.strip()
+              if line == 'ENDCHAR':
+                break
+              # some fonts pad rows to a multiple of 16 bits, keep only what
+              # the bbx needs
+              rows.append(line[:stride * 2].ljust(stride * 2, '0').decode('hex'))
+
+            if codepoint >= 0:
+              bits = ''.join(rows[:h]).ljust(stride * h, '\0')
+              glyphs.append(Glyph(codepoint, advance, w, h, xoff, yoff, bits))
+            break
+          elif key == 'ENDCHAR':
+            break
+
+  if ascent == None:
+    ascent = bbox[1] + bbox[3]
+  if descent == None:
+    descent = -bbox[3]
+
+  glyphs.sort(key = lambda g: g.codepoint)
+  return ascent, descent, glyphs
+
+#==============================================================================
+# compile a parsed font into the binary atlas format, returns a string
+def compileAtlas(ascent, descent, glyphs, mtime = 0, size = 0):
+  table = []
+  bitmaps = []
+  offset = 0
+  for g in glyphs:
+    table.append(GLYPH.pack(g.codepoint, g.advance, g.width, g.height, g.xoff, g.yoff, offset))
+    bitmaps.append(g.bits)
+    offset += len(g.bits)
+
+  tableOffset = HEADER.size
+  bitmapOffset = tableOffset + GLYPH.size * len(glyphs)
+  header = HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, mtime, size, ascent, descent, len(glyphs), tableOffset, bitmapOffset)
+  return header + ''.join(table) + ''.join(bitmaps)
+
+#==============================================================================
+# return the atlas file name for a BDF file name
+def atlasName(filename):
+  return os.path.splitext(filename)[0] + '.atlas'
+
+#==============================================================================
+# a font backed by a compiled atlas. buf is an mmap or a string that holds the
+# whole atlas.
+class BdfFont(object):
+  def __init__(self, name, buf):
+    magic, version, mtime, size, ascent, descent, count, tableOffset, bitmapOffset = HEADER.unpack_from(buf, 0)
+    if magic != ATLAS_MAGIC or version != ATLAS_VERSION:
+      raise ValueError('Not a font atlas: ' + name)
+
+    self.name = name
+    self.buf = buf
+    self.mtime = mtime
+    self.size = size
+    self.ascent = ascent
+    self.descent = descent
+    self.height = ascent + descent
+    self.count = count
+    self.tableOffset = tableOffset
+    self.bitmapOffset = bitmapOffset
+
+    # decoded glyphs, only the ones that have been used
+    self.glyphs = {}
+
+  # unpack the table entry at index i
+  def entry(self, i):
+    return GLYPH.unpack_from(self.buf, self.tableOffset + i * GLYPH.size)
+
+  # binary search the glyph table for a code point. returns a Glyph or None
+  def find(self, codepoint):
+    lo = 0
+    hi = self.count
+    while lo < hi:
+      mid = (lo + hi) >> 1
+      cp = struct.unpack_from('<I', self.buf, self.tableOffset + mid * GLYPH.size)[0]
+      if cp < codepoint:
+        lo = mid + 1
+      elif cp > codepoint:
+        hi = mid
+      else:
+        cp, advance, w, h, xoff, yoff, offset = self.entry(mid)
+        start = self.bitmapOffset + offset
+        bits = self.buf[start:start + ((w + 7) >> 3) * h]
+        return Glyph(cp, advance, w, h, xoff, yoff, bits)
+    return None
+
+  # return the glyph for a character. characters that are not in the font get
+  # the replacement character, same as graphics.DrawText. returns None if
+  # neither is in the font.
+  def glyph(self, ch):
+    codepoint = ord(ch)
+    try:
+      return self.glyphs[codepoint]
+    except KeyError:
+      g = self.find(codepoint)
+      if g == None:
+        g = self.find(REPLACEMENT_CHAR)
+      self.glyphs[codepoint] = g
+      return g
+
+  # return the pixel width of a message without drawing it
+  def width(self, text):
+    if isinstance(text, str):
+      text = text.decode('utf-8', 'replace')
+
+    w = 0
+    for ch in text:
+      g = self.glyph(ch)
+      if g:
+        w += g.advance
+    return w
+
+  def close(self):
+    if isinstance(self.buf, mmap.mmap):
+      self.buf.close()
+
+#==============================================================================
+# map an atlas file. returns a BdfFont or None if the file is missing, not an
+# atlas or out of date with the BDF file.
+def mapAtlas(filename, st = None):
+  try:
+    with open(atlasName(filename), 'rb') as f:
+      buf = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+  except (IOError, OSError, ValueError):
+    return None
+
+  try:
+    font = BdfFont(filename, buf)
+  except (ValueError, struct.error):
+    buf.close()
+    return None
+
+  if st != None and (font.mtime != int(st.st_mtime) or font.size != st.st_size):
+    font.close()
+    return None
+
+  return font
+
+#==============================================================================
+# load a font. use the atlas next to the BDF file if it is up to date,
+# otherwise parse the BDF file and write a new atlas. if the atlas can not be
+# written the font is used from memory.
+def loadFont(filename):
+  st = os.stat(filename)
+  font = mapAtlas(filename, st)
+  if font != None:
+    return font
+
+  print 'Compiling font atlas for ' + filename
+  ascent, descent, glyphs = parseBdf(filename)
+  data = compileAtlas(ascent, descent, glyphs, int(st.st_mtime), st.st_size)
+
+  # write to a temporary file and rename, so a partial atlas is never mapped
+  name = atlasName(filename)
+  tmp = name + '.tmp'
+  try:
+    with open(tmp, 'wb') as f:
+      f.write(data)
+    os.rename(tmp, name)
+  except (IOError, OSError):
+    print 'Unable to write font atlas: ' + name
+    return BdfFont(filename, data)
+
+  font = mapAtlas(filename, st)
+  if font == None:
+    font = BdfFont(filename, data)
+  return font
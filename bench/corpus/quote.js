@@ -0,0 +1,7 @@
+var br = document;
+br.writeln("<div class=\"qotd\">");
+br.writeln("<b>Quote of the Day</b><br>");
+br.writeln("The only way to do great work is to love what you do.<br>");
+br.writeln("&mdash; <a href=\"/quotes/authors/steve-jobs\">Steve Jobs</a>");
+br.writeln("</div>");
+br.writeln("<b><a href=\"https://www.quotationspage.com/\">More quotations</a></b>");
@@ -0,0 +1,257 @@
+# Parser benchmark and regression corpus for the scrolling sign.
+
+# Runs each page parser of parsers.py against the pages in bench/corpus and
+# checks the messages against the golden output next to
+# each page, <page>.golden with one message per line. Colors are random, so
+# only the text is compared. Each parser is then timed on its page and the
+# harness reports:
+#   MB/s     page bytes parsed per second
+#   ms       time to parse the page once
+#   peak KB  growth of the peak resident size (VmHWM in /proc/self/status)
+#            while loading and parsing the page once, in a fresh Python
+#            process that has only imported the parsers. Python 2 has no
+#            tracemalloc. The size grows in whole pages, so a small page that
+#            fits in memory the interpreter already has shows 0. '-' when it
+#            can not be measured
+# The exit code is 1 when any parser does not match its golden output.
+
+# The pages in the corpus are synthetic. They were written by hand in the
+# layout each parser expects, with placeholder text, not recorded from the
+# sites, so they catch a parser change that breaks a known layout but not a
+# site that changed its own. corpus/index.json lists the pages, which parser
+# reads each page and the URL of the site it stands for. A headline page is
+# parsed by the parser that the sign picks for its URL. The forecast is
+# parsed as if it was fetched at 'now'.
+
+# To check the parsers against a site as it is now, record a real page in
+# place of the synthetic one and check the golden output by eye before
+# committing it;
+#   python bench/parser_bench.py --record https://www.yahoo.com/news/ headline yahoo.html
+# After a parser change that is meant to change its output, write the golden
+# files again from the current parsers;
+#   python bench/parser_bench.py --update
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + '/..'))
+
+import parsers
+from timing import monotonic
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+#==============================================================================
+# the parser of each corpus entry, called with the page text and the entry
+def parseEntry(page, entry):
+  name = entry['parser']
+  if name == 'joke':
+    return parsers.parseJoke(page)
+  if name == 'quote':
+    return parsers.parseQuote(page)
+  if name == 'headline':
+    parse = parsers.headlineParser(entry['url'])
+    if parse == None:
+      raise ValueError('No headline parser for ' + entry['url'])
+    return parse(page)
+  if name == 'weather':
+    return parsers.parseWeather(json.loads(page), 0)
+  if name == 'forecast':
+    return parsers.parseForecast(page, now = entry.get('now'))
+  raise ValueError('Unknown parser: ' + name)
+
+PARSERS = ('joke', 'quote', 'headline', 'weather', 'forecast')
+
+# run fn with the prints of the parsers thrown away
+def quiet(fn, *args):
+  stdout = sys.stdout
+  sys.stdout = open(os.devnull, 'w')
+  try:
+    return fn(*args)
+  finally:
+    sys.stdout.close()
+    sys.stdout = stdout
+
+#==============================================================================
+# corpus files
+def loadIndex():
+  with open(os.path.join(CORPUS, 'index.json'), 'r') as f:
+    return json.load(f)
+
+def saveIndex(index):
+  with open(os.path.join(CORPUS, 'index.json'), 'w') as f:
+    f.write('[\n' + ',\n'.join(' ' + json.dumps(e, sort_keys = True) for e in index) + '\n]\n')
+
+# the page as the sign sees it, requests decodes the body to unicode
+def loadPage(entry):
+  with open(os.path.join(CORPUS, entry['page']), 'rb') as f:
+    return f.read().decode('utf-8')
+
+def goldenName(entry):
+  return os.path.join(CORPUS, entry['page'] + '.golden')
+
+def loadGolden(entry):
+  try:
+    with io.open(goldenName(entry), 'r', encoding = 'utf-8') as f:
+      return f.read().splitlines()
+  except IOError:
+    return None
+
+def saveGolden(entry, texts):
+  with io.open(goldenName(entry), 'w', encoding = 'utf-8') as f:
+    for text in texts:
+      f.write(unicode(text) + u'\n')
+
+def texts(messages):
+  return [m[1] for m in messages]
+
+#==============================================================================
+# peak resident size of the process in KB, None when not available
+def readPeak():
+  try:
+    with open('/proc/self/status', 'r') as f:
+      for line in f:
+        if line.startswith('VmHWM:'):
+          return int(line.split()[1])
+  except (IOError, OSError):
+    pass
+  return None
+
+# growth of the peak resident size while loading and parsing the page once,
+# KB. runs in a fresh process, the peak of this one was reached long ago
+def peakMemory(entry):
+  try:
+    out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--peak', entry['page']])
+    return int(out.split()[-1])
+  except (subprocess.CalledProcessError, OSError, ValueError, IndexError):
+    return None
+
+# the --peak side of peakMemory. prints the growth in KB, or '-'
+def measurePeak(name):
+  entries = [e for e in loadIndex() if e['page'] == name]
+  if len(entries) == 0:
+    print 'Not in the corpus: ' + name
+    return 2
+  before = readPeak()
+  quiet(parseEntry, loadPage(entries[0]), entries[0])
+  after = readPeak()
+  if before == None or after == None:
+    print '-'
+  else:
+    print after - before
+  return 0
+
+# parse the page over and over for at least minTime seconds
+def timeParser(page, entry, minTime):
+  runs = 0
+  started = monotonic()
+  elapsed = 0.0
+  while elapsed < minTime or runs < 3:
+    quiet(parseEntry, page, entry)
+    runs += 1
+    elapsed = monotonic() - started
+  return runs, elapsed
+
+#==============================================================================
+# fetch a page, add it to the corpus and write its golden output
+def record(url, parser, name):
+  import requests
+
+  if parser not in PARSERS:
+    print 'Unknown parser: {}, one of {}'.format(parser, ', '.join(PARSERS))
+    return 2
+
+  r = requests.get(url, timeout = 30)
+  if r.status_code != 200:
+    print 'Error code {} from {}'.format(r.status_code, url)
+    return 1
+  with open(os.path.join(CORPUS, name), 'wb') as f:
+    f.write(r.text.encode('utf-8'))
+
+  entry = {'page': name, 'parser': parser, 'url': url}
+  index = [e for e in loadIndex() if e['page'] != name]
+  index.append(entry)
+  saveIndex(index)
+
+  found = texts(quiet(parseEntry, loadPage(entry), entry))
+  saveGolden(entry, found)
+  print 'Recorded {} ({} bytes), {} messages. Check {} before committing it'.format(name, len(r.content), len(found), goldenName(entry))
+  return 0
+
+def main():
+  parser = argparse.ArgumentParser(description = 'Check and time the page parsers against the saved corpus.')
+  parser.add_argument('--min-time', default = 0.5, type = float, help = 'Seconds to time each parser for. Default: 0.5')
+  parser.add_argument('--only', help = 'Only run the corpus pages of this parser')
+  parser.add_argument('--update', action = 'store_true', help = 'Write the golden files from the current parsers')
+  parser.add_argument('--record', nargs = 3, metavar = ('URL', 'PARSER', 'PAGE'), help = 'Fetch a page into the corpus')
+  parser.add_argument('--output', help = 'Write the results to this JSON file')
+  parser.add_argument('--peak', metavar = 'PAGE', help = argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.peak:
+    return measurePeak(args.peak)
+  if args.record:
+    return record(*args.record)
+
+  failed = 0
+  results = []
+  for entry in loadIndex():
+    if args.only and entry['parser'] != args.only:
+      continue
+
+    page = loadPage(entry)
+    size = len(page.encode('utf-8'))
+    found = texts(quiet(parseEntry, page, entry))
+
+    if args.update:
+      saveGolden(entry, found)
+      print '{}: wrote {} messages'.format(entry['page'], len(found))
+      continue
+
+    golden = loadGolden(entry)
+    ok = golden == found
+    if not ok:
+      failed += 1
+      print '{}: output does not match {}'.format(entry['page'], goldenName(entry))
+      if golden == None:
+        print '  no golden file, run with --update'
+      else:
+        for i in range(max(len(golden), len(found))):
+          want = golden[i] if i < len(golden) else '(none)'
+          got = found[i] if i < len(found) else '(none)'
+          if want != got:
+            print '  message {}\n    want: {}\n    got:  {}'.format(i + 1, want, got)
+            break
+        print '  {} messages, golden has {}'.format(len(found), len(golden))
+
+    peak = peakMemory(entry)
+    runs, elapsed = timeParser(page, entry, args.min_time)
+    r = {
+      'page': entry['page'],
+      'parser': entry['parser'],
+      'bytes': size,
+      'messages': len(found),
+      'ok': ok,
+      'mbps': size * runs / elapsed / 1e6,
+      'ms': 1000.0 * elapsed / runs,
+      'peakKB': peak,
+    }
+    results.append(r)
+    print '{:<16} {:<9} {:>7} bytes {:>3} msgs  {:7.2f} MB/s  {:8.3f} ms  peak {:>5} KB  {}'.format(
+      r['page'], r['parser'], size, len(found), r['mbps'], r['ms'], '-' if peak == None else peak, 'ok' if ok else 'FAILED')
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump({'results': results}, f, indent = 1, sort_keys = True)
+
+  if failed > 0:
+    print '{} pages do not match their golden output'.format(failed)
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,268 @@
+# Rendering benchmark for the scrolling sign.
+
+# Drives the drawing path of the render loop, render.LineRenderer, on the
+# emulated matrix and measures how it scales with the font, the length of the
+# messages and the size of the panel. Each case scrolls a clock string on the
+# top line and a message on the bottom line one pixel per frame, as fast as it
+# can, for a number of frames, and reports:
+#   fps        frames drawn and swapped per second
+#   p50, p99   time to draw and swap one frame, milliseconds
+#   objects    new objects tracked by the garbage collector per frame. Python 2
+#              has no tracemalloc, so this is the gc allocation count with the
+#              collector off; container objects allocated and not yet freed
+# Strips (when PIL is installed) and graphics.DrawText are measured apart.
+# With --top clock the top line is the clock of topline=clock instead; it
+# stands still and its text changes every 40 frames, a second at 40 fps.
+# Each case is run --repeat times. fps and objects are the median of the
+# runs, p50 and p99 are taken over the frames of all of them; one run of a few
+# hundred frames is too noisy to compare.
+
+# The results are written as JSON. Save them as a baseline on a known good
+# tree, then compare later runs against it; a case whose fps, p99 or objects
+# per frame got worse by more than the threshold is reported as a regression
+# and the exit code is 1. Two runs on the same tree can still differ by 30%
+# on a busy machine, more on the p99 of a frame that takes a tenth of a
+# millisecond. So the default threshold is 25%, a p99 that is less than a
+# quarter of a millisecond slower is not counted, and a case that is worse is
+# run again and only reported when it is worse both times.
+#   python bench/render_bench.py --save-baseline bench/baseline.json
+#   python bench/render_bench.py --baseline bench/baseline.json
+
+import argparse
+import gc
+import glob
+import json
+import os
+import platform
+import sys
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__) + '/..'))
+
+import emulator
+import render
+from timing import monotonic
+
+# baseline rows of the two lines, same as the sign
+Row1 = 11
+Row2 = 28
+
+CLOCK = '12:34:56 PM'
+
+WORDS = ('Local', 'council', 'approves', 'new', 'budget', 'for', 'road', 'repairs',
+         'after', 'long', 'debate', 'over', 'school', 'funding', 'and', 'parks')
+
+#==============================================================================
+# a message of length characters, the clock string for 'clock'
+def message(length):
+  if length == 'clock':
+    return CLOCK
+  text = ''
+  n = 0
+  while len(text) < length:
+    text += WORDS[n % len(WORDS)] + ' '
+    n += 1
+  return text[:length]
+
+# the p-th percentile of sorted values
+def percentile(values, p):
+  return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+def median(values):
+  return sorted(values)[len(values) // 2]
+
+# 'clock,40,120' -> ['clock', 40, 120]
+def parseLengths(text):
+  return [s if s == 'clock' else int(s) for s in text.split(',')]
+
+# '1x1,2x1' -> [(1, 1), (2, 1)], chain x parallel
+def parseGeometries(text):
+  return [tuple(int(n) for n in s.split('x')) for s in text.split(',')]
+
+#==============================================================================
+# run one case, returns its result
+def runCase(fontFile, length, chain, parallel, mode, frames, rows = 32, top = 'scroll', repeat = 1):
+  options = emulator.RGBMatrixOptions()
+  options.rows = rows
+  options.chain_length = chain
+  options.parallel = parallel
+  matrix = emulator.RGBMatrix(options = options)
+  canvas = matrix.CreateFrameCanvas()
+  renderer = render.LineRenderer(emulator.graphics, fontFile, mode == 'strips')
+
+  topColor = emulator.graphics.Color(255, 255, 0)
+  bottomColor = emulator.graphics.Color(0, 0, 255)
+  topMsg = CLOCK
+  bottomMsg = message(length)
+  pos1 = pos2 = canvas.width
+  if top == 'clock':
+    pos1 = None
+
+  # one frame untimed, so loading the glyphs and the first strips are not
+  # part of the numbers
+  renderer.draw(canvas, [(topColor, topMsg, pos1, Row1), (bottomColor, bottomMsg, pos2, Row2)])
+
+  times = []
+  rates = []
+  counts = []
+  for run in range(repeat):
+    gc.collect()
+    gc.disable()
+    try:
+      canvas, fps, objects = runFrames(renderer, matrix, canvas, frames, (topColor, bottomColor), top, topMsg, bottomMsg, pos1, pos2, times)
+    finally:
+      gc.enable()
+    rates.append(fps)
+    counts.append(objects)
+
+  times.sort()
+  return {
+    'font': os.path.basename(fontFile),
+    'length': length,
+    'chain': chain,
+    'parallel': parallel,
+    'mode': mode,
+    'top': top,
+    'width': canvas.width,
+    'height': canvas.height,
+    'frames': frames,
+    'repeat': repeat,
+    'fps': median(rates),
+    'p50': 1000.0 * percentile(times, 50),
+    'p99': 1000.0 * percentile(times, 99),
+    'objects': median(counts),
+  }
+
+# draw frames, adding the time of each to times. returns the canvas to draw
+# on next, the frames per second and the objects per frame
+def runFrames(renderer, matrix, canvas, frames, colors, top, topMsg, bottomMsg, pos1, pos2, times):
+  topColor, bottomColor = colors
+  objects = gc.get_count()[0]
+  started = monotonic()
+  for n in range(frames):
+    start = monotonic()
+    frame = renderer.draw(canvas, [(topColor, topMsg, pos1, Row1), (bottomColor, bottomMsg, pos2, Row2)])
+    if frame != None:
+      canvas = matrix.SwapOnVSync(canvas)
+      renderer.swapped(frame)
+    times.append(monotonic() - start)
+
+    # scroll one pixel, start over when a message is gone
+    if top == 'clock':
+      if n % 40 == 39:
+        topMsg = '12:{:02d}:{:02d}'.format(n // 2400 % 60, n // 40 % 60)
+    else:
+      pos1 -= 1
+    pos2 -= 1
+    toplen, bottomlen = renderer.widths
+    if pos1 != None and pos1 + toplen < 0:
+      pos1 = canvas.width
+    if pos2 + bottomlen < 0:
+      pos2 = canvas.width
+  elapsed = monotonic() - started
+  objects = gc.get_count()[0] - objects
+  return canvas, frames / elapsed if elapsed > 0 else 0.0, float(objects) / frames
+
+def caseKey(r):
+  key = '{}/{}/{}x{}/{}'.format(r['font'], r['length'], r['chain'], r['parallel'], r['mode'])
+  # baselines from before the clock have no top
+  if r.get('top', 'scroll') != 'scroll':
+    key += '/' + r['top']
+  return key
+
+#==============================================================================
+# compare results with a baseline. returns the case and a line for each
+# regression
+def compare(results, baseline, threshold):
+  old = dict((caseKey(r), r) for r in baseline['results'])
+  regressions = []
+  for r in results:
+    b = old.get(caseKey(r))
+    if b == None:
+      continue
+    problems = []
+    if r['fps'] < b['fps'] * (1.0 - threshold):
+      problems.append('fps {:.1f} -> {:.1f}'.format(b['fps'], r['fps']))
+    # a quarter of a millisecond is 1% of a frame at 40 fps
+    if r['p99'] > b['p99'] * (1.0 + threshold) + 0.25:
+      problems.append('p99 {:.2f}ms -> {:.2f}ms'.format(b['p99'], r['p99']))
+    # a fraction of an object per frame is noise from the timer and the list
+    if r['objects'] > b['objects'] * (1.0 + threshold) + 0.5:
+      problems.append('objects {:.1f} -> {:.1f}'.format(b['objects'], r['objects']))
+    if len(problems) > 0:
+      regressions.append((caseKey(r), '{}: {}'.format(caseKey(r), ', '.join(problems))))
+  return regressions
+
+def main():
+  here = os.path.dirname(os.path.abspath(__file__))
+  parser = argparse.ArgumentParser(description = 'Benchmark the drawing path of the scrolling sign.')
+  parser.add_argument('--fonts', default = os.path.join(here, '..', 'fonts', '*.bdf'), help = 'Glob of the BDF fonts to run. Default: every font in fonts/')
+  parser.add_argument('--lengths', default = 'clock,40,120,500', help = 'Message lengths in characters, clock is the clock string. Default: clock,40,120,500')
+  parser.add_argument('--geometry', default = '1x1,2x1,4x1,2x2', help = 'Panels as chain x parallel, like --led-chain and --led-parallel. Default: 1x1,2x1,4x1,2x2')
+  parser.add_argument('--mode', default = 'strips,drawtext', help = 'Drawing paths to run. Default: strips,drawtext')
+  parser.add_argument('--top', default = 'scroll', help = 'Top lines to run, scroll and clock. Default: scroll')
+  parser.add_argument('--frames', default = 300, type = int, help = 'Frames in each case. Default: 300')
+  parser.add_argument('--repeat', default = 5, type = int, help = 'Runs of each case, see above. Default: 5')
+  parser.add_argument('--output', help = 'Write the results to this JSON file')
+  parser.add_argument('--save-baseline', help = 'Write the results to this JSON file as the new baseline')
+  parser.add_argument('--baseline', help = 'Compare the results with this baseline')
+  parser.add_argument('--threshold', default = 0.25, type = float, help = 'Worse by more than this fraction is a regression. Default: 0.25')
+  args = parser.parse_args()
+
+  fonts = sorted(glob.glob(args.fonts))
+  if len(fonts) == 0:
+    print 'No fonts match ' + args.fonts
+    return 2
+
+  modes = args.mode.split(',')
+  if 'strips' in modes and render.StripCache == None:
+    print 'PIL is not installed, skipping the strips mode'
+    modes.remove('strips')
+
+  results = []
+  # case -> the arguments of runCase, to run it again
+  cases = {}
+  for fontFile in fonts:
+    for length in parseLengths(args.lengths):
+      for chain, parallel in parseGeometries(args.geometry):
+        for mode in modes:
+          for top in args.top.split(','):
+            r = runCase(fontFile, length, chain, parallel, mode, args.frames, top = top, repeat = max(1, args.repeat))
+            results.append(r)
+            cases[caseKey(r)] = (fontFile, length, chain, parallel, mode, top)
+            print '{:<40} {:8.1f} fps  p50 {:6.2f}ms  p99 {:6.2f}ms  {:6.1f} objects/frame'.format(
+              caseKey(r), r['fps'], r['p50'], r['p99'], r['objects'])
+
+  report = {
+    'python': platform.python_version(),
+    'machine': platform.machine(),
+    'frames': args.frames,
+    'repeat': max(1, args.repeat),
+    'results': results,
+  }
+  for filename in (args.output, args.save_baseline):
+    if filename:
+      with open(filename, 'w') as f:
+        json.dump(report, f, indent = 1, sort_keys = True)
+
+  if args.baseline:
+    with open(args.baseline, 'r') as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if len(regressions) > 0:
+      # a case can be slow once because the machine was busy
+      print 'Running {} slower cases again'.format(len(regressions))
+      again = []
+      for key, line in regressions:
+        fontFile, length, chain, parallel, mode, top = cases[key]
+        again.append(runCase(fontFile, length, chain, parallel, mode, args.frames, top = top, repeat = max(1, args.repeat)))
+      regressions = compare(again, baseline, args.threshold)
+    if len(regressions) > 0:
+      print '{} regressions against {}:'.format(len(regressions), args.baseline)
+      for key, line in regressions:
+        print '  ' + line
+      return 1
+    print 'No regressions against ' + args.baseline
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,237 @@
+# BME280 temperature, humidity and pressure sensor driver.
+
+# The sensor used to run in normal mode, measuring all the time, and the
+# script read it every ten minutes. The calibration was kept in 18 module
+# globals read with three block reads and a byte read, and the readings were
+# compensated with the floating point formulas.
+
+# This driver runs the sensor in forced mode. Each measure() wakes it for one
+# measurement with the configured oversampling and IIR filter, waits for it,
+# reads all of the data registers in one burst, and the sensor goes back to
+# sleep by itself. The calibration is read once in two bursts (0x88-0xA1 and
+# 0xE1-0xE7, the only two blocks that hold it) and kept in a Calibration
+# object. Readings are compensated with the integer formulas from the BME280
+# datasheet, 32 bit for temperature and humidity and 64 bit for pressure.
+
+import struct
+import time
+
+# I2C address, 0x77 when SDO is pulled high
+ADDRESS = 0x76
+CHIP_ID = 0x60
+
+#===== BME280 Register names, do not modify =====
+CALIB_TP_REG  = 0x88    # dig_T1 .. dig_P9, unused byte, dig_H1
+CALIB_H_REG   = 0xE1    # dig_H2 .. dig_H6
+CHIP_ID_REG   = 0xD0
+RESET_REG     = 0xE0
+CTRL_HUM_REG  = 0xF2
+STATUS_REG    = 0xF3
+CTRL_MEAS_REG = 0xF4
+CONFIG_REG    = 0xF5
+DATA_REG      = 0xF7    # pressure, temperature and humidity, 8 bytes
+
+RESET_VALUE   = 0xB6
+
+# status register bits
+STATUS_MEASURING = 0x08
+STATUS_IM_UPDATE = 0x01
+
+# ctrl_meas mode bits
+MODE_SLEEP  = 0x00
+MODE_FORCED = 0x01
+
+# register value of each oversampling setting, 0 skips the measurement
+OVERSAMPLING = {0: 0, 1: 1, 2: 2, 4: 3, 8: 4, 16: 5}
+
+# register value of each IIR filter coefficient
+FILTER = {0: 0, 2: 1, 4: 2, 8: 3, 16: 4}
+
+# 0x88-0xA1: T1 unsigned, T2 T3 signed, P1 unsigned, P2-P9 signed, a reserved
+# byte and H1 unsigned
+CALIB_TP = struct.Struct('<HhhHhhhhhhhhxB')
+
+#==============================================================================
+# Compensation data of one sensor, read once from its non-volatile memory.
+class Calibration(object):
+  __slots__ = ('t1', 't2', 't3',
+               'p1', 'p2', 'p3', 'p4', 'p5', 'p6', 'p7', 'p8', 'p9',
+               'h1', 'h2', 'h3', 'h4', 'h5', 'h6')
+
+  # tp is the 26 bytes from 0x88, h the 7 bytes from 0xE1
+  def __init__(self, tp, h):
+    (self.t1, self.t2, self.t3,
+     self.p1, self.p2, self.p3, self.p4, self.p5, self.p6, self.p7, self.p8, self.p9,
+     self.h1) = CALIB_TP.unpack(bytes(bytearray(tp)))
+
+    h = bytearray(h)
+    self.h2 = signed(h[0] | h[1] << 8, 16)
+    self.h3 = h[2]
+    # H4 and H5 are 12 bit values that share the nibbles of 0xE5
+    self.h4 = signed(h[3] << 4 | h[4] & 0x0F, 12)
+    self.h5 = signed(h[5] << 4 | h[4] >> 4, 12)
+    self.h6 = signed(h[6], 8)
+
+#==============================================================================
+def signed(value, bits):
+  if value & (1 << (bits - 1)):
+    value -= 1 << bits
+  return value
+
+# integer division that truncates toward zero like C does
+def cdiv(a, b):
+  q = abs(a) // abs(b)
+  if (a < 0) != (b < 0):
+    return -q
+  return q
+
+#==============================================================================
+# datasheet integer compensation. adcT, adcP and adcH are the raw readings.
+# returns (t_fine, temperature in 0.01 degrees C)
+def compensateTemperature(cal, adcT):
+  var1 = (((adcT >> 3) - (cal.t1 << 1)) * cal.t2) >> 11
+  var2 = (((((adcT >> 4) - cal.t1) * ((adcT >> 4) - cal.t1)) >> 12) * cal.t3) >> 14
+  tfine = var1 + var2
+  return tfine, (tfine * 5 + 128) >> 8
+
+# pressure in Pa as a Q24.8 fixed point number (256ths of a Pa)
+def compensatePressure(cal, tfine, adcP):
+  var1 = tfine - 128000
+  var2 = var1 * var1 * cal.p6
+  var2 = var2 + ((var1 * cal.p5) << 17)
+  var2 = var2 + (cal.p4 << 35)
+  var1 = ((var1 * var1 * cal.p3) >> 8) + ((var1 * cal.p2) << 12)
+  var1 = (((1 << 47) + var1) * cal.p1) >> 33
+  if var1 == 0:
+    # avoid a division by zero
+    return 0
+
+  p = 1048576 - adcP
+  p = cdiv(((p << 31) - var2) * 3125, var1)
+  var1 = (cal.p9 * (p >> 13) * (p >> 13)) >> 25
+  var2 = (cal.p8 * p) >> 19
+  return ((p + var1 + var2) >> 8) + (cal.p7 << 4)
+
+# relative humidity in % as a Q22.10 fixed point number (1024ths of a %)
+def compensateHumidity(cal, tfine, adcH):
+  x = tfine - 76800
+  x = (((((adcH << 14) - (cal.h4 << 20) - (cal.h5 * x)) + 16384) >> 15) *
+       (((((((x * cal.h6) >> 10) * (((x * cal.h3) >> 11) + 32768)) >> 10) + 2097152) * cal.h2 + 8192) >> 14))
+  x = x - (((((x >> 15) * (x >> 15)) >> 7) * cal.h1) >> 4)
+  x = min(max(x, 0), 419430400)
+  return x >> 12
+
+#==============================================================================
+class BME280(object):
+  # oversampling is 0 (skipped), 1, 2, 4, 8 or 16 for each measurement.
+  # filter is the IIR filter coefficient, 0 (off), 2, 4, 8 or 16
+  def __init__(self, bus, address = ADDRESS, temperatureOversampling = 1, pressureOversampling = 1,
+               humidityOversampling = 1, filter = 0, sleep = time.sleep):
+    self.bus = bus
+    self.address = address
+    self.sleep = sleep
+    self.calibration = None
+    self.configure(temperatureOversampling, pressureOversampling, humidityOversampling, filter)
+
+    # statistics
+    self.measurements = 0
+    self.busBytes = 0
+
+  # change the oversampling and filter settings. they are written to the
+  # sensor with the next measurement
+  def configure(self, temperatureOversampling = 1, pressureOversampling = 1, humidityOversampling = 1, filter = 0):
+    try:
+      self.osrsT = OVERSAMPLING[temperatureOversampling]
+      self.osrsP = OVERSAMPLING[pressureOversampling]
+      self.osrsH = OVERSAMPLING[humidityOversampling]
+      self.filter = FILTER[filter]
+    except KeyError as e:
+      raise ValueError('Unsupported BME280 setting: {}'.format(e))
+    self.oversampling = (temperatureOversampling, pressureOversampling, humidityOversampling)
+    self.configured = False
+
+  # return True when a BME280 answers at the address
+  def probe(self):
+    try:
+      return self.bus.read_byte_data(self.address, CHIP_ID_REG) == CHIP_ID
+    except IOError:
+      return False
+
+  # reset the sensor and read its calibration data
+  def begin(self):
+    self.bus.write_byte_data(self.address, RESET_REG, RESET_VALUE)
+    # wait for the calibration data to be copied to the registers
+    for i in range(10):
+      self.sleep(0.002)
+      if not self.bus.read_byte_data(self.address, STATUS_REG) & STATUS_IM_UPDATE:
+        break
+    self.calibration = Calibration(self.read(CALIB_TP_REG, CALIB_TP.size), self.read(CALIB_H_REG, 7))
+    self.configured = False
+
+  def read(self, register, length):
+    self.busBytes += length
+    return self.bus.read_i2c_block_data(self.address, register, length)
+
+  # longest time a measurement takes with the current oversampling, seconds.
+  # from appendix B of the datasheet
+  def measureTime(self):
+    t, p, h = self.oversampling
+    ms = 1.25 + 2.3 * t
+    if p > 0:
+      ms += 2.3 * p + 0.575
+    if h > 0:
+      ms += 2.3 * h + 0.575
+    return ms / 1000.0
+
+  # start one measurement in forced mode. the sensor goes back to sleep
+  # when it is done
+  def trigger(self):
+    if not self.configured:
+      # the config register is only written in sleep mode
+      self.bus.write_byte_data(self.address, CTRL_MEAS_REG, MODE_SLEEP)
+      self.bus.write_byte_data(self.address, CONFIG_REG, self.filter << 2)
+      self.configured = True
+    # ctrl_hum only takes effect after a write to ctrl_meas
+    self.bus.write_byte_data(self.address, CTRL_HUM_REG, self.osrsH)
+    self.bus.write_byte_data(self.address, CTRL_MEAS_REG, self.osrsT << 5 | self.osrsP << 2 | MODE_FORCED)
+
+  # read the raw data registers in one burst. returns (adcT, adcP, adcH)
+  def readRaw(self):
+    raw = self.read(DATA_REG, 8)
+    adcP = raw[0] << 12 | raw[1] << 4 | raw[2] >> 4
+    adcT = raw[3] << 12 | raw[4] << 4 | raw[5] >> 4
+    adcH = raw[6] << 8 | raw[7]
+    return adcT, adcP, adcH
+
+  # take one measurement. returns (degrees C, Pa, % RH) as floats. a value
+  # whose oversampling is 0 is None
+  def measure(self):
+    if self.calibration == None:
+      self.begin()
+
+    self.trigger()
+    self.sleep(self.measureTime())
+    # it should be done by now, but do not read a measurement in progress
+    for i in range(10):
+      if not self.bus.read_byte_data(self.address, STATUS_REG) & STATUS_MEASURING:
+        break
+      self.sleep(0.001)
+
+    adcT, adcP, adcH = self.readRaw()
+    self.measurements += 1
+    return self.compensate(adcT, adcP, adcH)
+
+  # compensate raw readings with the integer formulas
+  def compensate(self, adcT, adcP, adcH):
+    cal = self.calibration
+    tfine, t = compensateTemperature(cal, adcT)
+
+    p = None
+    if self.osrsP > 0:
+      p = compensatePressure(cal, tfine, adcP) / 256.0
+
+    h = None
+    if self.osrsH > 0:
+      h = compensateHumidity(cal, tfine, adcH) / 1024.0
+
+    return t / 100.0, p, h
@@ -0,0 +1,194 @@
+# Yearly index of the holiday and birthday messages.
+
+# dateMessage used to parse holidays.xml and birthdays.xml with minidom at
+# every new day, while the dirtyLock was held, and guessed the moving holidays
+# from ranges of days in the month. Easter in March and a fifth Monday in May
+# were missed.
+
+# The XML files are now compiled once into a dictionary for the whole year,
+# keyed by (month, day). Moving holidays are computed exactly:
+#   First, Second, Third, Fourth    nth <flags> weekday of the month
+#   Last                            last <flags> weekday of the month
+#   Easter, PalmSunday, GoodFriday  from the Gregorian computus, month ignored
+#   0 or 00                         every day of the month
+# The index is stored in a cache file together with the mtime and size of the
+# XML files it came from, so it is only compiled again when a file changes or
+# the year changes. Looking up a day is a single dictionary hit.
+
+import calendar
+import datetime
+import json
+import os
+import threading
+
+# which occurrence of a weekday in a month
+NTH = {'First': 1, 'Second': 2, 'Third': 3, 'Fourth': 4}
+
+# days from Easter Sunday
+EASTER = {'Easter': 0, 'PalmSunday': -7, 'GoodFriday': -2}
+
+WEEKDAYS = dict((name, n) for n, name in enumerate(calendar.day_name))
+
+# change when the format of the cache file changes
+VERSION = 1
+
+#==============================================================================
+# date of Easter Sunday in the Gregorian calendar (anonymous computus)
+def easter(year):
+  a = year % 19
+  b, c = divmod(year, 100)
+  d, e = divmod(b, 4)
+  f = (b + 8) // 25
+  g = (b - f + 1) // 3
+  h = (19 * a + b - d - g + 15) % 30
+  i, k = divmod(c, 4)
+  l = (32 + 2 * e + 2 * i - h - k) % 7
+  m = (a + 11 * h + 22 * l) // 451
+  month, day = divmod(h + l - 7 * m + 114, 31)
+  return datetime.date(year, month, day + 1)
+
+#==============================================================================
+# day of the month of the nth weekday (0 = Monday) in a month. n = -1 is the
+# last one. returns None when the month does not have that many
+def nthWeekday(year, month, weekday, n):
+  first, days = calendar.monthrange(year, month)
+  if n < 0:
+    last = (first + days - 1) % 7
+    return days - (last - weekday) % 7
+  day = 1 + (weekday - first) % 7 + 7 * (n - 1)
+  if day > days:
+    return None
+  return day
+
+#==============================================================================
+# return the dates in a year that an item from the XML files falls on
+def itemDates(year, month, day, flags):
+  if day in EASTER:
+    return [easter(year) + datetime.timedelta(EASTER[day])]
+
+  month = int(month)
+  if day in ('0', '00'):
+    return [datetime.date(year, month, d) for d in range(1, calendar.monthrange(year, month)[1] + 1)]
+
+  if day in NTH or day == 'Last':
+    if flags not in WEEKDAYS:
+      return []
+    d = nthWeekday(year, month, WEEKDAYS[flags], NTH.get(day, -1))
+    if d == None:
+      return []
+    return [datetime.date(year, month, d)]
+
+  try:
+    return [datetime.date(year, month, int(day))]
+  except ValueError:
+    # February 29th in a year that does not have one
+    return []
+
+#==============================================================================
+# compile the XML files into {(month, day): [text, ...]} for one year. texts
+# are kept in the order of the files and the items in them
+def compileYear(filenames, year):
+  # only needed when the cache is out of date
+  import xml.etree.ElementTree as ElementTree
+
+  days = {}
+  for filename in filenames:
+    try:
+      root = ElementTree.parse(filename).getroot()
+    except (IOError, OSError, ElementTree.ParseError) as e:
+      print 'Unable to read {}: {}'.format(filename, e)
+      continue
+
+    for item in root.iter('item'):
+      month = (item.findtext('month') or '').strip()
+      day   = (item.findtext('day') or '').strip()
+      flags = (item.findtext('flags') or '').strip()
+      text  = (item.findtext('text') or '').strip()
+      if len(text) == 0:
+        continue
+
+      try:
+        dates = itemDates(year, month, day, flags)
+      except ValueError:
+        print 'Bad date in {}: {} {}'.format(filename, month, day)
+        continue
+
+      for date in dates:
+        days.setdefault((date.month, date.day), []).append(text.encode('utf-8'))
+  return days
+
+#==============================================================================
+class CalendarIndex(object):
+  def __init__(self, filenames = ('holidays.xml', 'birthdays.xml'), cacheFile = 'cache/calendar.json'):
+    self.filenames = list(filenames)
+    self.cacheFile = cacheFile
+    self.lock = threading.Lock()
+    self.year = None
+    self.sources = None
+    self.days = {}
+
+  # (name, mtime, size) of each XML file, the key of the cache
+  def stat(self):
+    sources = []
+    for filename in self.filenames:
+      try:
+        st = os.stat(filename)
+        sources.append([filename, st.st_mtime, st.st_size])
+      except OSError:
+        print 'File not found: ' + filename
+        sources.append([filename, 0, 0])
+    return sources
+
+  # read the cache file, None when it is missing or stale
+  def load(self, year, sources):
+    try:
+      with open(self.cacheFile, 'r') as f:
+        cached = json.load(f)
+    except (IOError, OSError, ValueError):
+      return None
+
+    if cached.get('version') != VERSION or cached.get('year') != year or cached.get('sources') != sources:
+      return None
+
+    days = {}
+    for key, texts in cached['days'].items():
+      month, day = key.split('-')
+      days[(int(month), int(day))] = [t.encode('utf-8') for t in texts]
+    return days
+
+  def save(self, year, sources, days):
+    cached = {'version': VERSION, 'year': year, 'sources': sources,
+              'days': dict(('{}-{}'.format(*key), texts) for key, texts in days.items())}
+    tmp = self.cacheFile + '.tmp'
+    try:
+      directory = os.path.dirname(self.cacheFile)
+      if len(directory) > 0 and not os.path.isdir(directory):
+        os.makedirs(directory)
+      with open(tmp, 'w') as f:
+        json.dump(cached, f)
+      os.rename(tmp, self.cacheFile)
+    except (IOError, OSError):
+      print 'Unable to write calendar cache: ' + self.cacheFile
+
+  # make sure the index is for this year and the current XML files
+  def refresh(self, year):
+    sources = self.stat()
+    with self.lock:
+      if self.year == year and self.sources == sources:
+        return
+
+      days = self.load(year, sources)
+      if days == None:
+        days = compileYear(self.filenames, year)
+        self.save(year, sources, days)
+
+      self.year = year
+      self.sources = sources
+      self.days = days
+
+  # return the texts for a date
+  def lookup(self, date = None):
+    if date == None:
+      date = datetime.date.today()
+    self.refresh(date.year)
+    return list(self.days.get((date.month, date.day), ()))
@@ -0,0 +1,23 @@
+# Message colors for the scrolling sign.
+
+# Kept apart from parsers.py so the render loop can color the time and date
+# without importing the page parsers.
+
+import random
+
+# the rgbmatrix library is only available on the Raspberry Pi
+try:
+  from rgbmatrix import graphics
+except ImportError:
+  import emugraphics as graphics
+
+#==============================================================================
+# Create a random color
+def randomColor():
+  min = 64      # higher numbers yield brighter colors, max is 255
+  max = 255     # low numbers yield dimmer colors.
+  
+  r = random.randint(min, max)
+  g = random.randint(min, max)
+  b = random.randint(min, max)
+  return graphics.Color(r, g, b)
@@ -0,0 +1,163 @@
+# Content process for the scrolling sign.
+
+# The render loop runs in the same process as the fetches, so every burst of
+# HTML or XML parsing and every requests call takes the GIL away from the
+# frame loop. With --render-process the sign is split in two processes:
+#   render   the process that owns the matrix. it only runs the frame loop
+#            and makes the top line messages
+#   content  a child process that runs the fetch engine and all providers and
+#            publishes to the feeds, as the sign does in one process
+# The content process sends each new playlist to the render process through
+# a multiprocessing queue. Messages are sent as (red, green, blue) and text,
+# the top line messages of the playlist too.
+# When PIL is installed the strips of the new messages are rendered in the
+# content process too and sent with the playlist, so the render process only
+# copies them to the canvas. Strips the render process does not get are
+# rendered there, as before.
+# The fetch metrics are counted in the content process. Every few seconds it
+# sends them on a queue of their own, and the render process merges them with
+# its frame metrics, see Metrics.merge, so the metrics server and the metrics
+# file have both.
+
+# On a multi-core Pi the two processes run side by side. On a Pi Zero the
+# kernel still shares the one core, but a parse no longer holds the GIL of the
+# render loop.
+
+import multiprocessing
+import Queue
+import signal
+import sys
+import time
+
+from playlist import Playlist
+from timing import monotonic
+
+#==============================================================================
+class ContentProcess(object):
+  # start is called in the child to start the fetches, tick every interval
+  # and stop when it stops. feeds is the Feeds object the providers publish
+  # to. stripCache is a strips.StripCache used to pre-render the strips, None
+  # sends only the messages. the values of metrics are sent every
+  # metricsInterval seconds
+  def __init__(self, start, feeds, stripCache = None, interval = 0.5, maxQueued = 4, stop = None, tick = None,
+               metrics = None, metricsInterval = 5.0):
+    self.startContent = start
+    self.stopContent = stop
+    self.tick = tick
+    self.feeds = feeds
+    self.stripCache = stripCache
+    self.interval = interval
+    self.queue = multiprocessing.Queue(maxQueued)
+    self.metrics = metrics
+    self.metricsInterval = metricsInterval
+    self.metricsQueue = multiprocessing.Queue(2)
+    self.process = None
+
+    # render side; the newest playlist received, at first the one the
+    # feeds had when the process was made
+    self.playlist = feeds.playlist
+    self.received = 0
+
+  def start(self):
+    self.process = multiprocessing.Process(target = self.main, name = 'content')
+    # stop with the render process
+    self.process.daemon = True
+    self.process.start()
+
+  def alive(self):
+    return self.process != None and self.process.is_alive()
+
+  def stop(self):
+    if self.alive():
+      self.process.terminate()
+      self.process.join(5)
+
+  #============================================================================
+  # content side. sends each new playlist, a send that does not fit in the
+  # queue is tried again later
+  def main(self):
+    # terminate() sends SIGTERM, stop cleanly so stop is called
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+      self.startContent()
+      sent = 0
+      # strips the render process has been sent
+      known = set()
+      metricsTime = monotonic() + self.metricsInterval
+      while True:
+        playlist = self.feeds.playlist
+        if playlist.version != sent and self.send(playlist, known):
+          sent = playlist.version
+        if self.metrics != None and monotonic() >= metricsTime:
+          self.sendMetrics()
+          metricsTime = monotonic() + self.metricsInterval
+        if self.tick != None:
+          self.tick()
+        time.sleep(self.interval)
+    except KeyboardInterrupt:
+      pass
+    finally:
+      if self.stopContent != None:
+        self.stopContent()
+
+  def send(self, playlist, known):
+    messages = tuple(((c.red, c.green, c.blue), text) for c, text in playlist.messages)
+    top = tuple(((c.red, c.green, c.blue), text) for c, text in playlist.top)
+    strips = []
+    if self.stripCache != None:
+      for (rgb, text), (color, t) in zip(messages, playlist.messages):
+        if (rgb, text) in known:
+          continue
+        s = self.stripCache.get(color, text)
+        strips.append((rgb, text, s.width, s.height, s.ascent, s.image.size, s.image.tobytes()))
+    try:
+      self.queue.put_nowait((playlist.version, messages, top, strips))
+    except Queue.Full:
+      return False
+    # the render process has the strips of this playlist now. older ones may
+    # have left its cache, and would add up here for as long as the sign runs
+    known.clear()
+    known.update(messages)
+    return True
+
+  # all values, not the change since the last send. when the render process
+  # has not taken the last ones the send is dropped, the next one has it all
+  def sendMetrics(self):
+    try:
+      self.metricsQueue.put_nowait(self.metrics.values())
+    except Queue.Full:
+      pass
+
+  #============================================================================
+  # render side. returns the newest playlist that was sent. makeColor turns
+  # (red, green, blue) into a color. the strips that come with it are added to
+  # stripCache
+  def latest(self, makeColor, stripCache = None):
+    while True:
+      try:
+        version, messages, top, strips = self.queue.get_nowait()
+      except Queue.Empty:
+        return self.playlist
+
+      self.received += 1
+      colors = {}
+      for rgb, text in messages + top:
+        if rgb not in colors:
+          colors[rgb] = makeColor(*rgb)
+      self.playlist = Playlist(tuple((colors[rgb], text) for rgb, text in messages), version,
+                               tuple((colors[rgb], text) for rgb, text in top))
+      if stripCache != None:
+        for rgb, text, width, height, ascent, size, data in strips:
+          stripCache.load(colors[rgb], text, width, height, ascent, size, data)
+
+  # render side. merges the newest metrics of the content process into
+  # metrics
+  def receiveMetrics(self, metrics):
+    values = None
+    while True:
+      try:
+        values = self.metricsQueue.get_nowait()
+      except Queue.Empty:
+        break
+    if values != None:
+      metrics.merge(values)
@@ -0,0 +1,121 @@
+# Emulation of the rgbmatrix graphics module for the emulated display, see
+# emulator.py. Same names and arguments as the Henner Zeller library, so the
+# scrolling sign can draw on an emulated canvas without changes.
+
+# Fonts are loaded with bdffont.py. Colors only need red, green and blue
+# attributes, so colors made by rgbmatrix.graphics.Color also work here.
+
+import bdffont
+
+#==============================================================================
+class Color(object):
+  __slots__ = ('red', 'green', 'blue')
+
+  def __init__(self, red = 0, green = 0, blue = 0):
+    self.red = red
+    self.green = green
+    self.blue = blue
+
+#==============================================================================
+class Font(object):
+  def __init__(self):
+    self.font = None
+    self.height = 0
+    self.baseline = 0
+    # lit pixels of each glyph, relative to the top left of the glyph
+    self.pixels = {}
+
+  def LoadFont(self, filename):
+    self.font = bdffont.loadFont(filename)
+    self.height = self.font.height
+    self.baseline = self.font.ascent
+    self.pixels.clear()
+
+  # return the advance of a character, takes a code point like rgbmatrix
+  def CharacterWidth(self, char):
+    g = self.font.glyph(unichr(char))
+    if g == None:
+      return -1
+    return g.advance
+
+  # return (glyph, lit pixels) for a character or None
+  def glyphPixels(self, ch):
+    try:
+      return self.pixels[ch]
+    except KeyError:
+      g = self.font.glyph(ch)
+      if g == None:
+        gp = None
+      else:
+        stride = g.stride()
+        lit = []
+        for y in range(g.height):
+          for x in range(g.width):
+            if ord(g.bits[y * stride + (x >> 3)]) & (0x80 >> (x & 7)):
+              lit.append((x, y))
+        gp = (g, lit)
+      self.pixels[ch] = gp
+      return gp
+
+#==============================================================================
+# draw text with its baseline at y. returns the pixel length of the text
+def DrawText(canvas, font, x, y, color, text):
+  if isinstance(text, str):
+    text = text.decode('utf-8', 'replace')
+
+  start = x
+  for ch in text:
+    gp = font.glyphPixels(ch)
+    if gp == None:
+      continue
+
+    g, lit = gp
+    # glyphs that are completely off the canvas are skipped, the library
+    # clips the same pixels one at a time
+    if x + g.advance > 0 and x < canvas.width:
+      left = x + g.xoff
+      top = y - g.height - g.yoff
+      for px, py in lit:
+        canvas.SetPixel(left + px, top + py, color.red, color.green, color.blue)
+    x += g.advance
+
+  return x - start
+
+#==============================================================================
+# Bresenham line
+def DrawLine(canvas, x1, y1, x2, y2, color):
+  dx = abs(x2 - x1)
+  dy = -abs(y2 - y1)
+  sx = 1 if x1 < x2 else -1
+  sy = 1 if y1 < y2 else -1
+  err = dx + dy
+  while True:
+    canvas.SetPixel(x1, y1, color.red, color.green, color.blue)
+    if x1 == x2 and y1 == y2:
+      break
+    e2 = 2 * err
+    if e2 >= dy:
+      err += dy
+      x1 += sx
+    if e2 <= dx:
+      err += dx
+      y1 += sy
+
+#==============================================================================
+# midpoint circle
+def DrawCircle(canvas, x, y, radius, color):
+  r = color.red
+  g = color.green
+  b = color.blue
+  dx = radius
+  dy = 0
+  err = 1 - radius
+  while dy <= dx:
+    for px, py in ((dx, dy), (dy, dx), (-dy, dx), (-dx, dy), (-dx, -dy), (-dy, -dx), (dy, -dx), (dx, -dy)):
+      canvas.SetPixel(x + px, y + py, r, g, b)
+    dy += 1
+    if err < 0:
+      err += 2 * dy + 1
+    else:
+      dx -= 1
+      err += 2 * (dy - dx) + 1
@@ -0,0 +1,158 @@
+# Headless emulation of the Henner Zeller RGBMatrix for running the scrolling
+# sign without a HUB75 panel, on a Linux dev box or in CI. Select it from the
+# command line with; python RGB-32x64.py --led-backend emulator
+
+# The emulated matrix keeps every canvas in memory. Each frame that is passed
+# to SwapOnVSync can be read back as an array (a NumPy array when NumPy is
+# installed, otherwise a bytearray of RGB triples), so frame times, CPU use and
+# the drawn pixels can be checked.
+
+import time
+
+import emugraphics as graphics
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+#==============================================================================
+# raised by SwapOnVSync after the requested number of frames has been shown.
+# it stops the sign the same way as CTRL-C does
+class FramesDone(KeyboardInterrupt):
+  pass
+
+#==============================================================================
+# same option names as rgbmatrix.RGBMatrixOptions. options that only matter to
+# the hardware are accepted and ignored.
+class RGBMatrixOptions(object):
+  def __init__(self):
+    self.rows = 32
+    self.cols = 32
+    self.chain_length = 1
+    self.parallel = 1
+    self.pwm_bits = 11
+    self.brightness = 100
+    self.pwm_lsb_nanoseconds = 130
+    self.hardware_mapping = 'regular'
+    self.show_refresh_rate = 0
+    self.gpio_slowdown = 1
+    self.disable_hardware_pulsing = False
+
+#==============================================================================
+# an off-screen canvas. pixels are stored as RGB triples, row by row.
+class EmulatedCanvas(object):
+  def __init__(self, width, height):
+    self.width = width
+    self.height = height
+    self.pixels = bytearray(width * height * 3)
+
+  def SetPixel(self, x, y, red, green, blue):
+    if 0 <= x < self.width and 0 <= y < self.height:
+      i = (y * self.width + x) * 3
+      self.pixels[i] = red & 0xFF
+      self.pixels[i + 1] = green & 0xFF
+      self.pixels[i + 2] = blue & 0xFF
+
+  def Clear(self):
+    self.pixels[:] = bytearray(len(self.pixels))
+
+  def Fill(self, red, green, blue):
+    self.pixels[:] = bytearray((red & 0xFF, green & 0xFF, blue & 0xFF)) * (self.width * self.height)
+
+  # copy an RGB mode PIL image to the canvas, clipped to the canvas
+  def SetImage(self, image, offset_x = 0, offset_y = 0, unsafe = True):
+    if image.mode != 'RGB':
+      raise Exception('Currently, only RGB mode is supported for SetImage()')
+
+    iw, ih = image.size
+    left = max(0, -offset_x)
+    right = min(iw, self.width - offset_x)
+    if right <= left:
+      return
+
+    data = image.tobytes()
+    for y in range(max(0, -offset_y), min(ih, self.height - offset_y)):
+      src = (y * iw + left) * 3
+      dst = ((y + offset_y) * self.width + offset_x + left) * 3
+      self.pixels[dst:dst + (right - left) * 3] = data[src:src + (right - left) * 3]
+
+  # return the pixel at x, y as an (r, g, b) tuple
+  def GetPixel(self, x, y):
+    i = (y * self.width + x) * 3
+    return tuple(self.pixels[i:i + 3])
+
+  # return a copy of the canvas. a height x width x 3 NumPy array when NumPy is
+  # installed, otherwise a bytearray
+  def frame(self):
+    if numpy != None:
+      return numpy.frombuffer(bytes(self.pixels), dtype = numpy.uint8).reshape((self.height, self.width, 3))
+    return bytearray(self.pixels)
+
+#==============================================================================
+# the emulated matrix. like rgbmatrix.RGBMatrix it is also a canvas, drawing on
+# it draws on the frame that is on display.
+class RGBMatrix(EmulatedCanvas):
+  def __init__(self, options = None, maxFrames = 0):
+    if options == None:
+      options = RGBMatrixOptions()
+
+    self.options = options
+    self.brightness = options.brightness
+    super(RGBMatrix, self).__init__(options.cols * options.chain_length, options.rows * options.parallel)
+
+    # stop after this many frames, 0 runs forever
+    self.maxFrames = maxFrames
+    self.frameCount = 0
+
+    # called with the matrix after each swap, use frame() to get the pixels
+    self.onFrame = []
+
+    # the canvas whose pixels are on display, it is returned by the next swap
+    self.front = None
+
+    # time between swaps
+    self.lastSwap = None
+    self.frameTimes = []
+
+  def CreateFrameCanvas(self):
+    return EmulatedCanvas(self.width, self.height)
+
+  # show a canvas. returns the canvas that was on display, which becomes the
+  # next off-screen canvas. like rgbmatrix it is another canvas object than
+  # the one passed in, with the pixels of the frame that was shown
+  def SwapOnVSync(self, canvas, framerate_fraction = 1):
+    now = time.time()
+    if self.lastSwap != None:
+      self.frameTimes.append(now - self.lastSwap)
+    self.lastSwap = now
+
+    back = self.front
+    if back == None:
+      # the first swap, the matrix showed its own buffer
+      back = EmulatedCanvas(self.width, self.height)
+      back.pixels = self.pixels
+    self.pixels = canvas.pixels
+    self.front = canvas
+
+    self.frameCount += 1
+    for callback in self.onFrame:
+      callback(self)
+
+    if self.maxFrames > 0 and self.frameCount >= self.maxFrames:
+      raise FramesDone()
+
+    return back
+
+  # return a summary of the frame times
+  def stats(self):
+    if len(self.frameTimes) == 0:
+      return 'Frames: {}'.format(self.frameCount)
+
+    ft = sorted(self.frameTimes)
+    return 'Frames: {}, frame time mean {:.2f}ms, p50 {:.2f}ms, max {:.2f}ms, {:.1f} fps'.format(
+      self.frameCount,
+      1000.0 * sum(ft) / len(ft),
+      1000.0 * ft[len(ft) // 2],
+      1000.0 * ft[-1],
+      len(ft) / sum(ft) if sum(ft) > 0 else 0.0)
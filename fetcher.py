@@ -0,0 +1,190 @@
+# Fetch engine for the scrolling sign.
+
+# Every feature (quote, jokes, weather, BME280, headlines) used to run in its
+# own thread that blocked in requests.get and then slept. On a single core Pi
+# Zero those threads fight the render loop for the GIL.
+
+# The fetch engine runs all of the refreshes from one scheduler thread and a
+# small, bounded pool of worker threads. A refresh is a plain function that
+# does one fetch and returns the number of seconds until it should run again,
+# or None to stop. Jobs that are waiting cost nothing but a heap entry, so
+# adding more feeds is cheap.
+
+# Python 2 does not have asyncio, so this is done with a heap, a queue and a
+# wake-up pipe instead of an event loop. The scheduler thread waits in select
+# on the pipe. A Python 2 Condition.wait with a timeout polls every 50ms,
+# select sleeps in the kernel until the next job is due.
+
+import errno
+import fcntl
+import heapq
+import itertools
+import os
+import Queue
+import select
+import threading
+import traceback
+
+from timing import monotonic
+
+#==============================================================================
+# one scheduled refresh
+class Job(object):
+  def __init__(self, name, fn, interval, repeat = True):
+    self.name = name
+    self.fn = fn
+    # a repeating job returns the delay until its next run
+    self.repeat = repeat
+    # used when fn fails or does not say when to run next
+    self.interval = interval
+    self.due = 0.0
+    self.cancelled = False
+    self.running = False
+    self.runs = 0
+    self.failures = 0
+    self.result = None
+    self.error = None
+    self.done = threading.Event()
+
+  # wait for the job to finish its current or next run. returns the result
+  def wait(self, timeout = None):
+    self.done.wait(timeout)
+    return self.result
+
+#==============================================================================
+class FetchEngine(object):
+  def __init__(self, maxConcurrent = 2):
+    self.maxConcurrent = maxConcurrent
+    self.heap = []
+    self.seq = itertools.count()
+    self.lock = threading.Lock()
+    self.wakeRead, self.wakeWrite = os.pipe()
+    fcntl.fcntl(self.wakeWrite, fcntl.F_SETFL, os.O_NONBLOCK)
+    self.ready = Queue.Queue()
+    self.threads = []
+    self.stopping = False
+    # set by the profiler, see profiler.py, to profile the jobs
+    self.profiler = None
+
+  # start the scheduler thread and the worker threads
+  def start(self):
+    t = threading.Thread(target = self.dispatch, name = 'fetch-scheduler')
+    t.daemon = True
+    t.start()
+    self.threads.append(t)
+
+    for i in range(self.maxConcurrent):
+      t = threading.Thread(target = self.work, name = 'fetch-worker-{}'.format(i))
+      t.daemon = True
+      t.start()
+      self.threads.append(t)
+
+  # stop all threads. jobs that are running finish their current fetch.
+  def stop(self, timeout = None):
+    with self.lock:
+      self.stopping = True
+    self.wake()
+
+    for i in range(self.maxConcurrent):
+      self.ready.put(None)
+
+    for t in self.threads:
+      t.join(timeout)
+    del self.threads[:]
+
+  # run fn after delay seconds. fn returns the seconds until its next run or
+  # None when it is done. interval is the retry delay when fn raises, None
+  # does not retry.
+  def schedule(self, fn, delay = 0, interval = None, name = None):
+    job = Job(name or fn.__name__, fn, interval)
+    self.push(job, delay)
+    return job
+
+  # run fn once, as soon as a worker is free. the job result is what fn
+  # returns, use job.wait() to get it
+  def submit(self, fn, name = None):
+    job = Job(name or fn.__name__, fn, None, False)
+    self.push(job, 0)
+    return job
+
+  # cancel a job. a job that is running finishes but is not run again.
+  def cancel(self, job):
+    with self.lock:
+      job.cancelled = True
+    self.wake()
+
+  # return (name, seconds until due, running) for each scheduled job
+  def jobs(self):
+    now = monotonic()
+    with self.lock:
+      return [(job.name, max(0.0, due - now), job.running) for due, n, job in sorted(self.heap) if not job.cancelled]
+
+  def push(self, job, delay):
+    with self.lock:
+      job.due = monotonic() + delay
+      heapq.heappush(self.heap, (job.due, next(self.seq), job))
+    self.wake()
+
+  # wake up the scheduler thread so it looks at the heap again
+  def wake(self):
+    try:
+      os.write(self.wakeWrite, 'x')
+    except OSError as e:
+      # a full pipe will wake it up anyway
+      if e.errno != errno.EAGAIN:
+        raise
+
+  # scheduler thread. moves jobs that are due to the ready queue
+  def dispatch(self):
+    while True:
+      with self.lock:
+        if self.stopping:
+          return
+
+        # drop cancelled jobs
+        while len(self.heap) > 0 and self.heap[0][2].cancelled:
+          heapq.heappop(self.heap)
+
+        job = None
+        wait = None
+        if len(self.heap) > 0:
+          wait = self.heap[0][0] - monotonic()
+          if wait <= 0:
+            due, n, job = heapq.heappop(self.heap)
+            job.running = True
+
+      if job != None:
+        # jobs wait in the ready queue until a worker is free
+        self.ready.put(job)
+      elif len(select.select([self.wakeRead], [], [], wait)[0]) > 0:
+        os.read(self.wakeRead, 512)
+
+  # worker thread. runs jobs and reschedules them
+  def work(self):
+    while True:
+      job = self.ready.get()
+      if job == None:
+        return
+
+      job.done.clear()
+      delay = job.interval
+      try:
+        profiler = self.profiler
+        if profiler != None:
+          job.result = profiler.run(job.fn)
+        else:
+          job.result = job.fn()
+        job.error = None
+        delay = job.result if job.repeat else None
+      except Exception as e:
+        job.failures += 1
+        job.error = e
+        print 'Fetch job {} failed: {}'.format(job.name, e)
+        traceback.print_exc()
+
+      job.runs += 1
+      job.running = False
+      job.done.set()
+
+      if delay != None and not job.cancelled and not self.stopping:
+        self.push(job, delay)
@@ -0,0 +1,215 @@
+# Conditional GET and on-disk response cache for the feed fetches.
+
+# The joke, quote, weather and headline pages used to be downloaded in full
+# every cycle over a weak WiFi link. The cache keeps the ETag and Last-Modified
+# validators of each URL and sends If-None-Match and If-Modified-Since with the
+# next request. When the server answers 304 Not Modified, the message list that
+# was parsed from the last page is reused and the page is not parsed again.
+
+# Each URL has two files in the cache directory, named by the SHA1 of the URL;
+#   <sha1>.json   url, validators and the parsed messages
+#   <sha1>.body   the last page, so it can be parsed again if needed
+# The cache is capped in bytes. Least recently used URLs are dropped first.
+
+# Parsed messages are lists of [color, text]. Colors are stored as RGB values
+# and turned back into colors with the makeColor function.
+
+import hashlib
+import json
+import os
+import threading
+
+import requests
+
+from timing import monotonic
+
+#==============================================================================
+# turn parsed messages into something json can store. anything with red, green
+# and blue attributes is a color
+def encodeParsed(value):
+  if isinstance(value, (list, tuple)):
+    return [encodeParsed(v) for v in value]
+  if hasattr(value, 'red') and hasattr(value, 'green') and hasattr(value, 'blue'):
+    return {'rgb': [value.red, value.green, value.blue]}
+  return value
+
+def decodeParsed(value, makeColor):
+  if isinstance(value, list):
+    return [decodeParsed(v, makeColor) for v in value]
+  if isinstance(value, dict) and 'rgb' in value:
+    return makeColor(*value['rgb'])
+  return value
+
+#==============================================================================
+class HttpCache(object):
+  def __init__(self, directory = 'cache/http', maxBytes = 4 * 1024 * 1024, makeColor = None, get = requests.get, metrics = None):
+    self.directory = directory
+    self.maxBytes = maxBytes
+    self.makeColor = makeColor
+    self.get = get
+    self.lock = threading.Lock()
+
+    # fetch and parse times by source, see metrics.py
+    self.metrics = metrics
+    if metrics != None:
+      metrics.histogram('sign_http_fetch_seconds', 'Time to get a page, including retries.')
+      metrics.histogram('sign_http_parse_seconds', 'Time to parse a page into messages.')
+      metrics.counter('sign_http_cache_total', 'Fetches by result; hit (304), miss (200) or error.')
+
+    # statistics
+    self.hits = 0           # 304 answers
+    self.misses = 0         # full pages
+
+    # key -> [last used, bytes on disk]
+    self.index = {}
+    # key -> parsed messages, so a 304 does not need to read the disk
+    self.parsed = {}
+
+    try:
+      if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+      for name in os.listdir(directory):
+        key, ext = os.path.splitext(name)
+        if ext not in ('.json', '.body'):
+          continue
+        st = os.stat(os.path.join(directory, name))
+        entry = self.index.setdefault(key, [0, 0])
+        entry[0] = max(entry[0], st.st_mtime)
+        entry[1] += st.st_size
+    except (IOError, OSError):
+      print 'Unable to use HTTP cache directory: ' + directory
+
+  def key(self, url):
+    if isinstance(url, unicode):
+      url = url.encode('utf-8')
+    return hashlib.sha1(url).hexdigest()
+
+  def path(self, key, ext):
+    return os.path.join(self.directory, key + ext)
+
+  # load the stored entry for a key, None when there is none
+  def load(self, key):
+    try:
+      with open(self.path(key, '.json'), 'r') as f:
+        return json.load(f)
+    except (IOError, OSError, ValueError):
+      return None
+
+  # read the stored page for a key
+  def body(self, key):
+    try:
+      with open(self.path(key, '.body'), 'rb') as f:
+        return f.read().decode('utf-8')
+    except (IOError, OSError):
+      return None
+
+  # write a file atomically, returns its size
+  def write(self, name, data):
+    tmp = name + '.tmp'
+    with open(tmp, 'wb') as f:
+      f.write(data)
+    os.rename(tmp, name)
+    return len(data)
+
+  def store(self, key, meta, text):
+    try:
+      size = self.write(self.path(key, '.body'), text.encode('utf-8'))
+      size += self.write(self.path(key, '.json'), json.dumps(meta))
+    except (IOError, OSError, TypeError, ValueError):
+      print 'Unable to write HTTP cache entry for ' + meta['url']
+      return
+
+    with self.lock:
+      self.index[key] = [os.path.getmtime(self.path(key, '.json')), size]
+      self.trim(key)
+
+  # mark a key as recently used
+  def touch(self, key):
+    try:
+      os.utime(self.path(key, '.json'), None)
+    except OSError:
+      pass
+    with self.lock:
+      if key in self.index:
+        self.index[key][0] = os.path.getmtime(self.path(key, '.json'))
+
+  # drop least recently used entries until the cache fits. keep is never
+  # dropped. called with the lock held
+  def trim(self, keep):
+    total = sum(size for used, size in self.index.values())
+    for used, key in sorted((e[0], k) for k, e in self.index.items()):
+      if total <= self.maxBytes:
+        break
+      if key == keep:
+        continue
+      total -= self.index.pop(key)[1]
+      self.parsed.pop(key, None)
+      for ext in ('.json', '.body'):
+        try:
+          os.remove(self.path(key, ext))
+        except OSError:
+          pass
+
+  def count(self, result, source):
+    if self.metrics != None:
+      self.metrics.inc('sign_http_cache_total', result = result, source = source)
+
+  # get a URL and parse it. parse is called with the page text and returns the
+  # messages. returns (status code, messages). messages is None when the
+  # status is not 200 or 304. on 304 the messages from the last page are
+  # returned without parsing. kwargs are passed on to the get function.
+  def fetch(self, url, parse, **kwargs):
+    key = self.key(url)
+    meta = None
+    if key in self.index:
+      meta = self.load(key)
+
+    headers = dict(kwargs.pop('headers', {}))
+    headers['Accept-Encoding'] = 'gzip, deflate'
+    if meta != None:
+      if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+      if meta.get('lastModified'):
+        headers['If-Modified-Since'] = meta['lastModified']
+
+    source = kwargs.get('source') or 'default'
+    start = monotonic()
+    r = self.get(url, headers = headers, **kwargs)
+    if self.metrics != None:
+      self.metrics.observe('sign_http_fetch_seconds', monotonic() - start, source = source)
+
+    if 304 == r.status_code and meta != None:
+      self.hits += 1
+      self.count('hit', source)
+      self.touch(key)
+      parsed = self.parsed.get(key)
+      if parsed == None:
+        if 'parsed' in meta:
+          parsed = decodeParsed(meta['parsed'], self.makeColor)
+        else:
+          parsed = parse(self.body(key) or u'')
+        self.parsed[key] = parsed
+      return 304, parsed
+
+    if 200 != r.status_code:
+      self.count('error', source)
+      return r.status_code, None
+
+    self.misses += 1
+    self.count('miss', source)
+    start = monotonic()
+    parsed = parse(r.text)
+    if self.metrics != None:
+      self.metrics.observe('sign_http_parse_seconds', monotonic() - start, source = source)
+
+    meta = {'url': url,
+            'etag': r.headers.get('ETag'),
+            'lastModified': r.headers.get('Last-Modified'),
+            'parsed': encodeParsed(parsed)}
+    # nothing to validate with, no point in keeping it
+    if meta['etag'] or meta['lastModified']:
+      self.parsed[key] = parsed
+      self.store(key, meta, r.text)
+
+    return 200, parsed
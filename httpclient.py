@@ -0,0 +1,148 @@
+# Shared keep-alive HTTP client for the feed fetches.
+
+# Each fetch used to call a bare requests.get, so every refresh did a new DNS
+# lookup and a new TCP and TLS handshake, and a server that never answered
+# blocked its worker forever. All fetches now go through one requests Session.
+# Its connection pools are kept per host, so connections are reused between
+# refreshes.
+
+# Each source (jokes, quote, weather, news) has its own connect and read
+# timeouts, a cap on the size of the response and a number of retries with
+# exponential backoff. Counters show how many connections were reused and how
+# many bytes were transferred.
+
+import threading
+import time
+
+import requests
+import requests.adapters
+
+#==============================================================================
+# raised when a response is larger than the cap of its source
+class ResponseTooLarge(requests.exceptions.RequestException):
+  pass
+
+# names of the settings of a source
+SETTINGS = ('connectTimeout', 'readTimeout', 'maxBytes', 'retries', 'backoff')
+
+#==============================================================================
+# settings for one source
+class Source(object):
+  def __init__(self, connectTimeout = 10.0, readTimeout = 30.0, maxBytes = 2 * 1024 * 1024, retries = 2, backoff = 2.0):
+    self.connectTimeout = connectTimeout
+    self.readTimeout = readTimeout
+    self.maxBytes = maxBytes
+    self.retries = retries
+    self.backoff = backoff
+    # settings that were set for this source, not taken from the default
+    self.overridden = set()
+
+    # statistics
+    self.requests = 0
+    self.failures = 0
+    self.bytes = 0
+
+#==============================================================================
+class HttpClient(object):
+  def __init__(self, hosts = 8, connectionsPerHost = 2, sleep = time.sleep):
+    self.session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections = hosts, pool_maxsize = connectionsPerHost)
+    self.session.mount('http://', adapter)
+    self.session.mount('https://', adapter)
+    self.adapter = adapter
+    self.sleep = sleep
+    self.lock = threading.Lock()
+
+    self.default = Source()
+    self.sources = {}
+
+  # change the settings of a source. a new source starts with the settings of
+  # the default source. changes to the default source also change the
+  # settings that the other sources have not set themselves
+  def configure(self, source = None, **settings):
+    for name in settings:
+      if name not in SETTINGS:
+        raise ValueError('Unknown HTTP setting: ' + name)
+
+    if source == None:
+      for name, value in settings.items():
+        setattr(self.default, name, value)
+        for s in self.sources.values():
+          if name not in s.overridden:
+            setattr(s, name, value)
+      return
+
+    s = self.sources.get(source)
+    if s == None:
+      d = self.default
+      s = Source(d.connectTimeout, d.readTimeout, d.maxBytes, d.retries, d.backoff)
+      self.sources[source] = s
+
+    for name, value in settings.items():
+      setattr(s, name, value)
+      s.overridden.add(name)
+
+  # get a URL. same arguments and result as requests.get, plus the name of the
+  # source whose settings are used. connection errors, timeouts and server
+  # errors (5xx) are retried, waiting backoff, 2 * backoff, 4 * backoff...
+  # seconds between tries.
+  def get(self, url, source = None, **kwargs):
+    s = self.sources.get(source, self.default)
+    kwargs.setdefault('timeout', (s.connectTimeout, s.readTimeout))
+
+    attempt = 0
+    while True:
+      with self.lock:
+        s.requests += 1
+      try:
+        r = self.read(self.session.get(url, stream = True, **kwargs), s.maxBytes)
+        if r.status_code < 500 or attempt >= s.retries:
+          with self.lock:
+            s.bytes += len(r.content)
+          return r
+      except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        with self.lock:
+          s.failures += 1
+        if attempt >= s.retries:
+          raise
+
+      self.sleep(s.backoff * (1 << attempt))
+      attempt += 1
+
+  # read the body of a streamed response, up to maxBytes
+  def read(self, r, maxBytes):
+    chunks = []
+    size = 0
+    try:
+      for chunk in r.iter_content(16384):
+        size += len(chunk)
+        if size > maxBytes:
+          raise ResponseTooLarge('Response from {} is larger than {} bytes'.format(r.url, maxBytes))
+        chunks.append(chunk)
+    finally:
+      r.close()
+
+    # requests returns this from r.content and r.text
+    r._content = ''.join(chunks)
+    return r
+
+  # return (connections made, requests sent) over all host pools. requests
+  # minus connections is the number of requests that reused a connection
+  def connections(self):
+    made = 0
+    sent = 0
+    pools = self.adapter.poolmanager.pools
+    for key in pools.keys():
+      pool = pools.get(key)
+      if pool != None:
+        made += pool.num_connections
+        sent += pool.num_requests
+    return made, sent
+
+  # return a one line summary of the counters
+  def report(self):
+    made, sent = self.connections()
+    sources = [('default', self.default)] + sorted(self.sources.items())
+    return 'HTTP: {} requests, {} connections, {} reused, {}'.format(
+      sent, made, sent - made,
+      ', '.join('{} {} bytes {} failed'.format(name, s.bytes, s.failures) for name, s in sources if s.requests > 0))
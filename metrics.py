@@ -0,0 +1,319 @@
+# Runtime metrics for the scrolling sign.
+
+# The only way to see what a running sign was doing used to be its print
+# output. Metrics keeps counters, gauges and histograms that the render loop,
+# the providers, the HTTP cache and the feeds update as they run, and exports
+# them two ways:
+#   - Prometheus text format on a local HTTP server, /metrics
+#     (and the same data as JSON on /metrics.json)
+#   - a JSON file written every minute, for signs that are not scraped
+# Process RSS, CPU time, the SoC temperature and the CPU clock are read from
+# /proc and /sys when the metrics are exported, so frame time regressions can
+# be matched with thermal throttling.
+# With --render-process the content process sends its values to the render
+# process every few seconds, see merge, and the render process exports both.
+
+import bisect
+import json
+import os
+import threading
+import time
+
+# histogram buckets in seconds
+FRAME_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.015, 0.02, 0.025, 0.033, 0.05, 0.1, 0.25)
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+#==============================================================================
+# one metric with a value for each set of labels
+class Metric(object):
+  def __init__(self, name, help, type, buckets = None):
+    self.name = name
+    self.help = help
+    self.type = type
+    self.buckets = buckets
+    # sorted label items -> value, or [bucket counts, sum, count]
+    self.values = {}
+
+#==============================================================================
+def escape(value):
+  return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def labelText(labels, extra = ()):
+  items = list(labels) + list(extra)
+  if len(items) == 0:
+    return ''
+  return '{' + ','.join('{}="{}"'.format(k, escape(v)) for k, v in items) + '}'
+
+def number(value):
+  if value == float('inf'):
+    return '+Inf'
+  return repr(float(value))
+
+#==============================================================================
+class Metrics(object):
+  def __init__(self, clock = time.time):
+    self.clock = clock
+    self.lock = threading.Lock()
+    self.metrics = {}
+    self.order = []
+    # functions called before the metrics are exported, to update gauges
+    self.collectors = []
+    self.server = None
+    # name -> values of another process, see merge
+    self.remote = {}
+
+  def declare(self, name, help, type, buckets = None):
+    with self.lock:
+      if name not in self.metrics:
+        self.metrics[name] = Metric(name, help, type, buckets)
+        self.order.append(name)
+      return self.metrics[name]
+
+  def counter(self, name, help):
+    return self.declare(name, help, 'counter')
+
+  def gauge(self, name, help):
+    return self.declare(name, help, 'gauge')
+
+  def histogram(self, name, help, buckets = LATENCY_BUCKETS):
+    return self.declare(name, help, 'histogram', tuple(sorted(buckets)))
+
+  # add to a counter
+  def inc(self, name, amount = 1, **labels):
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      m = self.metrics[name]
+      m.values[key] = m.values.get(key, 0) + amount
+
+  # set a gauge
+  def set(self, name, value, **labels):
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      self.metrics[name].values[key] = value
+
+  # add one observation to a histogram
+  def observe(self, name, value, **labels):
+    key = tuple(sorted(labels.items()))
+    with self.lock:
+      m = self.metrics[name]
+      h = m.values.get(key)
+      if h == None:
+        h = [[0] * (len(m.buckets) + 1), 0.0, 0]
+        m.values[key] = h
+      h[0][bisect.bisect_left(m.buckets, value)] += 1
+      h[1] += value
+      h[2] += 1
+
+  # forget all values. the copy a forked process has starts from zero
+  def reset(self):
+    with self.lock:
+      for m in self.metrics.values():
+        m.values = {}
+      self.remote = {}
+
+  # the metrics that have values, as (name, help, type, buckets, values) for
+  # merge in another process. the histograms are copied, the list is sent
+  # after the lock is let go
+  def values(self):
+    self.collect()
+    with self.lock:
+      result = []
+      for name in self.order:
+        m = self.metrics[name]
+        if len(m.values) == 0:
+          continue
+        values = dict(m.values)
+        if m.type == 'histogram':
+          values = dict((key, [list(h[0]), h[1], h[2]]) for key, h in values.items())
+        result.append((name, m.help, m.type, m.buckets, values))
+      return result
+
+  # the values of another process, in place of the ones it sent before.
+  # exported counters and histograms are the sum of both processes. a gauge
+  # of the other process is shown as it is, the process gauges of this one
+  # are kept
+  def merge(self, values):
+    for name, help, type, buckets, v in values:
+      self.declare(name, help, type, buckets)
+    with self.lock:
+      self.remote = dict((name, v) for name, help, type, buckets, v in values)
+
+  # the values of a metric with those of the other process. called with the
+  # lock held
+  def combined(self, m):
+    remote = self.remote.get(m.name)
+    if remote == None:
+      return m.values
+    values = dict(m.values)
+    for key, value in remote.items():
+      local = values.get(key)
+      if local == None:
+        values[key] = value
+      elif m.type == 'histogram':
+        values[key] = [[a + b for a, b in zip(local[0], value[0])], local[1] + value[1], local[2] + value[2]]
+      elif m.type == 'counter':
+        values[key] = local + value
+      elif m.name not in PROCESS_GAUGES:
+        values[key] = value
+    return values
+
+  def addCollector(self, fn):
+    self.collectors.append(fn)
+
+  def collect(self):
+    for fn in self.collectors:
+      try:
+        fn(self)
+      except Exception as e:
+        print 'Metrics collector failed: {}'.format(e)
+
+  # all metrics in the Prometheus text format
+  def render(self):
+    self.collect()
+    lines = []
+    with self.lock:
+      for name in self.order:
+        m = self.metrics[name]
+        lines.append('# HELP {} {}'.format(name, m.help))
+        lines.append('# TYPE {} {}'.format(name, m.type))
+        values = self.combined(m)
+        for key in sorted(values):
+          value = values[key]
+          if m.type != 'histogram':
+            lines.append('{}{} {}'.format(name, labelText(key), number(value)))
+            continue
+
+          counts, total, count = value
+          cumulative = 0
+          for le, n in zip(m.buckets + (float('inf'),), counts):
+            cumulative += n
+            lines.append('{}_bucket{} {}'.format(name, labelText(key, [('le', number(le))]), cumulative))
+          lines.append('{}_sum{} {}'.format(name, labelText(key), number(total)))
+          lines.append('{}_count{} {}'.format(name, labelText(key), count))
+    return '\n'.join(lines) + '\n'
+
+  # all metrics as a dictionary that json can store
+  def snapshot(self):
+    self.collect()
+    result = {'time': self.clock(), 'metrics': {}}
+    with self.lock:
+      for name in self.order:
+        m = self.metrics[name]
+        combined = self.combined(m)
+        values = []
+        for key in sorted(combined):
+          entry = {'labels': dict(key)}
+          if m.type == 'histogram':
+            counts, total, count = combined[key]
+            entry['buckets'] = [[le, n] for le, n in zip(list(m.buckets) + ['+Inf'], counts)]
+            entry['sum'] = total
+            entry['count'] = count
+          else:
+            entry['value'] = combined[key]
+          values.append(entry)
+        result['metrics'][name] = {'type': m.type, 'help': m.help, 'values': values}
+    return result
+
+  # write the snapshot to a JSON file atomically
+  def dump(self, filename):
+    tmp = filename + '.tmp'
+    try:
+      directory = os.path.dirname(filename)
+      if len(directory) > 0 and not os.path.isdir(directory):
+        os.makedirs(directory)
+      with open(tmp, 'w') as f:
+        json.dump(self.snapshot(), f)
+      os.rename(tmp, filename)
+    except (IOError, OSError) as e:
+      print 'Unable to write metrics to {}: {}'.format(filename, e)
+      return False
+    return True
+
+  # serve the metrics over HTTP from a daemon thread. host defaults to
+  # localhost only. the HTTP server is imported here, it is not needed to
+  # start the sign
+  def serve(self, port, host = '127.0.0.1'):
+    import BaseHTTPServer
+
+    metrics = self
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+      def do_GET(self):
+        if self.path == '/metrics':
+          body = metrics.render()
+          ctype = 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+          body = json.dumps(metrics.snapshot())
+          ctype = 'application/json'
+        else:
+          self.send_error(404)
+          return
+        self.send_response(200)
+        self.send_header('Content-Type', ctype)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      # keep the requests out of the sign's output
+      def log_message(self, format, *args):
+        pass
+
+    try:
+      self.server = BaseHTTPServer.HTTPServer((host, port), Handler)
+    except (IOError, OSError) as e:
+      print 'Unable to serve metrics on port {}: {}'.format(port, e)
+      return False
+
+    t = threading.Thread(target = self.server.serve_forever, name = 'metrics-server')
+    t.daemon = True
+    t.start()
+    return True
+
+  def close(self):
+    if self.server != None:
+      self.server.shutdown()
+      self.server.server_close()
+      self.server = None
+
+#==============================================================================
+# process and board gauges, read from /proc and /sys
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+def readFile(name):
+  try:
+    with open(name, 'r') as f:
+      return f.read()
+  except (IOError, OSError):
+    return None
+
+def collectProcess(metrics):
+  statm = readFile('/proc/self/statm')
+  if statm != None:
+    metrics.set('process_resident_memory_bytes', int(statm.split()[1]) * PAGE_SIZE)
+
+  stat = readFile('/proc/self/stat')
+  if stat != None:
+    # the fields after the command name, which may contain spaces
+    fields = stat[stat.rindex(')') + 2:].split()
+    metrics.set('process_cpu_seconds_total', (int(fields[11]) + int(fields[12])) / float(CLOCK_TICKS))
+
+  temp = readFile('/sys/class/thermal/thermal_zone0/temp')
+  if temp != None:
+    metrics.set('sign_soc_temperature_celsius', int(temp) / 1000.0)
+
+  freq = readFile('/sys/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq')
+  if freq != None:
+    metrics.set('sign_cpu_frequency_hertz', int(freq) * 1000)
+
+# gauges of the process itself; the CPU time is a counter, the time of both
+# processes is added by merge
+PROCESS_GAUGES = ('process_resident_memory_bytes', 'sign_soc_temperature_celsius', 'sign_cpu_frequency_hertz')
+
+# declare the process gauges and collect them with every export
+def addProcessMetrics(metrics):
+  metrics.gauge('process_resident_memory_bytes', 'Resident memory size in bytes.')
+  metrics.counter('process_cpu_seconds_total', 'Total user and system CPU time spent in seconds.')
+  metrics.gauge('sign_soc_temperature_celsius', 'SoC temperature from thermal zone 0.')
+  metrics.gauge('sign_cpu_frequency_hertz', 'Current clock of CPU 0, lower when throttled.')
+  metrics.addCollector(collectProcess)
@@ -0,0 +1,252 @@
+# Options of the scrolling sign, read from options.ini.
+
+# readOptions used to parse options.ini once, into about 25 globals of
+# RGB-32x64.py, and appended the joke and news URLs to lists in place. Any
+# change needed a restart, which blanks the panel and repeats the startup.
+
+# Now the file is read into an Options object that is not changed after it
+# is made; a reload makes a new one and the sign swaps it in as a whole, so a
+# refresh never sees half of the old and half of the new options. Each value
+# is checked as it is read. A bad value is reported and the value it had
+# before is kept, so a typo does not turn a feature off. Lines starting with
+# '#' are comments.
+
+# The options are grouped in sections. A reload reports which sections
+# changed, and the sign restarts only the providers of those sections, see
+# applyOptions in RGB-32x64.py. OptionsWatcher looks at the time and size of
+# the file; the sign checks it every few seconds.
+
+import os
+
+#==============================================================================
+# checks and conversions of the values. each raises ValueError for a bad value
+
+# True if the value starts with 't' or 'T', an empty value is true too
+def truefalse(value):
+  s = 't'
+  if len(value) > 0:
+    s = value[0].lower()
+  return 't' == s
+
+def text(value):
+  return value
+
+# an empty URL turns the feature off
+def url(value):
+  if len(value) > 0 and not value.startswith('http://') and not value.startswith('https://'):
+    raise ValueError('not an http or https URL')
+  return value
+
+def choice(*choices):
+  def parse(value):
+    if value not in choices:
+      raise ValueError('not one of {}'.format(', '.join(choices)))
+    return value
+  return parse
+
+def integer(low = None, high = None, choices = None):
+  return lambda value: checkRange(int(value), low, high, choices)
+
+def number(low = None, high = None):
+  return lambda value: checkRange(float(value), low, high)
+
+def checkRange(value, low = None, high = None, choices = None):
+  if low != None and value < low:
+    raise ValueError('less than {}'.format(low))
+  if high != None and value > high:
+    raise ValueError('more than {}'.format(high))
+  if choices != None and value not in choices:
+    raise ValueError('not one of {}'.format(', '.join(str(c) for c in choices)))
+  return value
+
+#==============================================================================
+class Field(object):
+  # key in options.ini, attribute of Options, section, default and the check
+  # of the value. a repeated key may be given on many lines, its value is a
+  # tuple of all of them
+  def __init__(self, key, name, section, default, parse, repeated = False):
+    self.key = key
+    self.name = name
+    self.section = section
+    self.default = default
+    self.parse = parse
+    self.repeated = repeated
+
+FIELDS = (
+  Field('military',        'military',        'clock',   False, truefalse),
+
+  # BME280 sensor enables. oversampling of each measurement and the IIR
+  # filter coefficient, 0 is off. seconds between samples
+  Field('temperature',     'temperature',     'sensor',  True,  truefalse),
+  Field('humidity',        'humidity',        'sensor',  True,  truefalse),
+  Field('pressure',        'pressure',        'sensor',  True,  truefalse),
+  Field('bmeoversampling', 'bmeOversampling', 'sensor',  1,     integer(choices = (1, 2, 4, 8, 16))),
+  Field('bmefilter',       'bmeFilter',       'sensor',  0,     integer(choices = (0, 2, 4, 8, 16))),
+  Field('bmeinterval',     'bmeInterval',     'sensor',  10.0,  number(1.0, 3600.0)),
+
+  # OpenWeatherMap calls allowed per day, each update makes two. the base of
+  # the API can point at the stub server, see stubserver.py
+  Field('weather',         'weatherEnabled',  'weather', False, truefalse),
+  Field('weatherkey',      'weatherKey',      'weather', '',    text),
+  Field('weatherzip',      'weatherZip',      'weather', '',    text),
+  Field('weatherquota',    'weatherQuota',    'weather', 1000,  integer(2)),
+  Field('weatherurl',      'weatherUrl',      'weather', 'http://api.openweathermap.org/data/2.5', lambda value: url(value).rstrip('/')),
+
+  Field('quote',           'quoteEnabled',    'quote',   False, truefalse),
+  Field('quoteurl',        'quoteUrl',        'quote',   '',    url),
+
+  # each joke URL is a different type of joke. seconds between jokes, 0 is
+  # the default of 20 minutes
+  Field('jokes',           'jokesEnabled',    'jokes',   False, truefalse),
+  Field('jokesurl',        'jokesUrls',       'jokes',   (),    url, repeated = True),
+  Field('jokedelay',       'jokesDelay',      'jokes',   3600,  integer(0)),
+
+  Field('news',            'newsEnabled',     'news',    False, truefalse),
+  Field('newsurl',         'newsUrls',        'news',    (),    url, repeated = True),
+
+  # scroll speed of each line in pixels per second
+  Field('topspeed',        'topSpeed',        'display', 40.0,  number(1.0, 1000.0)),
+  Field('bottomspeed',     'bottomSpeed',     'display', 40.0,  number(1.0, 1000.0)),
+
+  # the top line scrolls the time and the date, or shows a clock that stands
+  # still and scrolls the date and the holidays every datedelay seconds
+  Field('topline',         'topLine',         'display', 'scroll', choice('scroll', 'clock')),
+  Field('datedelay',       'dateDelay',       'display', 60.0,  number(5.0, 86400.0)),
+
+  # local port of the metrics server, 0 is off; 9180 is a free one. the file
+  # the metrics are written to every minute
+  Field('metricsport',     'metricsPort',     'metrics', 0,     integer(0, 65535)),
+  Field('metricsfile',     'metricsFile',     'metrics', 'cache/metrics.json', text),
+
+  # seconds, for all Internet requests
+  Field('connecttimeout',  'connectTimeout',  'http',    10.0,  number(0.1)),
+  Field('readtimeout',     'readTimeout',     'http',    30.0,  number(0.1)),
+  Field('retries',         'retries',         'http',    2,     integer(0, 10)),
+)
+
+KEYS = dict((f.key, f) for f in FIELDS)
+
+#==============================================================================
+class Options(object):
+  def __init__(self, values):
+    object.__setattr__(self, 'values', dict(values))
+
+  def __getattr__(self, name):
+    try:
+      return self.values[name]
+    except KeyError:
+      raise AttributeError(name)
+
+  def __setattr__(self, name, value):
+    raise AttributeError('Options can not be changed, read new ones')
+
+  def __eq__(self, other):
+    return isinstance(other, Options) and self.values == other.values
+
+  def __ne__(self, other):
+    return not self == other
+
+# the options when there is no options file
+def defaults():
+  return Options((f.name, f.default) for f in FIELDS)
+
+# names of the sections whose values differ
+def changedSections(old, new):
+  return sorted(set(f.section for f in FIELDS if getattr(old, f.name) != getattr(new, f.name)))
+
+#==============================================================================
+# read the lines of an options file. a bad value keeps its value in previous,
+# the defaults when there are none. returns the options and a list of errors
+def parseOptions(lines, previous = None):
+  if previous == None:
+    previous = defaults()
+  values = dict((f.name, f.default) for f in FIELDS)
+  # the repeated keys, listed in the order of the file
+  repeated = dict((f.name, []) for f in FIELDS if f.repeated)
+  errors = []
+
+  for n, line in enumerate(lines):
+    # GitHub strips the carriage returns, either line end may be found
+    line = line.rstrip('\r\n')
+    if len(line.strip()) == 0 or line.startswith('#'):
+      continue
+
+    # split on the first '=' only, there may be more in a URL
+    s = line.split('=', 1)
+    if len(s) != 2:
+      errors.append('line {}, no "=": {}'.format(n + 1, line))
+      continue
+    field = KEYS.get(s[0])
+    if field == None:
+      errors.append('line {}, unknown option: {}'.format(n + 1, s[0]))
+      continue
+
+    try:
+      value = field.parse(s[1])
+    except ValueError as e:
+      errors.append('line {}, bad value {}={}, {}'.format(n + 1, field.key, s[1], e))
+      if not field.repeated:
+        values[field.name] = getattr(previous, field.name)
+      continue
+
+    if field.repeated:
+      repeated[field.name].append(value)
+    else:
+      values[field.name] = value
+
+  for name, found in repeated.items():
+    if len(found) > 0:
+      values[name] = tuple(found)
+  return Options(values), errors
+
+# read an options file, the defaults when there is none
+def readOptions(filename, previous = None):
+  if not os.path.isfile(filename):
+    print 'Unable to find {} file'.format(filename)
+    return previous or defaults()
+
+  try:
+    with open(filename, 'r') as f:
+      print 'Reading options file'
+      options, errors = parseOptions(f.readlines(), previous)
+  except IOError as e:
+    print 'Failure reading options file: {}'.format(e)
+    return previous or defaults()
+
+  for error in errors:
+    print 'Error in {}: {}'.format(filename, error)
+  return options
+
+#==============================================================================
+# notices when the options file changed. check is cheap, one stat of the file
+class OptionsWatcher(object):
+  def __init__(self, filename, options):
+    self.filename = filename
+    self.options = options
+    self.stamp = self.stat()
+
+  # time, size and inode of the file. editors that save to a new file and
+  # rename it change the inode
+  def stat(self):
+    try:
+      s = os.stat(self.filename)
+    except OSError:
+      return None
+    return (s.st_mtime, s.st_size, s.st_ino)
+
+  # read the file again when it changed. returns the new options, None when
+  # the file did not change or its options are the same
+  def check(self):
+    stamp = self.stat()
+    if stamp == self.stamp:
+      return None
+    self.stamp = stamp
+    if stamp == None:
+      print 'Options file {} is gone, keeping the options'.format(self.filename)
+      return None
+
+    options = readOptions(self.filename, self.options)
+    if options == self.options:
+      return None
+    self.options = options
+    return options
@@ -0,0 +1,345 @@
+# Page parsers for the scrolling sign.
+
+# Each parser turns a downloaded page into a list of [color, text] messages.
+# They used to live in RGB-32x64.py, which cannot be imported without starting
+# the sign, so they could only be tried against the live sites. Here they can
+# be run on their own, see bench/parser_bench.py which runs them against a
+# corpus of saved pages.
+
+import bisect
+import htmlentitydefs
+import json
+import string
+import time
+
+from HTMLParser import HTMLParser
+
+from colors import randomColor
+from sensorlog import tendencyText
+
+#==============================================================================
+# Class to strip HTML tags from strings.
+
+class HTMLTextExtractor(HTMLParser):
+  def __init__(self):
+    HTMLParser.__init__(self)
+    self.result = [ ]
+
+  def handle_data(self, d):
+    self.result.append(d)
+
+  def handle_charref(self, number):
+    codepoint = int(number[1:], 16) if number[0] in (u'x', u'X') else int(number)
+    self.result.append(unichr(codepoint))
+
+  def handle_entityref(self, name):
+    codepoint = htmlentitydefs.name2codepoint[name]
+    self.result.append(unichr(codepoint))
+
+  def get_text(self):
+     return u''.join(self.result)
+
+#==============================================================================
+# Remove HTML tags from a string.
+def html_to_text(html):
+  s = HTMLTextExtractor()
+  s.feed(html)
+  return s.get_text()
+    
+#==============================================================================
+# Parse the jokes from a joke page. The parsed text is combined into one long
+# string and then broken down into displayable pieces.
+def parseJoke(page):
+  list   = []
+  flag   = 0
+  joke   = ''
+
+  color = randomColor()             
+  # split the HTML into lines
+  lines = page.splitlines()
+ 
+  for line in lines:
+    if 0 == flag:
+      if '<P>' == line:
+        flag = 1
+
+    elif 1 == flag:
+      if '<CENTER>' == line:
+        flag = 2
+
+ # this caused an issue when non-joke text was processed. contained non-ascii 
+ # characters             
+      else:
+        # strip HTML. convert to ASCII and remove all leading and trailing
+        # whitespace
+        line1 = html_to_text(line).strip().encode('ascii')
+        if len(line1) > 0:
+          # remove spaces and dashes
+          line1 = line1.strip('- ')
+          joke += ' ' + line1
+          if joke.endswith('?') or joke.endswith('.'):
+            list.append([color, joke])
+            joke = ''
+  # for
+  
+  # we found a joke.
+  if len(joke) > 0:
+    list.append([color, joke])
+
+  return list
+
+#==============================================================================
+# Parse the Quote-of-the-day page. Returns the quote and author messages.
+def parseQuote(page):
+  quote = []
+  ql = []
+
+  # split into individual lines
+  list = page.splitlines()
+        
+  for l in list:
+#    print l
+    # only interested in lines that start with 'br.writeln'
+    if l.startswith('br.writeln'):
+      # strip off the first 12 characters
+      s = l[12:]
+      # nothing of interest starts with '<b'
+      if not s.startswith('<b'):
+        # parse the quote. quote ends with '<br>'
+        if s.endswith('<br>");'):
+          quote.append(s[:s.find('<br>')])
+        
+        # parse the author.
+        pos = s.find('</a>')
+        if pos > 0:
+          quote.append(s[s.find('>') + 1:pos])
+
+  if len(quote) > 0:
+    color = randomColor()
+    if len(quote[0]) > 0:
+      ql.append([color, cleanupUnicode(quote[0])])
+
+      # add the author
+      if len(quote) > 1 and len(quote[1]) > 0:
+        ql.append([color, cleanupUnicode(quote[1])])
+    else:
+      # no quote given
+      print 'No quote found'
+  else:
+    # no quote given
+    print 'No quote found'
+
+  return ql
+
+#==============================================================================
+# make a weather message from one decoded OpenWeatherMap weather entry. the
+# current weather and each forecast entry have the same layout. change is
+# called with (pressure, time, id) for the pressure change in millibars per
+# 3 hours, see pressureChange in RGB-32x64.py. returns a list with one weather
+# message.
+def parseWeather(data, id, change = None):
+  
+  main = data.get('main', {})
+  wind = data.get('wind', {})
+
+  weather = ''
+  if len(data.get('weather', [])) > 0:
+    weather = data['weather'][0].get('description', '')
+
+  temperature = float(main.get('temp', 0.0))
+  pressure = float(main.get('pressure', 0.0))
+  humidity = float(main.get('humidity', 0.0))
+  windspeed = float(wind.get('speed', 0.0))
+  winddir = float(wind.get('deg', 0)) % 360.0
+  windgust = float(wind.get('gust', 0.0))
+
+  # accumulation is given for the last 3 hours or the last hour
+  rain = data.get('rain') or {}
+  snow = data.get('snow') or {}
+  
+  wd = []
+  # convert wind direction in degrees to text direction
+  if winddir < 22.5:
+      wdt = "North"
+  elif winddir < 67.5:
+      wdt = "Northeast"
+  elif winddir < 112.5:
+      wdt = "East"
+  elif winddir < 157.5:
+      wdt = "Southeast"
+  elif winddir < 202.5:
+      wdt = "South"
+  elif winddir < 247.5:
+      wdt = "Southwest"
+  elif winddir < 292.5:
+      wdt = "West"
+  elif winddir < 337.5:
+      wdt = "Northwest"
+  else:
+      wdt = "North"
+  
+  # ===== get outside temperature =====
+  # typical temperature: {'temp_max': 295.15, 'temp_kf': None, 'temp': 292.89, 'temp_min': 290.15}
+  # temperature is in Kelvin,
+  # Kelvin to Celsius, subtract 273.15
+  # Celsius to Fahrenheit, Tf = Tc * 9/5 + 32
+  ftc = temperature - 273.15
+  tf = int((ftc * 9.0 / 5.0) + 32.5)
+
+  # ===== combine status, temperature and humidity into a weather message =====
+  # "123456789-123456789-123456789-123456789-12345"
+  # "Weather: scattered clouds, 32.1F with 40% RH"
+  # "Forecast: scattered clouds, 32.1F with 40% RH"
+  # "Tomorrow: scattered clouds, 32.1F with 40% RH"
+  if id == 0:
+    msg = 'Weather: {}, {:.1f}F with {}% RH'.format(weather, tf, humidity)
+  elif id == 1:
+    msg = 'Forecast: {}, {:.1f}F with {}% RH'.format(weather, tf, humidity)
+  else:
+    msg = 'Tomorrow: {}, {:.1f}F with {}% RH'.format(weather, tf, humidity)
+
+  # ===== convert barometeric pressure into a weather message =====
+  # "123456789-123456789-123456789-123456789-12345"
+  # "Barometer: 996.3 millibars and rising"
+  # "Barometer: 996.3 millibars and falling"
+  msg += ', Barometer: {:.1f} millibars'.format(pressure)
+  trend = ''
+  if change != None:
+    trend = tendencyText(change(pressure, data.get('dt'), id))
+  if len(trend) > 0:
+    msg += ' and ' + trend
+
+  # ===== combine wind direction and wind speed into a weather message =====
+  # "123456789-123456789-123456789-123456789-12345"
+  # "Wind from the Northeast at 25mph"
+  msg += ', Wind from the {} at {:.1f}mph'.format(wdt, windspeed)
+  
+  if windgust > 0:
+    msg += ', Gusting to {}mph'.format(windgust)
+    
+  # ===== convert rain/snow acculation into a weather message =====
+  # "123456789-123456789-123456789-123456789-12345"
+  # "Rain amount for last 3 Hours: 12.5 inches"
+
+  if len(rain) > 0:
+    amt = float(rain.get('3h', rain.values()[0]))
+    msg += ', Rain accumulation for last 3 Hours: {:.1f} inches'.format(amt)
+
+  if len(snow) > 0:
+    amt = float(snow.get('3h', snow.values()[0]))
+    msg += ', Snow accumulation for last 3 Hours: {:.1f} inches'.format(amt)
+
+  wd.append([randomColor(), msg])
+  return wd    
+    
+#==============================================================================
+# return the forecast entry with the timestamp nearest to target. times is the
+# sorted list of the entry timestamps.
+def nearestForecast(times, entries, target):
+  i = bisect.bisect_left(times, target)
+  if i == len(times):
+    return entries[-1]
+  if i > 0 and target - times[i - 1] <= times[i] - target:
+    return entries[i - 1]
+  return entries[i]
+
+#==============================================================================
+# parse the forecast page. the page has forty forecasts, one for every 3 hours.
+# entries are indexed by their timestamp. the forecasts nearest to 3 hours and
+# 24 hours from now are used.
+def parseForecast(page, change = None, now = None):
+  entries = json.loads(page).get('list', [])
+  if len(entries) == 0:
+    return []
+
+  entries.sort(key = lambda e: e.get('dt', 0))
+  times = [e.get('dt', 0) for e in entries]
+  if now == None:
+    now = time.time()
+
+  # our 3 hour forecast
+  wd = parseWeather(nearestForecast(times, entries, now + 3 * 3600), 1, change)
+  # our 24 hour forecast
+  wd += parseWeather(nearestForecast(times, entries, now + 24 * 3600), 2, change)
+
+  return wd
+
+#==============================================================================
+# find and cleanup any Unicode
+def cleanupUnicode(str):
+  str = string.replace(str, '\u0026', '&')
+  str = string.replace(str, '&#x27;', '\'')
+  str = string.replace(str, '&#x39;', '9')
+  str = string.replace(str, '&#39;', '`')
+  return str    
+
+#==============================================================================
+# the parser for a headline URL, None when the site is unknown. parsing is
+# unique to each url
+def headlineParser(url):
+  if url.find('news.google.com') > 0:
+    # parse google headlines
+    return lambda page: parseGoogleYahoo(page, 'true","')
+  elif url.find('www.yahoo.com') > 0:
+    # parse yahoo headlines
+    return lambda page: parseGoogleYahoo(page, 'alt="')
+  elif url.find('hosted2.ap.org') > 0:
+    # parse AP headlines
+    return parseAP
+  return None
+
+#==============================================================================
+def parseGoogleYahoo(page, key):
+  list = []
+  print 'Parsing Headlines from Google or Yahoo'
+  pos = page.find(key)
+  while pos >= 0:
+    # found a headline
+    pos += len(key)
+    pos1 = page.find('"', pos)
+    if pos1 > pos:
+      # headline is from pos to pos1
+      try:
+        s = page[pos:pos1]
+        list.append([randomColor(), cleanupUnicode(s)])
+      except:
+        print 'Invalid ascii encoding'
+      
+    pos = page.find(key, pos1)
+  # while
+
+  # add the headlines to the headlines list
+  print '===== Headlines ====='
+  print 'Found {} headlines'.format(len(list))
+
+  for hl in list:
+    print hl[1]
+    
+  return list        
+
+    
+#==============================================================================
+def parseAP(page):
+  list = []
+  key = 'rel="bookmark">'  
+  print 'Parsing Headlines from AP'
+  
+  pos = page.find(key)
+  while pos >= 0:
+    # found a headline
+    pos1 = page.find('</a>', pos)
+    if pos1 > pos:
+      # headline is from pos to pos1
+      list.append([randomColor(), page[pos + len(key):pos1].encode('ascii')])
+      
+    pos = page.find(key, pos1)
+  # while
+        
+  # add the headlines to the headlines list
+  print '===== Headlines ====='
+  print 'Found {} headlines'.format(len(list))
+
+  for hl in list:
+    print hl[1]
+
+  return list
@@ -0,0 +1,121 @@
+# Lock-free message playlist for the scrolling sign.
+
+# The render loop used to read topList and bottomList while newTopList and
+# newBottomList deleted and rebuilt them in place under the dirtyLock, and
+# every fetch took the same lock to change its own list. A slow fetch could
+# stall a frame, and a list that shrank while it was being shown left the
+# render loop with an index past its end.
+
+# Each feature now publishes its messages to a Feeds object. Publishing builds
+# a new Playlist, an immutable snapshot of all the messages in display order,
+# and stores it with one assignment. Assigning an attribute is atomic in
+# Python, so the render loop only reads self.playlist and never takes a lock.
+# It keeps the snapshot it is scrolling through and looks for a newer one when
+# it gets to the end of the list. Only the publishers share a lock, so two
+# fetches that finish at the same time do not lose each other's messages.
+
+import threading
+import time
+
+from timing import monotonic
+
+#==============================================================================
+# one immutable snapshot of the messages. messages is a tuple of
+# (color, text) tuples, version counts the snapshots that were published.
+# top are the messages for the top line, when it has any
+class Playlist(object):
+  __slots__ = ('messages', 'version', 'top')
+
+  def __init__(self, messages = (), version = 0, top = ()):
+    self.messages = messages
+    self.version = version
+    self.top = top
+
+  def __len__(self):
+    return len(self.messages)
+
+  def __getitem__(self, index):
+    return self.messages[index]
+
+#==============================================================================
+# messages as an immutable tuple of (color, text) tuples
+def freeze(messages):
+  return tuple((color, text) for color, text in messages)
+
+#==============================================================================
+# the messages of each feature and the playlist made from them. compose is
+# called with a dictionary of feature name -> tuple of messages and returns
+# the messages of the playlist in display order. the default is all of the
+# features in the order they were given. composeTop returns the top line
+# messages the same way, the default is none. with metrics, see metrics.py, the
+# time publishers wait for each other and the time to build a playlist are
+# recorded.
+class Feeds(object):
+  def __init__(self, names, compose = None, metrics = None, composeTop = None):
+    self.names = tuple(names)
+    self.lists = dict((name, ()) for name in self.names)
+    # time each feature last published, None when it has not
+    self.published = dict((name, None) for name in self.names)
+    self.compose = compose or self.concatenate
+    self.composeTop = composeTop
+    self.lock = threading.Lock()
+    self.playlist = Playlist()
+
+    self.metrics = metrics
+    if metrics != None:
+      metrics.counter('sign_feed_lock_wait_seconds_total', 'Time publishers spent waiting for the feeds lock.')
+      metrics.counter('sign_feed_publish_total', 'Message lists published by each feed.')
+      metrics.histogram('sign_playlist_build_seconds', 'Time to build a new playlist snapshot.', (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05))
+      metrics.gauge('sign_playlist_messages', 'Messages in the current playlist.')
+
+  def concatenate(self, lists):
+    messages = ()
+    for name in self.names:
+      messages += lists[name]
+    return messages
+
+  # replace the messages of one feature and publish a new playlist. when is
+  # the time the messages were made, now by default
+  def publish(self, name, messages, when = None):
+    if name not in self.lists:
+      raise KeyError('Unknown feed: ' + name)
+
+    messages = freeze(messages)
+    if when == None:
+      when = time.time()
+    start = monotonic()
+    with self.lock:
+      locked = monotonic()
+      self.lists[name] = messages
+      self.published[name] = when
+      self.build()
+      built = monotonic()
+
+    if self.metrics != None:
+      self.metrics.inc('sign_feed_lock_wait_seconds_total', locked - start)
+      self.metrics.inc('sign_feed_publish_total', feed = name)
+      self.metrics.observe('sign_playlist_build_seconds', built - locked)
+      self.metrics.set('sign_playlist_messages', len(self.playlist))
+
+  # build the playlist again from the current messages. call this when
+  # something that compose depends on has changed
+  def rebuild(self):
+    with self.lock:
+      self.build()
+
+  # called with the lock held
+  def build(self):
+    lists = dict(self.lists)
+    top = ()
+    if self.composeTop != None:
+      top = freeze(self.composeTop(lists))
+    self.playlist = Playlist(freeze(self.compose(lists)), self.playlist.version + 1, top)
+
+  # messages of one feature
+  def get(self, name):
+    return self.lists[name]
+
+  # (name, messages, time published) of each feature
+  def items(self):
+    with self.lock:
+      return [(name, self.lists[name], self.published[name]) for name in self.names]
@@ -0,0 +1,209 @@
+# Profiler mode for the scrolling sign.
+
+# When the scroll stutters the cause may be drawing in the render loop, the
+# parsing of a page on a fetch worker, or the garbage collector. With
+# --profile the sign profiles itself for a number of frames or seconds:
+#   cprofile  cProfile on the render thread and on every job a fetch worker
+#             runs, written as <thread>.pstats for pstats or snakeviz, plus
+#             the sampled stacks below
+#   sample    only a sampling profiler; a thread that looks at the stack of
+#             every other thread with sys._current_frames() every few
+#             milliseconds. the overhead is low enough to leave the frame rate
+#             alone
+# The sampled stacks are written as <thread>.folded, one collapsed stack and
+# its count per line, the input of flamegraph.pl and speedscope.
+
+# Nothing here runs unless --profile is given. The render loop and the fetch
+# workers only check whether a profiler is set.
+
+import cProfile
+import os
+import re
+import sys
+import threading
+
+from timing import monotonic
+
+#==============================================================================
+# parse a --profile value; '500' is 500 frames, '30s' is 30 seconds. returns
+# (frames, seconds), one of them is None
+def parseLength(text):
+  m = re.match(r'^\s*(\d+(?:\.\d+)?)\s*(s|f)?\s*$', text)
+  if m == None:
+    raise ValueError('Bad profile length: ' + text)
+  if m.group(2) == 's':
+    return None, float(m.group(1))
+  return int(float(m.group(1))), None
+
+# a name that can be used in a file name
+def fileName(name):
+  return re.sub(r'[^A-Za-z0-9_.-]', '_', name)
+
+#==============================================================================
+# samples the stacks of all other threads every interval seconds
+class Sampler(object):
+  def __init__(self, interval = 0.005):
+    self.interval = interval
+    # thread name -> {collapsed stack: count}
+    self.stacks = {}
+    self.samples = 0
+    self.stopping = threading.Event()
+    self.thread = None
+
+  def start(self):
+    self.thread = threading.Thread(target = self.sample, name = 'profiler')
+    self.thread.daemon = True
+    self.thread.start()
+
+  def stop(self):
+    self.stopping.set()
+    if self.thread != None:
+      self.thread.join()
+      self.thread = None
+
+  def sample(self):
+    me = threading.current_thread().ident
+    while not self.stopping.wait(self.interval):
+      names = dict((t.ident, t.name) for t in threading.enumerate())
+      for ident, frame in sys._current_frames().items():
+        if ident == me:
+          continue
+        calls = []
+        while frame != None:
+          code = frame.f_code
+          calls.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+          frame = frame.f_back
+        calls.reverse()
+        stack = ';'.join(calls)
+        counts = self.stacks.setdefault(names.get(ident, str(ident)), {})
+        counts[stack] = counts.get(stack, 0) + 1
+      self.samples += 1
+
+  # write <thread>.folded for each thread, returns the file names
+  def write(self, directory):
+    files = []
+    for name, counts in sorted(self.stacks.items()):
+      filename = os.path.join(directory, fileName(name) + '.folded')
+      with open(filename, 'w') as f:
+        for stack, count in sorted(counts.items()):
+          f.write('{} {}\n'.format(stack, count))
+      files.append(filename)
+    return files
+
+#==============================================================================
+class Profiler(object):
+  # frames or seconds is how long to profile. mode is 'cprofile' or 'sample'
+  def __init__(self, frames = None, seconds = None, mode = 'cprofile', directory = 'profile', interval = 0.005, clock = monotonic):
+    if mode not in ('cprofile', 'sample'):
+      raise ValueError('Unknown profile mode: ' + mode)
+    self.frames = frames
+    self.seconds = seconds
+    self.mode = mode
+    self.directory = directory
+    self.clock = clock
+    self.sampler = Sampler(interval)
+    # thread name -> cProfile.Profile
+    self.profiles = {}
+    # names of the threads that are inside run()
+    self.active = set()
+    self.lock = threading.Lock()
+    self.engine = None
+    self.frameCount = 0
+    self.started = None
+    self.running = False
+
+  # start profiling. called from the render thread. fetch jobs run by the
+  # engine are profiled too
+  def start(self, engine = None):
+    self.started = self.clock()
+    self.running = True
+    self.sampler.start()
+    if self.mode == 'cprofile':
+      self.profile().enable()
+      if engine != None:
+        self.engine = engine
+        engine.profiler = self
+    print 'Profiling ({}) for {}'.format(self.mode, '{} frames'.format(self.frames) if self.frames else '{} seconds'.format(self.seconds))
+
+  # the cProfile.Profile of the current thread
+  def profile(self):
+    name = threading.current_thread().name
+    with self.lock:
+      p = self.profiles.get(name)
+      if p == None:
+        p = cProfile.Profile()
+        self.profiles[name] = p
+      return p
+
+  # run fn under the profile of the current thread. used by fetch workers.
+  # a job that is still running when the profiler stops writes its own
+  # profile when it is done
+  def run(self, fn):
+    if not self.running:
+      return fn()
+
+    name = threading.current_thread().name
+    p = self.profile()
+    with self.lock:
+      self.active.add(name)
+    try:
+      return p.runcall(fn)
+    finally:
+      with self.lock:
+        self.active.discard(name)
+      if not self.running:
+        self.dump(name, p)
+
+  # count a frame. called from the render thread once per frame. stops and
+  # writes the results when done, then returns True
+  def frame(self):
+    self.frameCount += 1
+    if self.frames != None and self.frameCount < self.frames:
+      return False
+    if self.seconds != None and self.clock() - self.started < self.seconds:
+      return False
+    self.stop()
+    return True
+
+  def stop(self):
+    if not self.running:
+      return
+    self.running = False
+    if self.mode == 'cprofile':
+      self.profile().disable()
+      if self.engine != None:
+        self.engine.profiler = None
+    self.sampler.stop()
+    self.write()
+
+  # write the pstats and folded stack files
+  def write(self):
+    try:
+      if not os.path.isdir(self.directory):
+        os.makedirs(self.directory)
+
+      files = self.sampler.write(self.directory)
+    except (IOError, OSError) as e:
+      print 'Unable to write profile to {}: {}'.format(self.directory, e)
+      return
+
+    with self.lock:
+      profiles = [(name, p) for name, p in sorted(self.profiles.items()) if name not in self.active]
+    for name, p in profiles:
+      files.append(self.dump(name, p))
+
+    elapsed = self.clock() - self.started
+    print 'Profiled {} frames in {:.1f}s, {} stack samples'.format(self.frameCount, elapsed, self.sampler.samples)
+    for filename in files:
+      if filename != None:
+        print '  ' + filename
+
+  # write the pstats file of one thread, returns its name
+  def dump(self, name, p):
+    filename = os.path.join(self.directory, fileName(name) + '.pstats')
+    try:
+      p.dump_stats(filename)
+    except (IOError, OSError) as e:
+      print 'Unable to write profile {}: {}'.format(filename, e)
+      return None
+    return filename
@@ -0,0 +1,212 @@
+# Content providers for the scrolling sign.
+
+# The refresh periods used to be hard-coded in each refresh function, and every
+# refresh started as soon as the sign booted, so they all hit the network at
+# the same time and could not be coordinated.
+
+# A provider wraps one of the refresh functions. The registry runs all of the
+# providers on the fetch engine, whose scheduler is a heap of due times, and
+# decides when each one runs again:
+#   interval   seconds between runs, or a function that returns them
+#   jitter     runs are moved by up to +/- this fraction of the interval, so
+#              providers with the same interval drift apart
+#   quota      most runs allowed per quotaPeriod seconds, for APIs with a
+#              daily budget. cost is the number of calls one run makes
+#   backoff    after a failure the provider runs again after retry seconds,
+#              doubling with each failure in a row, up to maxBackoff
+# The refresh function returns False when it failed, anything else is
+# success. An exception is a failure too. Providers may be added and removed
+# while the registry runs, when the options change.
+
+import random
+import threading
+import traceback
+from collections import deque
+
+from timing import monotonic
+
+#==============================================================================
+class Provider(object):
+  def __init__(self, name, fn, interval, jitter = 0.1, quota = 0, quotaPeriod = 86400, cost = 1, retry = 60, maxBackoff = None):
+    self.name = name
+    self.fn = fn
+    self.interval = interval
+    self.jitter = jitter
+    self.quota = quota
+    self.quotaPeriod = quotaPeriod
+    self.cost = cost
+    self.retry = retry
+    self.maxBackoff = maxBackoff
+    self.job = None
+
+    # statistics
+    self.runs = 0
+    self.failures = 0           # failures in a row
+    self.totalFailures = 0
+    self.skipped = 0            # runs skipped because the quota was used up
+    self.lastRun = None         # monotonic time the last run started
+    self.lastDuration = None    # seconds the last run took
+    self.lastError = None
+    self.nextRun = None         # monotonic time of the next run
+    self.calls = deque()        # monotonic times of runs inside the quota period
+
+  # seconds between runs, never less than the quota allows
+  def period(self):
+    interval = self.interval() if callable(self.interval) else self.interval
+    if self.quota > 0:
+      interval = max(interval, float(self.quotaPeriod) * self.cost / self.quota)
+    return interval
+
+  # calls left in the quota period at time now
+  def budget(self, now):
+    start = now - self.quotaPeriod
+    return self.quota - self.cost * sum(1 for t in list(self.calls) if t > start)
+
+  # forget the runs that are older than the quota period. only called from
+  # the run of the provider
+  def expire(self, now):
+    while len(self.calls) > 0 and self.calls[0] <= now - self.quotaPeriod:
+      self.calls.popleft()
+
+#==============================================================================
+class Registry(object):
+  def __init__(self, engine, clock = monotonic, random = random.random, metrics = None):
+    self.engine = engine
+    self.clock = clock
+    self.random = random
+    self.lock = threading.Lock()
+    self.providers = []
+    self.started = False
+
+    # run times and failures of each provider, see metrics.py
+    self.metrics = metrics
+    if metrics != None:
+      metrics.histogram('sign_provider_run_seconds', 'Time each provider run took, fetch and parse.')
+      metrics.counter('sign_provider_failures_total', 'Failed provider runs.')
+      metrics.counter('sign_provider_skipped_total', 'Provider runs skipped because the quota was used up.')
+      metrics.gauge('sign_provider_next_run_seconds', 'Seconds until each provider runs again.')
+      metrics.addCollector(self.collect)
+
+  # add a provider, see Provider for the arguments. returns the provider. a
+  # provider added after start runs right away
+  def register(self, name, fn, interval, **kwargs):
+    provider = Provider(name, fn, interval, **kwargs)
+    with self.lock:
+      self.providers.append(provider)
+      started = self.started
+    if started:
+      self.schedule(provider, 0)
+    return provider
+
+  def get(self, name):
+    for provider in list(self.providers):
+      if provider.name == name:
+        return provider
+    return None
+
+  # stop a provider and forget it. a run that has started still finishes.
+  # returns the provider, None when there is none by that name
+  def remove(self, name):
+    provider = self.get(name)
+    if provider == None:
+      return None
+    self.cancel(provider)
+    with self.lock:
+      self.providers.remove(provider)
+    return provider
+
+  # schedule all of the providers. the first runs are stagger seconds apart,
+  # in the order the providers were registered, so they do not all hit the
+  # network at boot
+  def start(self, stagger = 2.0):
+    with self.lock:
+      self.started = True
+      providers = list(self.providers)
+    for n, provider in enumerate(providers):
+      self.schedule(provider, n * stagger)
+
+  def schedule(self, provider, delay):
+    provider.nextRun = self.clock() + delay
+    provider.job = self.engine.schedule(lambda: self.run(provider), delay, provider.retry, provider.name)
+
+  # stop running a provider
+  def cancel(self, provider):
+    if provider.job != None:
+      self.engine.cancel(provider.job)
+      provider.job = None
+    provider.nextRun = None
+
+  # run a provider once on a fetch worker, returns the delay until its next run
+  def run(self, provider):
+    now = self.clock()
+    period = provider.period()
+
+    provider.expire(now)
+    if provider.quota > 0 and provider.budget(now) < provider.cost:
+      # out of calls, wait until the oldest call leaves the quota period
+      provider.skipped += 1
+      if self.metrics != None:
+        self.metrics.inc('sign_provider_skipped_total', provider = provider.name)
+      delay = provider.calls[0] + provider.quotaPeriod - now
+      provider.nextRun = now + delay
+      return delay
+
+    provider.lastRun = now
+    provider.calls.append(now)
+    try:
+      ok = provider.fn() != False
+      provider.lastError = None
+    except Exception as e:
+      ok = False
+      provider.lastError = e
+      print 'Provider {} failed: {}'.format(provider.name, e)
+      traceback.print_exc()
+
+    end = self.clock()
+    provider.lastDuration = end - now
+    provider.runs += 1
+
+    if self.metrics != None:
+      self.metrics.observe('sign_provider_run_seconds', provider.lastDuration, provider = provider.name)
+      if not ok:
+        self.metrics.inc('sign_provider_failures_total', provider = provider.name)
+
+    if ok:
+      provider.failures = 0
+      delay = period
+    else:
+      provider.failures += 1
+      provider.totalFailures += 1
+      maxBackoff = provider.maxBackoff or max(period, provider.retry)
+      delay = min(provider.retry * (1 << min(provider.failures - 1, 16)), maxBackoff)
+
+    # spread the runs of providers with the same interval
+    if provider.jitter > 0:
+      delay *= 1.0 + provider.jitter * (2.0 * self.random() - 1.0)
+
+    provider.nextRun = end + delay
+    return delay
+
+  # update the next run gauges before the metrics are exported
+  def collect(self, metrics):
+    now = self.clock()
+    for p in list(self.providers):
+      if p.nextRun != None:
+        metrics.set('sign_provider_next_run_seconds', max(0.0, p.nextRun - now), provider = p.name)
+
+  # return a line for each provider; next run, last run time and counters
+  def report(self):
+    now = self.clock()
+    lines = []
+    for p in list(self.providers):
+      next = 'stopped'
+      if p.nextRun != None:
+        next = 'next in {:.0f}s'.format(max(0.0, p.nextRun - now))
+      last = 'not run yet'
+      if p.lastDuration != None:
+        last = 'last took {:.2f}s'.format(p.lastDuration)
+      line = '{}: {}, {}, {} runs, {} failed'.format(p.name, next, last, p.runs, p.totalFailures)
+      if p.quota > 0:
+        line += ', quota {}/{} left'.format(max(0, p.budget(now)), p.quota)
+      lines.append(line)
+    return '\n'.join(lines)
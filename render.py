@@ -0,0 +1,103 @@
+# Drawing of the scrolling lines for the sign.
+
+# This is the drawing path of the render loop, kept apart from RunText so the
+# rendering benchmark (bench/render_bench.py) measures the same code the sign
+# runs. Each frame the loop passes the lines it wants on the panel; color,
+# text, scroll position and baseline row. A line whose position is None does
+# not scroll, it is centered. With strips such a line is put together from a
+# cache of glyph images (strips.GlyphStrips), it is meant for the clock, whose
+# text changes every second.
+
+# Dirty-region rendering. A line is only redrawn when its message or position
+# changed. The two buffers are swapped back and forth, so what is on each
+# buffer is tracked separately, by the parity of the swaps; the canvas object
+# that SwapOnVSync returns is not the same object each time. Every canvas
+# passed to draw() must be the one the last swap returned. When nothing
+# changed since the last swap draw() returns None and the swap can be skipped.
+
+# pre-rendered message strips need the Python Imaging Library. Without it the
+# messages are drawn with graphics.DrawText every frame.
+try:
+  from strips import StripCache, StripFont, GlyphStrips, drawStrip
+except ImportError:
+  StripCache = None
+
+#==============================================================================
+class LineRenderer(object):
+  # graphics is the graphics module of the display backend. strips can be
+  # turned off to measure the DrawText path
+  def __init__(self, graphics, fontFile, useStrips = True):
+    self.graphics = graphics
+    self.font = graphics.Font()
+    self.font.LoadFont(fontFile)
+
+    # each message is rendered once into a strip, only the visible part of
+    # the strip is copied to the canvas each frame
+    self.strips = None
+    self.glyphs = None
+    if useStrips and StripCache != None:
+      self.strips = StripCache(StripFont(fontFile))
+      self.glyphs = GlyphStrips(self.strips.font)
+
+    # the frame that is on each of the two buffers, and which of them is the
+    # off-screen one that is drawn on
+    self.drawn = [(), ()]
+    self.back = 0
+    # the frame on display
+    self.shown = None
+    # pixel length of each line, from the last draw
+    self.widths = []
+    # last centered text and its length, it is drawn every frame
+    self.centered = (None, 0)
+
+  # draw lines, a list of (color, text, x, baseline), on the canvas. returns
+  # the frame to pass to swapped() once the canvas is shown, or None when it
+  # is already on display
+  def draw(self, canvas, lines):
+    if self.strips:
+      strips = [self.glyphs.get(color, text) if x == None else self.strips.get(color, text)
+                for color, text, x, baseline in lines]
+      self.widths = [strip.width for strip in strips]
+      lines = [(color, text, center(canvas, strip.width) if x == None else x, baseline)
+               for (color, text, x, baseline), strip in zip(lines, strips)]
+      frame = tuple((strip, line[2]) for strip, line in zip(strips, lines))
+    else:
+      lines = [(color, text, center(canvas, self.width(text)) if x == None else x, baseline)
+               for color, text, x, baseline in lines]
+      frame = tuple((color.red, color.green, color.blue, text, x) for color, text, x, baseline in lines)
+
+    if frame == self.shown:
+      return None
+
+    back = self.drawn[self.back]
+    if self.strips:
+      # a strip covers its whole line, no need to clear first
+      for i, strip in enumerate(strips):
+        if i >= len(back) or frame[i] != back[i]:
+          drawStrip(canvas, strip, lines[i][2], lines[i][3])
+    else:
+      # determine the pixel length of the messages
+      canvas.Clear()
+      self.widths = [self.graphics.DrawText(canvas, self.font, x, baseline, color, text)
+                     for color, text, x, baseline in lines]
+    self.drawn[self.back] = frame
+    return frame
+
+  # the canvas with frame on it was swapped onto the display, the other
+  # buffer is off-screen now
+  def swapped(self, frame):
+    self.shown = frame
+    self.back ^= 1
+
+  # pixel length of a text in the font of the display backend
+  def width(self, text):
+    if self.centered[0] == text:
+      return self.centered[1]
+    chars = text.decode('utf-8', 'replace') if isinstance(text, str) else text
+    width = sum(max(0, self.font.CharacterWidth(ord(ch))) for ch in chars)
+    self.centered = (text, width)
+    return width
+
+# left edge of a text that is centered on the canvas
+def center(canvas, width):
+  return (canvas.width - width) // 2
@@ -4,7 +4,14 @@ import sys
 import os
 
 sys.path.append(os.path.abspath(os.path.dirname(__file__) + '/..'))
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
+
+# the rgbmatrix library is only needed for the hardware backend. without it
+# the sign can still run on the emulated display, see emulator.py
+try:
+  import rgbmatrix
+  import rgbmatrix.graphics
+except ImportError:
+  rgbmatrix = None
 
 
 class SampleBase(object):
@@ -22,6 +29,8 @@ class SampleBase(object):
         self.parser.add_argument("--led-show-refresh", action="store_true", help="Shows the current refresh rate of the LED panel")
         self.parser.add_argument("--led-slowdown-gpio", action="store", help="Slow down writing to GPIO. Range: 1..100. Default: 1", choices=range(3), type=int)
         self.parser.add_argument("--led-no-hardware-pulse", action="store", help="Don't use hardware pin-pulse generation")
+        self.parser.add_argument("--led-backend", action="store", help="Display backend: hardware drives the HUB75 panel, emulator runs headless in memory. Default: hardware", default="hardware", choices=['hardware', 'emulator'], type=str)
+        self.parser.add_argument("--emulator-frames", action="store", help="Emulator backend only, stop after this many frames and print frame times. Default: 0, run forever", default=0, type=int)
 
 
     def usleep(self, value):
@@ -33,7 +42,20 @@ class SampleBase(object):
     def process(self):
         self.args = self.parser.parse_args()
 
-        options = RGBMatrixOptions()
+        if self.args.led_backend == 'emulator':
+          import emulator
+          backend = emulator
+        elif rgbmatrix != None:
+          backend = rgbmatrix
+        else:
+          print("The rgbmatrix library is not installed, use --led-backend emulator\n")
+          self.parser.print_help()
+          return False
+
+        # drawing must use the graphics module of the selected backend
+        self.graphics = backend.graphics
+
+        options = backend.RGBMatrixOptions()
 
         if self.args.led_gpio_mapping != None:
           options.hardware_mapping = self.args.led_gpio_mapping
@@ -51,13 +73,18 @@ class SampleBase(object):
         if self.args.led_no_hardware_pulse:
           options.disable_hardware_pulsing = True
 
-        self.matrix = RGBMatrix(options = options)
+        if self.args.led_backend == 'emulator':
+          self.matrix = backend.RGBMatrix(options = options, maxFrames = self.args.emulator_frames)
+        else:
+          self.matrix = backend.RGBMatrix(options = options)
 
         try:
             # Start loop
             print("Press CTRL-C to stop sample")
             self.run()
         except KeyboardInterrupt:
+            if self.args.led_backend == 'emulator':
+              print(self.matrix.stats())
             print("Exiting\n")
             sys.exit(0)
 
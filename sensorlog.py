@@ -0,0 +1,325 @@
+# Time series of sensor samples for the scrolling sign.
+
+# "Rising" and "falling" used to come from comparing one pressure reading with
+# the one taken ten minutes before, so sensor noise flipped the message back
+# and forth. A SensorLog keeps the recent samples in a fixed size ring buffer
+# and keeps statistics over a time window, 3 hours by default, as samples are
+# added:
+#   mean        running sums, O(1) per sample
+#   slope       least squares fit of value against time from the same sums
+#   min, max    monotonic queues, O(1) amortized per sample
+# so a sample every few seconds costs next to nothing.
+
+# The ring buffer can live in a memory-mapped file, so the history survives a
+# reboot. The file is a header followed by the samples; each sample is its
+# time in seconds since the epoch and one double for each channel. A missing
+# value is stored as NaN. A file of another capacity, from another sample
+# interval, is made again with the new size and its samples are copied over.
+
+import math
+import mmap
+import os
+import struct
+import time
+from collections import deque
+
+# magic, version, channels, capacity, samples written
+HEADER = struct.Struct('<4sIIIQ')
+MAGIC = 'SLOG'
+VERSION = 1
+
+NAN = float('nan')
+
+# sums are recomputed from the samples after this many updates, so rounding
+# errors from adding and removing samples do not build up
+RESUM = 10000
+
+#==============================================================================
+# describe a pressure tendency in hPa per 3 hours, the way weather reports do
+def tendencyText(change):
+  if change == None:
+    return ''
+  size = abs(change)
+  if size < 0.1:
+    return 'steady'
+  if size < 1.6:
+    speed = ' slowly'
+  elif size < 3.6:
+    speed = ''
+  elif size < 6.0:
+    speed = ' quickly'
+  else:
+    speed = ' very rapidly'
+  if change > 0:
+    return 'rising' + speed
+  return 'falling' + speed
+
+#==============================================================================
+# running statistics of one channel over the window
+class Channel(object):
+  __slots__ = ('n', 'st', 'stt', 'sv', 'stv', 'low', 'high')
+
+  def __init__(self):
+    self.clear()
+
+  def clear(self):
+    self.n = 0
+    self.st = 0.0       # sum of times
+    self.stt = 0.0      # sum of times squared
+    self.sv = 0.0       # sum of values
+    self.stv = 0.0      # sum of time * value
+    # (sample number, value), values increase from the left in low and
+    # decrease in high, so the minimum and maximum are at the left
+    self.low = deque()
+    self.high = deque()
+
+  def add(self, seq, t, v):
+    self.n += 1
+    self.st += t
+    self.stt += t * t
+    self.sv += v
+    self.stv += t * v
+
+    while len(self.low) > 0 and self.low[-1][1] >= v:
+      self.low.pop()
+    self.low.append((seq, v))
+    while len(self.high) > 0 and self.high[-1][1] <= v:
+      self.high.pop()
+    self.high.append((seq, v))
+
+  def remove(self, seq, t, v):
+    self.n -= 1
+    self.st -= t
+    self.stt -= t * t
+    self.sv -= v
+    self.stv -= t * v
+
+    if len(self.low) > 0 and self.low[0][0] <= seq:
+      self.low.popleft()
+    if len(self.high) > 0 and self.high[0][0] <= seq:
+      self.high.popleft()
+
+#==============================================================================
+class SensorLog(object):
+  def __init__(self, channels = ('temperature', 'humidity', 'pressure'), capacity = 4096, window = 3 * 3600, filename = None, clock = time.time):
+    self.channels = tuple(channels)
+    self.capacity = capacity
+    self.window = window
+    self.filename = filename
+    self.clock = clock
+    self.sample = struct.Struct('<' + 'd' * (1 + len(self.channels)))
+    self.stats = [Channel() for c in self.channels]
+
+    # samples written since the log was created. sample number seq is in
+    # slot seq % capacity. first is the oldest sample in the window
+    self.seq = 0
+    self.first = 0
+    self.updates = 0
+
+    self.file = None
+    self.buffer = None
+    samples = []
+    size = HEADER.size + capacity * self.sample.size
+    if filename != None:
+      try:
+        self.buffer, samples = self.map(filename, size)
+      except (IOError, OSError, ValueError, struct.error) as e:
+        print 'Unable to use sensor log {}: {}'.format(filename, e)
+    if self.buffer == None:
+      self.buffer = bytearray(size)
+
+    self.resum()
+    for sample in samples[-capacity:]:
+      self.add(sample[1:], sample[0])
+
+  # map the log file, making it when it is missing or does not fit. returns
+  # the buffer and the samples of a file with another capacity, oldest first
+  def map(self, filename, size):
+    directory = os.path.dirname(filename)
+    if len(directory) > 0 and not os.path.isdir(directory):
+      os.makedirs(directory)
+
+    fresh = True
+    samples = []
+    if os.path.isfile(filename) and os.path.getsize(filename) >= HEADER.size:
+      with open(filename, 'rb') as f:
+        magic, version, channels, capacity, seq = HEADER.unpack(f.read(HEADER.size))
+        if magic == MAGIC and version == VERSION and channels == len(self.channels):
+          if capacity == self.capacity and os.path.getsize(filename) == size:
+            self.seq = seq
+            fresh = False
+          elif os.path.getsize(filename) == HEADER.size + capacity * self.sample.size:
+            samples = self.readSamples(f, capacity, seq)
+
+    if fresh:
+      with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(self.channels), self.capacity, 0))
+        f.truncate(size)
+      if len(samples) > 0:
+        print 'Sensor log {}: copying {} samples to the new size'.format(filename, min(len(samples), self.capacity))
+
+    self.file = open(filename, 'r+b')
+    return mmap.mmap(self.file.fileno(), size), samples
+
+  # the samples of a log file of another capacity
+  def readSamples(self, f, capacity, seq):
+    samples = []
+    for n in range(seq - min(seq, capacity), seq):
+      f.seek(HEADER.size + (n % capacity) * self.sample.size)
+      samples.append(self.sample.unpack(f.read(self.sample.size)))
+    return samples
+
+  def offset(self, seq):
+    return HEADER.size + (seq % self.capacity) * self.sample.size
+
+  # (time, values...) of a sample
+  def read(self, seq):
+    return self.sample.unpack_from(self.buffer, self.offset(seq))
+
+  # number of samples kept
+  def __len__(self):
+    return min(self.seq, self.capacity)
+
+  # add a sample. values are in channel order, None when missing
+  def add(self, values, when = None):
+    if when == None:
+      when = self.clock()
+    values = [NAN if v == None else float(v) for v in values]
+
+    # a full ring overwrites the oldest sample, drop it from the window first
+    if self.seq - self.first >= self.capacity:
+      self.expire(self.first + 1)
+
+    # an empty window starts again from this sample, keeping the times in
+    # the sums small
+    if self.first == self.seq:
+      self.origin = when
+
+    seq = self.seq
+    self.sample.pack_into(self.buffer, self.offset(seq), when, *values)
+    t = when - self.origin
+    for stat, v in zip(self.stats, values):
+      if not math.isnan(v):
+        stat.add(seq, t, v)
+    self.seq = seq + 1
+    HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, len(self.channels), self.capacity, self.seq)
+
+    # drop the samples that left the window
+    start = self.first
+    while start < self.seq and self.read(start)[0] < when - self.window:
+      start += 1
+    self.expire(start)
+
+    # start the sums again when rounding errors may have built up or the
+    # times have grown large
+    self.updates += 1
+    if self.updates >= RESUM or when - self.origin > 4 * self.window:
+      self.resum()
+
+  # remove the samples before sample number start from the window
+  def expire(self, start):
+    while self.first < start:
+      sample = self.read(self.first)
+      t = sample[0] - self.origin
+      for stat, v in zip(self.stats, sample[1:]):
+        if not math.isnan(v):
+          stat.remove(self.first, t, v)
+      self.first += 1
+
+  # rebuild the window statistics from the samples. times are kept relative
+  # to the oldest sample so the sums keep their precision
+  def resum(self):
+    self.updates = 0
+    oldest = self.seq - len(self)
+    now = self.clock()
+    if self.seq > 0:
+      now = max(now, self.read(self.seq - 1)[0])
+    self.first = self.seq
+    while self.first > oldest and self.read(self.first - 1)[0] >= now - self.window:
+      self.first -= 1
+
+    self.origin = 0.0
+    if self.first < self.seq:
+      self.origin = self.read(self.first)[0]
+
+    for stat in self.stats:
+      stat.clear()
+    for seq in range(self.first, self.seq):
+      sample = self.read(seq)
+      t = sample[0] - self.origin
+      for stat, v in zip(self.stats, sample[1:]):
+        if not math.isnan(v):
+          stat.add(seq, t, v)
+
+  def channel(self, name):
+    return self.stats[self.channels.index(name)]
+
+  # most recent value of a channel, None when there is none
+  def latest(self, name):
+    i = self.channels.index(name) + 1
+    for seq in range(self.seq - 1, self.seq - len(self) - 1, -1):
+      v = self.read(seq)[i]
+      if not math.isnan(v):
+        return v
+    return None
+
+  # time of the most recent sample, None when there is none
+  def newest(self):
+    if self.seq == 0:
+      return None
+    return self.read(self.seq - 1)[0]
+
+  # seconds between the oldest and newest sample in the window
+  def span(self):
+    if self.first >= self.seq:
+      return 0.0
+    return self.read(self.seq - 1)[0] - self.read(self.first)[0]
+
+  # moving average over the window
+  def mean(self, name):
+    stat = self.channel(name)
+    if stat.n == 0:
+      return None
+    return stat.sv / stat.n
+
+  def minimum(self, name):
+    stat = self.channel(name)
+    if len(stat.low) == 0:
+      return None
+    return stat.low[0][1]
+
+  def maximum(self, name):
+    stat = self.channel(name)
+    if len(stat.high) == 0:
+      return None
+    return stat.high[0][1]
+
+  # least squares slope over the window in units per second. None when there
+  # are fewer than three samples
+  def slope(self, name):
+    stat = self.channel(name)
+    if stat.n < 3:
+      return None
+    d = stat.n * stat.stt - stat.st * stat.st
+    if d <= 0:
+      return None
+    return (stat.n * stat.stv - stat.st * stat.sv) / d
+
+  # change over 3 hours from the slope, None until the window has at least
+  # minSpan seconds of samples
+  def tendency(self, name = 'pressure', minSpan = 1800):
+    slope = self.slope(name)
+    if slope == None or self.span() < minSpan:
+      return None
+    return slope * 3 * 3600
+
+  # write the buffer to the file
+  def flush(self):
+    if self.file != None:
+      self.buffer.flush()
+
+  def close(self):
+    if self.file != None:
+      self.buffer.close()
+      self.file.close()
+      self.file = None
@@ -0,0 +1,73 @@
+# Content snapshot for a warm restart of the scrolling sign.
+
+# After a reboot the bottom line said "Please Wait while I gather information
+# from the Internet" until the first fetch of every feature was done, which
+# can take minutes on slow WiFi. The messages of the feeds (see playlist.py)
+# are now written to a snapshot file every few minutes and when the sign
+# stops, and read back before anything is fetched, so the sign starts with
+# the content it had. Each feed is stamped with the time it was published.
+# A feed that is older than its maximum age is not restored, and the others
+# are replaced as the providers refresh them.
+
+# The file is compact JSON, written to a temporary file and renamed, so a
+# power cut while it is written leaves the last complete snapshot;
+#   {"version": 1, "saved": time, "feeds": {name: [published, [[r, g, b, text], ...]]}}
+
+import json
+import os
+import time
+
+VERSION = 1
+
+#==============================================================================
+class Snapshot(object):
+  def __init__(self, filename = 'cache/snapshot.json', clock = time.time):
+    self.filename = filename
+    self.clock = clock
+
+  # write the messages of all feeds that have been published
+  def save(self, feeds):
+    data = {'version': VERSION, 'saved': self.clock(), 'feeds': {}}
+    for name, messages, published in feeds.items():
+      if published == None:
+        continue
+      data['feeds'][name] = [published, [[c.red, c.green, c.blue, text] for c, text in messages]]
+
+    tmp = self.filename + '.tmp'
+    try:
+      directory = os.path.dirname(self.filename)
+      if len(directory) > 0 and not os.path.isdir(directory):
+        os.makedirs(directory)
+      with open(tmp, 'w') as f:
+        json.dump(data, f, separators = (',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+      os.rename(tmp, self.filename)
+    except (IOError, OSError, TypeError, ValueError) as e:
+      print 'Unable to write snapshot {}: {}'.format(self.filename, e)
+      return False
+    return True
+
+  # publish the saved messages to the feeds. makeColor turns red, green and
+  # blue into a color. maxAge is feed name -> seconds, feeds that are older
+  # are skipped. returns the names of the feeds that were restored
+  def load(self, feeds, makeColor, maxAge = {}):
+    try:
+      with open(self.filename, 'r') as f:
+        data = json.load(f)
+    except (IOError, OSError, ValueError):
+      return []
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+      return []
+
+    now = self.clock()
+    restored = []
+    for name, (published, messages) in sorted(data.get('feeds', {}).items()):
+      age = now - published
+      if name not in feeds.names or age > maxAge.get(name, age):
+        print 'Snapshot: {} is {:.0f} minutes old, not restored'.format(name, age / 60)
+        continue
+      feeds.publish(name, [[makeColor(r, g, b), text] for r, g, b, text in messages], published)
+      restored.append(name)
+      print 'Snapshot: restored {} messages of {}, {:.0f} minutes old'.format(len(messages), name, age / 60)
+    return restored
@@ -0,0 +1,109 @@
+# Startup of the scrolling sign.
+
+# All of the setup used to run when RGB-32x64.py was imported. It asked an NTP
+# server for the time with no timeout, imported requests and the parsers, made
+# the HTTP client and read the sensor, and only then lit up the panel. With
+# the network down at boot the NTP request never returned and the panel
+# stayed dark.
+
+# Now the first frame is shown as soon as the matrix and the font are ready.
+# The fetches, and the modules only they need, are loaded after that in the
+# background, and the time is asked for in the background with a timeout.
+# Phases records when each step started and how long it took, and how long
+# after the kernel booted the first frame was shown.
+
+import os
+import threading
+
+from timing import monotonic
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+#==============================================================================
+# seconds since the kernel booted, None when it is not known
+def uptime():
+  try:
+    with open('/proc/uptime', 'r') as f:
+      return float(f.read().split()[0])
+  except (IOError, OSError, ValueError, IndexError):
+    return None
+
+# seconds since this process was started, None when it is not known
+def processAge():
+  up = uptime()
+  try:
+    with open('/proc/self/stat', 'r') as f:
+      stat = f.read()
+    # the fields after the command name, which may contain spaces
+    started = int(stat[stat.rindex(')') + 2:].split()[19])
+  except (IOError, OSError, ValueError, IndexError):
+    return None
+  if up == None:
+    return None
+  return up - float(started) / CLOCK_TICKS
+
+#==============================================================================
+class Phases(object):
+  def __init__(self, clock = monotonic):
+    self.clock = clock
+    self.lock = threading.Lock()
+    # time from starting Python to making this, the imports of the script
+    age = processAge()
+    self.started = clock() - (age or 0.0)
+    # (name, seconds after the start, seconds it took)
+    self.phases = []
+    if age != None:
+      self.add('python and imports', 0.0, age)
+
+  def add(self, name, at, took):
+    with self.lock:
+      self.phases.append((name, at, took))
+    print 'Startup: {} took {:.2f}s, done {:.2f}s after start'.format(name, took, at + took)
+
+  # time one step. phases may run at the same time in different threads
+  def begin(self):
+    return self.clock()
+
+  def end(self, name, began):
+    now = self.clock()
+    self.add(name, began - self.started, now - began)
+
+  # seconds since the process started
+  def elapsed(self):
+    return self.clock() - self.started
+
+  # the first frame is on the panel. returns seconds since the process
+  # started
+  def firstFrame(self):
+    elapsed = self.elapsed()
+    self.add('first frame', 0.0, elapsed)
+    up = uptime()
+    if up != None:
+      print 'Startup: first frame {:.1f}s after boot'.format(up)
+    return elapsed
+
+  # update the startup gauges before the metrics are exported
+  def collect(self, metrics):
+    with self.lock:
+      phases = list(self.phases)
+    for name, at, took in phases:
+      metrics.set('sign_startup_seconds', at + took, phase = name)
+
+  def addMetrics(self, metrics):
+    metrics.gauge('sign_startup_seconds', 'Seconds after the process started that each startup phase was done.')
+    metrics.addCollector(self.collect)
+
+#==============================================================================
+# call getTime in a background thread, so a network that is down does not hold
+# up the start. getTime is called with the timeout and returns the time text
+def syncTime(getTime, timeout = 5.0):
+  def run():
+    try:
+      print 'NTP: ' + getTime(timeout = timeout)
+    except Exception as e:
+      print 'NTP failed: {}'.format(e)
+
+  t = threading.Thread(target = run, name = 'ntp')
+  t.daemon = True
+  t.start()
+  return t
@@ -0,0 +1,203 @@
+# Pre-rendered message strips for the RGB matrix scrolling sign.
+
+# graphics.DrawText re-rasterizes the whole message every frame, including all
+# of the glyphs that are off the edge of the panel. That cost grows with the
+# length of the message. Long headlines are the worst case.
+
+# Here each [color, text] message is rendered once into an off-screen RGB image
+# (a strip) that is as wide as the whole message. Each frame only the part of
+# the strip that is visible on the panel is copied to the canvas, so the cost
+# of a frame stays fixed at the panel width.
+
+# Strips are kept in a size-bounded LRU cache keyed by (font, color, text).
+
+# Requires the Python Imaging Library; sudo apt-get install python-pillow
+
+import collections
+
+from PIL import Image
+
+import bdffont
+
+#==============================================================================
+# glyph source for strips. Glyphs come from the compiled font atlas, see
+# bdffont.py. Each glyph bitmap is turned into a PIL mask the first time it is
+# used.
+class StripFont(object):
+  def __init__(self, filename):
+    self.name = filename
+    self.font = bdffont.loadFont(filename)
+    self.ascent = self.font.ascent
+    self.descent = self.font.descent
+    self.height = self.font.height
+    self.masks = {}
+
+  # return (advance, x, y, mask) for a character or None. x and y are the top
+  # left corner of the mask relative to the origin on the baseline, y is
+  # positive down.
+  def glyph(self, ch):
+    try:
+      return self.masks[ch]
+    except KeyError:
+      g = self.font.glyph(ch)
+      if g == None:
+        m = None
+      elif g.width > 0 and g.height > 0:
+        im = Image.frombytes('1', (g.width, g.height), g.bits, 'raw', '1', g.stride())
+        m = (g.advance, g.xoff, -(g.yoff + g.height), im)
+      else:
+        m = (g.advance, 0, 0, None)
+      self.masks[ch] = m
+      return m
+
+  # return the pixel width of a message without drawing it
+  def width(self, text):
+    return self.font.width(text)
+
+#==============================================================================
+# one pre-rendered message
+class Strip(object):
+  __slots__ = ('image', 'width', 'height', 'ascent')
+
+  def __init__(self, image, width, height, ascent):
+    self.image = image
+    self.width = width
+    self.height = height
+    self.ascent = ascent
+
+#==============================================================================
+# render a message into a new strip. color is a graphics.Color
+def renderStrip(font, color, text):
+  if isinstance(text, str):
+    text = text.decode('utf-8', 'replace')
+
+  width = font.width(text)
+  # PIL does not allow empty images
+  image = Image.new('RGB', (max(width, 1), max(font.height, 1)))
+  rgb = (color.red, color.green, color.blue)
+
+  x = 0
+  for ch in text:
+    g = font.glyph(ch)
+    if not g:
+      continue
+
+    advance, gx, gy, mask = g
+    if mask:
+      image.paste(rgb, (x + gx, font.ascent + gy), mask)
+    x += advance
+
+  return Strip(image, width, font.height, font.ascent)
+
+#==============================================================================
+# copy the visible part of a strip to the canvas. x is the scroll position of
+# the left edge of the message, baseline is the row of the font baseline.
+# the whole width of the canvas is written, columns that are not covered by the
+# message are black, so the line does not need to be cleared first.
+# returns the pixel length of the message, same as graphics.DrawText
+def drawStrip(canvas, strip, x, baseline):
+  # PIL fills the part of the crop box that is outside of the image with black
+  window = strip.image.crop((-x, 0, canvas.width - x, strip.height))
+  canvas.SetImage(window, 0, baseline - strip.ascent)
+  return strip.width
+
+#==============================================================================
+# strips put together from a cache of one strip per glyph, for a text that
+# changes often but only has a few different characters, like the clock. a
+# new text costs one paste per character instead of rendering the glyphs, and
+# does not push the messages out of the StripCache. only the glyphs of one
+# color are kept, they are rendered again when the color changes
+class GlyphStrips(object):
+  def __init__(self, font):
+    self.font = font
+    self.rgb = None
+    # character -> strip of the glyph
+    self.glyphs = {}
+    # (rgb, text) and the strip of the last text, asked for every frame
+    self.last = (None, None)
+
+  def get(self, color, text):
+    rgb = (color.red, color.green, color.blue)
+    key = (rgb, text)
+    if self.last[0] == key:
+      return self.last[1]
+    if rgb != self.rgb:
+      self.rgb = rgb
+      self.glyphs.clear()
+
+    if isinstance(text, str):
+      text = text.decode('utf-8', 'replace')
+    strips = [self.glyph(color, ch) for ch in text]
+    width = sum(g.width for g in strips)
+    image = Image.new('RGB', (max(width, 1), max(self.font.height, 1)))
+    x = 0
+    for g in strips:
+      if g.width > 0:
+        image.paste(g.image, (x, 0))
+      x += g.width
+
+    strip = Strip(image, width, self.font.height, self.font.ascent)
+    self.last = (key, strip)
+    return strip
+
+  def glyph(self, color, ch):
+    try:
+      return self.glyphs[ch]
+    except KeyError:
+      g = self.glyphs[ch] = renderStrip(self.font, color, ch)
+      return g
+
+#==============================================================================
+# LRU cache of rendered strips. The cache is bounded by the number of bytes
+# used by the strip images. Least recently used strips are dropped first.
+class StripCache(object):
+  def __init__(self, font, maxBytes = 512 * 1024):
+    self.font = font
+    self.maxBytes = maxBytes
+    self.bytes = 0
+    self.hits = 0
+    self.misses = 0
+    self.strips = collections.OrderedDict()
+
+  def get(self, color, text):
+    key = (self.font.name, (color.red, color.green, color.blue), text)
+
+    strip = self.strips.pop(key, None)
+    if strip is None:
+      self.misses += 1
+      strip = renderStrip(self.font, color, text)
+      self.bytes += self.size(strip)
+      self.trim()
+    else:
+      self.hits += 1
+
+    # most recently used goes to the end
+    self.strips[key] = strip
+    return strip
+
+  # add a strip that was rendered in another process, from the bytes of its
+  # image, see contentprocess.py
+  def load(self, color, text, width, height, ascent, size, data):
+    key = (self.font.name, (color.red, color.green, color.blue), text)
+    old = self.strips.pop(key, None)
+    if old is not None:
+      self.bytes -= self.size(old)
+
+    strip = Strip(Image.frombytes('RGB', size, data), width, height, ascent)
+    self.bytes += self.size(strip)
+    self.trim()
+    self.strips[key] = strip
+
+  # drop least recently used strips until we fit. the strip that is being
+  # added is not in the cache yet, so it is never dropped.
+  def trim(self):
+    while self.bytes > self.maxBytes and len(self.strips) > 0:
+      k, strip = self.strips.popitem(last = False)
+      self.bytes -= self.size(strip)
+
+  def size(self, strip):
+    return strip.width * strip.height * 3
+
+  def clear(self):
+    self.strips.clear()
+    self.bytes = 0
@@ -0,0 +1,276 @@
+# Local HTTP stand-in for the feed sources of the scrolling sign.
+
+# The fetch workers could only be tried against the live quote, joke, news and
+# weather sites, which change their pages or go away. The stub server records
+# the responses of the real sites once and then replays them from disk, with
+# the network made as bad as needed:
+#   --latency, --jitter     seconds before the response starts
+#   --bandwidth             bytes per second the body is sent at
+#   --error-rate            fraction of requests answered with --error-code
+#   --hang-rate             fraction of requests that get no answer for
+#                           --hang-time seconds, then the connection is closed
+# With the metrics of the sign (metrics.py) this shows how a slow network
+# leaks into the frame times, without Internet access.
+
+# The real URL is part of the stub URL, after the scheme;
+#   https://www.yahoo.com/news/ -> http://127.0.0.1:8080/https/www.yahoo.com/news/
+# Point quoteurl, jokesurl, newsurl and weatherurl in options.ini at the stub
+# URLs, --urls prints them for an options file. Each response is stored like the
+# HTTP cache does it (httpcache.py), <sha1 of the url>.json with the status and
+# headers and <sha1>.body. A replayed response that has an ETag or
+# Last-Modified answers conditional GETs with 304.
+
+#   python stubserver.py --record               fetch and store what is missing
+#   python stubserver.py --latency 2 --hang-rate 0.1
+#   python stubserver.py --urls options.ini
+
+import argparse
+import BaseHTTPServer
+import hashlib
+import json
+import os
+import random
+import SocketServer
+import sys
+import threading
+import time
+
+# headers that are stored and sent back
+HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+#==============================================================================
+# stub URL of a real URL
+def stubUrl(base, url):
+  scheme, rest = url.split('://', 1)
+  return '{}/{}/{}'.format(base.rstrip('/'), scheme, rest)
+
+# real URL of the path of a request to the stub, None when it is not one
+def realUrl(path):
+  parts = path.lstrip('/').split('/', 1)
+  if len(parts) < 2 or parts[0] not in ('http', 'https'):
+    return None
+  return parts[0] + '://' + parts[1]
+
+#==============================================================================
+# stored responses
+class Recordings(object):
+  def __init__(self, directory = 'stub'):
+    self.directory = directory
+    self.lock = threading.Lock()
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+
+  def key(self, url):
+    if isinstance(url, unicode):
+      url = url.encode('utf-8')
+    return hashlib.sha1(url).hexdigest()
+
+  def path(self, key, ext):
+    return os.path.join(self.directory, key + ext)
+
+  # (meta, body) of a recorded URL, None when it was not recorded
+  def load(self, url):
+    key = self.key(url)
+    try:
+      with open(self.path(key, '.json'), 'r') as f:
+        meta = json.load(f)
+      with open(self.path(key, '.body'), 'rb') as f:
+        return meta, f.read()
+    except (IOError, OSError, ValueError):
+      return None
+
+  def store(self, url, status, headers, body):
+    key = self.key(url)
+    meta = {'url': url, 'status': status, 'recorded': time.time(),
+            'headers': dict((h, headers[h]) for h in HEADERS if h in headers)}
+    with self.lock:
+      for ext, data in (('.body', body), ('.json', json.dumps(meta, indent = 1, sort_keys = True))):
+        tmp = self.path(key, ext) + '.tmp'
+        with open(tmp, 'wb') as f:
+          f.write(data)
+        os.rename(tmp, self.path(key, ext))
+    return meta
+
+  # fetch a URL from the real site and store it. returns (meta, body)
+  def record(self, url):
+    import requests
+
+    r = requests.get(url, timeout = 30)
+    print 'Recorded {} {} ({} bytes)'.format(r.status_code, url, len(r.content))
+    return self.store(url, r.status_code, r.headers, r.content), r.content
+
+#==============================================================================
+# what the stub does to the responses
+class Faults(object):
+  def __init__(self, latency = 0.0, jitter = 0.0, bandwidth = 0, errorRate = 0.0, errorCode = 503,
+               hangRate = 0.0, hangTime = 600.0, seed = None):
+    self.latency = latency
+    self.jitter = jitter
+    self.bandwidth = bandwidth
+    self.errorRate = errorRate
+    self.errorCode = errorCode
+    self.hangRate = hangRate
+    self.hangTime = hangTime
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+
+  # 'hang', 'error' or 'ok' and the delay before answering
+  def choose(self):
+    with self.lock:
+      r = self.random.random()
+      delay = max(0.0, self.latency + self.jitter * (2.0 * self.random.random() - 1.0))
+    if r < self.hangRate:
+      return 'hang', self.hangTime
+    if r < self.hangRate + self.errorRate:
+      return 'error', delay
+    return 'ok', delay
+
+#==============================================================================
+class StubServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, address, recordings, faults, recordMissing = False):
+    BaseHTTPServer.HTTPServer.__init__(self, address, StubHandler)
+    self.recordings = recordings
+    self.faults = faults
+    self.recordMissing = recordMissing
+    self.verbose = False
+    self.lock = threading.Lock()
+    # result -> count
+    self.counts = {}
+
+  def count(self, result):
+    with self.lock:
+      self.counts[result] = self.counts.get(result, 0) + 1
+
+  def report(self):
+    with self.lock:
+      return ', '.join('{} {}'.format(n, result) for result, n in sorted(self.counts.items())) or 'no requests'
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    server = self.server
+    url = realUrl(self.path)
+    if url == None:
+      server.count('bad')
+      self.reply(400, {}, 'Not a stub URL: {}\n'.format(self.path))
+      return
+
+    recorded = server.recordings.load(url)
+    if recorded == None and server.recordMissing:
+      try:
+        recorded = server.recordings.record(url)
+      except Exception as e:
+        print 'Unable to record {}: {}'.format(url, e)
+        server.count('failed')
+        self.reply(502, {}, 'Unable to record {}: {}\n'.format(url, e))
+        return
+    if recorded == None:
+      server.count('missing')
+      self.reply(404, {}, 'Not recorded: {}\n'.format(url))
+      return
+
+    what, delay = server.faults.choose()
+    if what == 'hang':
+      # say nothing, then drop the connection
+      server.count('hang')
+      time.sleep(delay)
+      self.close_connection = 1
+      return
+
+    time.sleep(delay)
+    if what == 'error':
+      server.count('error')
+      self.reply(server.faults.errorCode, {}, 'Stub error\n')
+      return
+
+    meta, body = recorded
+    headers = meta.get('headers', {})
+    etag = headers.get('ETag')
+    modified = headers.get('Last-Modified')
+    if (etag and self.headers.get('If-None-Match') == etag) or \
+       (modified and self.headers.get('If-Modified-Since') == modified):
+      server.count('304')
+      self.reply(304, headers, '')
+      return
+
+    server.count(str(meta['status']))
+    self.reply(meta['status'], headers, body)
+
+  # send a response, the body at the bandwidth of the faults
+  def reply(self, status, headers, body):
+    self.send_response(status)
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+
+    bandwidth = self.server.faults.bandwidth
+    if bandwidth <= 0:
+      self.wfile.write(body)
+      return
+    # send in pieces of 1/20 of a second
+    chunk = max(1, bandwidth // 20)
+    for i in range(0, len(body), chunk):
+      self.wfile.write(body[i:i + chunk])
+      self.wfile.flush()
+      time.sleep(float(len(body[i:i + chunk])) / bandwidth)
+
+  def log_message(self, format, *args):
+    if self.server.verbose:
+      BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+#==============================================================================
+# print the feed URLs of an options file as stub URLs
+def printUrls(filename, base):
+  weather = False
+  with open(filename, 'r') as f:
+    for line in f:
+      s = line.rstrip('\r\n').split('=', 1)
+      if len(s) == 2 and s[0] in ('quoteurl', 'jokesurl', 'newsurl', 'weatherurl') and '://' in s[1]:
+        print '{}={}'.format(s[0], stubUrl(base, s[1]))
+        weather = weather or s[0] == 'weatherurl'
+  # the default, when the options file does not set it
+  if not weather:
+    print 'weatherurl={}'.format(stubUrl(base, 'http://api.openweathermap.org/data/2.5'))
+
+def main():
+  parser = argparse.ArgumentParser(description = 'Record and replay the feed sources of the sign.')
+  parser.add_argument('--port', default = 8080, type = int, help = 'Default: 8080')
+  parser.add_argument('--host', default = '127.0.0.1', help = 'Default: 127.0.0.1')
+  parser.add_argument('--directory', default = 'stub', help = 'Where the responses are stored. Default: stub')
+  parser.add_argument('--record', action = 'store_true', help = 'Fetch and store the URLs that were not recorded yet')
+  parser.add_argument('--latency', default = 0.0, type = float, help = 'Seconds before each answer. Default: 0')
+  parser.add_argument('--jitter', default = 0.0, type = float, help = 'Latency varies by up to +/- this many seconds. Default: 0')
+  parser.add_argument('--bandwidth', default = 0, type = int, help = 'Bytes per second, 0 for no limit. Default: 0')
+  parser.add_argument('--error-rate', default = 0.0, type = float, help = 'Fraction of requests that fail. Default: 0')
+  parser.add_argument('--error-code', default = 503, type = int, help = 'Status of a failed request. Default: 503')
+  parser.add_argument('--hang-rate', default = 0.0, type = float, help = 'Fraction of requests that never get an answer. Default: 0')
+  parser.add_argument('--hang-time', default = 600.0, type = float, help = 'Seconds a hung request is held open. Default: 600')
+  parser.add_argument('--seed', type = int, help = 'Seed for the errors and hangs, to repeat a run')
+  parser.add_argument('--urls', metavar = 'OPTIONS', help = 'Print the feed URLs of an options file as stub URLs and exit')
+  parser.add_argument('--verbose', action = 'store_true', help = 'Log each request')
+  args = parser.parse_args()
+
+  base = 'http://{}:{}'.format(args.host, args.port)
+  if args.urls:
+    printUrls(args.urls, base)
+    return 0
+
+  faults = Faults(args.latency, args.jitter, args.bandwidth, args.error_rate, args.error_code,
+                  args.hang_rate, args.hang_time, args.seed)
+  server = StubServer((args.host, args.port), Recordings(args.directory), faults, args.record)
+  server.verbose = args.verbose
+  print 'Stub server on {}, {} mode'.format(base, 'record' if args.record else 'replay')
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  print 'Requests: ' + server.report()
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main())
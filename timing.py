@@ -0,0 +1,135 @@
+# Frame timing for the scrolling sign.
+
+# The run loop used to sleep a flat 25ms after drawing and then wait again in
+# SwapOnVSync, so the frame period was draw time + 25ms + vsync wait and it
+# drifted with the CPU load of the fetch threads. FrameScheduler sleeps only
+# until the next frame deadline on a monotonic clock.
+
+import time
+
+#==============================================================================
+# monotonic clock in seconds. Python 2 does not have time.monotonic, so call
+# clock_gettime(CLOCK_MONOTONIC) from the C library. falls back to time.time
+# when that is not available.
+try:
+  from time import monotonic
+except ImportError:
+  import ctypes
+  import ctypes.util
+
+  CLOCK_MONOTONIC = 1
+
+  class timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+  try:
+    librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno = True)
+    clock_gettime = librt.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+  except (OSError, AttributeError, TypeError):
+    clock_gettime = None
+
+  if clock_gettime != None:
+    def monotonic():
+      t = timespec()
+      if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)) != 0:
+        return time.time()
+      return t.tv_sec + t.tv_nsec * 1e-9
+  else:
+    monotonic = time.time
+
+#==============================================================================
+# Keeps a steady frame rate. Call wait() once per frame, after drawing and
+# before SwapOnVSync. It sleeps until the deadline of the next frame.
+# When drawing overruns the deadline by one or more whole frames, those frames
+# are skipped instead of being drawn late, and the deadline moves forward.
+# wait() returns the number of frame periods that have passed, 1 when on time.
+class FrameScheduler(object):
+  def __init__(self, fps = 40.0, clock = monotonic, sleep = time.sleep):
+    self.period = 1.0 / fps
+    self.clock = clock
+    self.sleep = sleep
+    self.deadline = None
+    self.reset()
+
+  # clear the statistics
+  def reset(self):
+    self.frames = 0
+    self.overruns = 0       # frames where drawing ended after the deadline
+    self.missed = 0         # frames skipped because we were behind
+    self.jitterSum = 0.0    # wake up time - deadline
+    self.jitterMax = 0.0
+    self.started = self.clock()
+
+  def wait(self):
+    now = self.clock()
+    if self.deadline == None:
+      self.deadline = now + self.period
+      self.frames += 1
+      return 1
+
+    steps = 1
+    late = now - self.deadline
+    if late < 0:
+      self.sleep(-late)
+      now = self.clock()
+    else:
+      self.overruns += 1
+      if late >= self.period:
+        # skip the frames we are behind, draw the next one on time
+        skipped = int(late / self.period)
+        self.missed += skipped
+        self.deadline += skipped * self.period
+        steps += skipped
+
+    jitter = abs(now - self.deadline)
+    self.jitterSum += jitter
+    self.jitterMax = max(self.jitterMax, jitter)
+
+    self.deadline += self.period
+    self.frames += 1
+    return steps
+
+  # return a one line summary of the statistics
+  def report(self):
+    elapsed = self.clock() - self.started
+    fps = 0.0
+    jitter = 0.0
+    if elapsed > 0:
+      fps = self.frames / elapsed
+    if self.frames > 0:
+      jitter = 1000.0 * self.jitterSum / self.frames
+
+    return 'Frames: {}, {:.1f} fps, jitter mean {:.2f}ms max {:.2f}ms, overruns {}, missed {}'.format(
+      self.frames, fps, jitter, 1000.0 * self.jitterMax, self.overruns, self.missed)
+
+#==============================================================================
+# Scroll position of one line of text, derived from elapsed monotonic time and
+# a speed in pixels per second. Positions are kept in fixed point with 8 bits
+# of fraction, so slow speeds and low frame rates still scroll smoothly and the
+# speed does not depend on the frame rate.
+class Scroller(object):
+  FRACTION_BITS = 8
+
+  def __init__(self, speed = 40.0, clock = monotonic):
+    self.clock = clock
+    self.setSpeed(speed)
+    self.start(0)
+
+  # speed in pixels per second
+  def setSpeed(self, speed):
+    self.speed = int(round(speed * (1 << self.FRACTION_BITS)))
+
+  # start scrolling from pixel column x
+  def start(self, x, now = None):
+    if now == None:
+      now = self.clock()
+    self.origin = x << self.FRACTION_BITS
+    self.startTime = now
+
+  # return the pixel column of the left edge of the text at time now
+  def position(self, now = None):
+    if now == None:
+      now = self.clock()
+    moved = int((now - self.startTime) * self.speed)
+    return (self.origin - moved) >> self.FRACTION_BITS